@@ -0,0 +1,68 @@
+# Benchmark da normalização de texto: implementação original (uma passada por regra) x atual
+# (regras numa única passada) x lote em paralelo (normalize_texts).
+#
+# Uso (a partir da raiz do repositório):
+#   python docs/Testes/benchmark_normalizer.py [caminho/para/arquivo.pdf ...]
+# Sem argumentos, usa um texto sintético de ~5 MB no estilo das normas do Banco Central.
+
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from src.ingestion.normalizer import normalize_text, normalize_text_reference, normalize_texts
+
+SAMPLE_WORDS = (
+    "Art. 5º As instituições financeiras deverão manter registros das operações de crédito "
+    "(NR) art. 6 § 1º Parágrafo único. O disposto neste artigo aplica-se às cooperativas. "
+    "..... ---- ____ Informações adicionais – conforme “Resolução CMN” nº 4.595, de 2017."
+).split(" ")
+
+def synthetic_text(chars: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    words = []
+    size = 0
+    while size < chars:
+        word = rng.choice(SAMPLE_WORDS)
+        words.append(word)
+        size += len(word) + 1
+        if rng.random() < 0.02:
+            words.append("\n\n")
+    return " ".join(words)
+
+def load_texts(paths):
+    from src.ingestion.parser import extract_text_from_local_pdf
+    return [extract_text_from_local_pdf(p) or "" for p in paths]
+
+def measure(function, texts, repeat: int = 3) -> float:
+    """Melhor tempo (segundos) entre 'repeat' execuções."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(texts)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def main():
+    texts = load_texts(sys.argv[1:]) if len(sys.argv) > 1 else [synthetic_text(5_000_000, seed) for seed in range(4)]
+    total_chars = sum(len(t) for t in texts)
+
+    # A saída precisa ser idêntica à da implementação original
+    for text in texts:
+        assert normalize_text(text) == normalize_text_reference(text), "Saída divergente da implementação original."
+
+    results = {
+        "original (uma passada por regra)": measure(lambda ts: [normalize_text_reference(t) for t in ts], texts),
+        "atual (passada única)": measure(lambda ts: [normalize_text(t) for t in ts], texts),
+        "atual em lote (normalize_texts)": measure(normalize_texts, texts),
+    }
+
+    print(f"{len(texts)} documento(s), {total_chars / 1e6:.1f} M caracteres")
+    baseline = results["original (uma passada por regra)"]
+    for name, seconds in results.items():
+        print(f"{name:<36} {total_chars / seconds / 1e6:8.1f} M caracteres/s   ({baseline / seconds:.1f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Relatório recall x tamanho da redução de dimensionalidade (PCA ou truncamento) e do float16.
+#
+# Para cada configuração, mede o recall@10 dos vizinhos mais próximos em relação à busca exata com os
+# vetores originais (float32), o tamanho do vetor em memória e o tamanho enviado no upsert (JSON x gRPC).
+#
+# Uso (a partir da raiz do repositório):
+#   python docs/Testes/benchmark_projection.py                    # vetores da coleção no Qdrant (QDRANT_URL)
+#   python docs/Testes/benchmark_projection.py --vectors emb.npy  # vetores de um arquivo .npy
+#   python docs/Testes/benchmark_projection.py --synthetic        # vetores sintéticos (apenas para testar o script)
+
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from src.core.projection import Projection
+
+TOP_K = 10
+
+def synthetic_vectors(count: int = 5000, dim: int = 384, rank: int = 48, seed: int = 0) -> np.ndarray:
+    """Vetores com variância concentrada em poucas direções, como os embeddings de sentenças."""
+    rng = np.random.default_rng(seed)
+    basis = rng.normal(size=(rank, dim))
+    vectors = rng.normal(size=(count, rank)) * np.linspace(3, 0.3, rank) @ basis + rng.normal(scale=0.3, size=(count, dim))
+    return vectors.astype(np.float32)
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def top_k(queries: np.ndarray, corpus: np.ndarray, k: int = TOP_K) -> np.ndarray:
+    scores = normalize(queries) @ normalize(corpus).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+def recall(expected: np.ndarray, found: np.ndarray) -> float:
+    return float(np.mean([len(set(e) & set(f)) / len(e) for e, f in zip(expected, found)]))
+
+def json_bytes(vectors: np.ndarray) -> float:
+    """Tamanho médio de um vetor serializado como lista JSON (.tolist(), como no upsert via REST)."""
+    return float(np.mean([len(json.dumps(v.tolist())) for v in vectors[:200]]))
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", help="Arquivo .npy com os embeddings.")
+    parser.add_argument("--synthetic", action="store_true")
+    parser.add_argument("--limit", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--dims", default="256,192,128,96,64")
+    args = parser.parse_args()
+
+    if args.synthetic:
+        vectors = synthetic_vectors()
+    elif args.vectors:
+        vectors = np.load(args.vectors)[:args.limit].astype(np.float32)
+    else:
+        from src.core.projection import _load_collection_vectors
+        vectors = _load_collection_vectors(args.limit)
+
+    # As consultas são vetores separados do corpus (o PCA é ajustado apenas no corpus)
+    rng = np.random.default_rng(0)
+    order = rng.permutation(len(vectors))
+    queries, corpus = vectors[order[:args.queries]], vectors[order[args.queries:]]
+    expected = top_k(queries, corpus)
+    full_dim = vectors.shape[1]
+
+    rows = []
+    for dim in [full_dim] + [int(d) for d in args.dims.split(",") if int(d) < full_dim]:
+        methods = {"original": (lambda v: v)} if dim == full_dim else {}
+        if dim < full_dim:
+            projection = Projection.fit(corpus, dim)
+            methods[f"pca ({projection.explained_variance:.0%} var.)"] = projection.apply
+            # Truncamento simples: é o que o modo matryoshka faz (bom apenas em modelos treinados para isso)
+            methods["truncamento"] = lambda v, dim=dim: v[:, :dim]
+        for name, transform in methods.items():
+            reduced_corpus, reduced_queries = transform(corpus), transform(queries)
+            for dtype in (np.float32, np.float16):
+                found = top_k(reduced_queries.astype(dtype).astype(np.float32), reduced_corpus.astype(dtype).astype(np.float32))
+                rows.append((dim, name, np.dtype(dtype).name, recall(expected, found), dim * np.dtype(dtype).itemsize, json_bytes(reduced_corpus)))
+
+    baseline = full_dim * 4
+    print(f"{len(corpus)} vetores de {full_dim} dimensões, {len(queries)} consultas, recall@{TOP_K} em relação à busca exata (float32)\n")
+    print(f"{'dim':>4}  {'método':<22} {'tipo':<8} {'recall':>7} {'bytes/vetor':>12} {'redução':>8} {'JSON (REST)':>12} {'gRPC':>6}")
+    for dim, name, dtype, value, size, json_size in rows:
+        print(f"{dim:>4}  {name:<22} {dtype:<8} {value:>7.3f} {size:>12} {baseline / size:>7.1f}x {json_size:>12.0f} {dim * 4:>6}")
+
+if __name__ == "__main__":
+    main()
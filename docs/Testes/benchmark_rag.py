@@ -0,0 +1,381 @@
+# Benchmark de carga da API RAG: latência (p50/p95/p99), vazão (RPS) e tempo de cada etapa
+# (cabeçalho Server-Timing) de /query, /query/batch e da ingestão (/upload-pdf), sobre o corpus
+# sintético de synthetic_corpus.py. Os resultados são gravados em JSON para comparação entre commits.
+#
+# Uso (a partir da raiz do repositório):
+#   # Tudo local, sem GPU nem Qdrant: sobe o TGI simulado e a API (índice local, VECTOR_BACKEND=local),
+#   # indexa o corpus diretamente e roda as consultas
+#   python docs/Testes/benchmark_rag.py run --spawn --scenarios query,batch --out resultados/$(git rev-parse --short HEAD).json
+#
+#   # Contra uma API já em execução (com LLM_API_URL apontando para o TGI real ou para mock_tgi.py)
+#   python docs/Testes/benchmark_rag.py run --url http://localhost:8000 --scenarios ingest,query,batch --concurrency 16
+#
+#   # Compara dois resultados
+#   python docs/Testes/benchmark_rag.py compare resultados/base.json resultados/novo.json
+#
+# O cenário "ingest" usa /upload-pdf e exige o Qdrant (a ingestão pela API não suporta o índice local).
+
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import numpy as np
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_corpus import write_corpus
+
+PERCENTILES = (50, 95, 99)
+
+# --- Estatísticas ---
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    array = np.asarray(values)
+    summary = {f"p{p}": round(float(np.percentile(array, p)), 2) for p in PERCENTILES}
+    summary.update(mean=round(float(array.mean()), 2), max=round(float(array.max()), 2))
+    return summary
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """'query_embedding;dur=12.3, vector_search;dur=4.1' -> {'query_embedding': 12.3, ...} (ms, somando repetições)."""
+    stages: Dict[str, float] = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if name and params.startswith("dur="):
+            stages[name] = stages.get(name, 0.0) + float(params[len("dur="):])
+    return stages
+
+class ScenarioResult:
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: List[float] = []
+        self.stages: Dict[str, List[float]] = {}
+        self.status_codes: Dict[str, int] = {}
+        self.errors = 0
+        self.items = 0 # perguntas (no batch) ou PDFs (na ingestão) processados com sucesso
+        self.duration = 0.0
+
+    def record(self, latency_ms: float, status_code: int, server_timing: Optional[str] = None, items: int = 1):
+        self.latencies.append(latency_ms)
+        self.status_codes[str(status_code)] = self.status_codes.get(str(status_code), 0) + 1
+        if status_code >= 400:
+            self.errors += 1
+            return
+        self.items += items
+        for stage, duration in parse_server_timing(server_timing).items():
+            self.stages.setdefault(stage, []).append(duration)
+
+    def to_dict(self) -> Dict[str, object]:
+        return {
+            "requests": len(self.latencies),
+            "errors": self.errors,
+            "status_codes": self.status_codes,
+            "duration_s": round(self.duration, 3),
+            "rps": round(len(self.latencies) / self.duration, 2) if self.duration else 0.0,
+            "items_per_s": round(self.items / self.duration, 2) if self.duration else 0.0,
+            "latency_ms": summarize(self.latencies),
+            "stages_ms": {stage: summarize(values) for stage, values in sorted(self.stages.items())},
+        }
+
+# --- Geração de carga ---
+
+async def run_load(name: str, send, total: int, concurrency: int, rate: Optional[float] = None, seed: int = 0) -> ScenarioResult:
+    """
+    Executa 'total' chamadas de send(i). Sem 'rate', é uma carga fechada: 'concurrency' clientes enviam
+    uma requisição após a outra. Com 'rate' (requisições/s), as chegadas seguem um processo de Poisson,
+    independentemente das respostas (carga aberta), e a latência inclui a espera por um cliente livre.
+    """
+    result = ScenarioResult(name)
+    slots = asyncio.Semaphore(concurrency)
+    rng = random.Random(seed)
+
+    async def one(i: int, scheduled: float):
+        async with slots:
+            status_code, server_timing, items = await send(i)
+        result.record((time.perf_counter() - scheduled) * 1000, status_code, server_timing, items)
+
+    start = time.perf_counter()
+    if rate:
+        tasks = []
+        next_arrival = start
+        for i in range(total):
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+            tasks.append(asyncio.create_task(one(i, next_arrival)))
+            next_arrival += rng.expovariate(rate)
+        await asyncio.gather(*tasks)
+    else:
+        counter = iter(range(total))
+
+        async def worker():
+            for i in counter:
+                await one(i, time.perf_counter())
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+    result.duration = time.perf_counter() - start
+    return result
+
+async def _post(client: httpx.AsyncClient, path: str, **kwargs):
+    try:
+        response = await client.post(path, **kwargs)
+    except httpx.HTTPError:
+        return 599, None, 0 # falha de conexão/timeout
+    return response.status_code, response.headers.get("Server-Timing"), response
+
+async def login(client: httpx.AsyncClient, username: str, password: str) -> Dict[str, str]:
+    response = await client.post("/token", data={"username": username, "password": password})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}", "X-Server-Timing": "1"}
+
+async def scenario_query(client, headers, queries, args) -> ScenarioResult:
+    async def send(i):
+        status_code, timing, _ = await _post(client, "/query", json={"query": queries[i % len(queries)]}, headers=headers)
+        return status_code, timing, 1
+    return await run_load("query", send, args.requests, args.concurrency, args.rate, args.seed)
+
+async def scenario_batch(client, headers, queries, args) -> ScenarioResult:
+    async def send(i):
+        batch = [queries[(i * args.batch_size + j) % len(queries)] for j in range(args.batch_size)]
+        status_code, timing, _ = await _post(client, "/query/batch", json={"queries": batch, "generate": args.batch_generate}, headers=headers)
+        return status_code, timing, len(batch)
+    return await run_load("batch", send, max(1, args.requests // args.batch_size), args.concurrency, args.rate, args.seed)
+
+async def scenario_ingest(client, headers, pdfs, args) -> ScenarioResult:
+    async def send(i):
+        with open(pdfs[i], "rb") as f:
+            content = f.read()
+        status_code, timing, response = await _post(
+            client, "/upload-pdf",
+            files={"file": (os.path.basename(pdfs[i]), content, "application/pdf")},
+            data={"roles_csv": args.roles},
+            headers={"X-Server-Timing": "1"},
+        )
+        # A rota responde 200 mesmo quando o processamento do arquivo falha
+        if status_code == 200 and response.json().get("status") != "sucesso":
+            status_code = 500
+        return status_code, timing, 1
+    return await run_load("ingest", send, len(pdfs), args.ingest_concurrency, None, args.seed)
+
+SCENARIOS = {"ingest": scenario_ingest, "query": scenario_query, "batch": scenario_batch}
+
+# --- Indexação direta (índice local) e processos auxiliares ---
+
+def seed_index(pdfs: List[str], roles: List[str]) -> Dict[str, object]:
+    """Indexa o corpus sem a API (parse, normalização, chunking, embeddings e add_documents), medindo cada etapa."""
+    import uuid
+    from src.core.embedder import Embedder
+    from src.core.vectordb import create_vectordb
+    from src.ingestion.parser import extract_text_from_local_pdf
+    from src.ingestion.normalizer import normalize_text
+    from src.ingestion.qdrant_config import COLLECTION_NAME
+
+    stages = {"parse": 0.0, "normalize": 0.0, "chunk": 0.0, "embed": 0.0, "upsert": 0.0}
+    embedder = Embedder()
+    vectordb = create_vectordb(collection_name=COLLECTION_NAME, vector_size=embedder.dimension)
+    total_chunks = 0
+    start = time.perf_counter()
+    for path in pdfs:
+        t = time.perf_counter(); text = extract_text_from_local_pdf(path); stages["parse"] += time.perf_counter() - t
+        t = time.perf_counter(); text = normalize_text(text); stages["normalize"] += time.perf_counter() - t
+        t = time.perf_counter(); chunks = list(embedder.chunk_text(text)); stages["chunk"] += time.perf_counter() - t
+        t = time.perf_counter(); embeddings = embedder.embed(chunks); stages["embed"] += time.perf_counter() - t
+        source = f"/files/{os.path.basename(path)}"
+        t = time.perf_counter()
+        vectordb.add_documents([
+            {
+                "point_id": str(uuid.uuid4()),
+                "embedding": embedding.tolist(),
+                "chunk": chunk,
+                "source": source,
+                "display_name": os.path.basename(path),
+                "chunk_index": i + 1,
+                "last_updated": datetime.now().isoformat(timespec="milliseconds"),
+                "allowed_roles": roles,
+            }
+            for i, (chunk, embedding) in enumerate(zip(chunks, embeddings))
+        ])
+        stages["upsert"] += time.perf_counter() - t
+        total_chunks += len(chunks)
+    duration = time.perf_counter() - start
+    return {
+        "documents": len(pdfs),
+        "chunks": total_chunks,
+        "duration_s": round(duration, 3),
+        "documents_per_s": round(len(pdfs) / duration, 2),
+        "stages_ms": {stage: round(seconds * 1000, 1) for stage, seconds in stages.items()},
+    }
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _wait_http(url: str, timeout: float = 300):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} não respondeu em {timeout:.0f}s.")
+
+def spawn_services(args, env: Dict[str, str]) -> List[subprocess.Popen]:
+    """Sobe o TGI simulado e a API (uvicorn) em subprocessos; retorna os processos e ajusta args.url."""
+    tgi_port, api_port = _free_port(), _free_port()
+    mock_tgi = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_tgi.py")
+    processes = [subprocess.Popen([sys.executable, mock_tgi, "--port", str(tgi_port), "--token-latency", str(args.token_latency), "--tokens", str(args.tokens)])]
+    _wait_http(f"http://127.0.0.1:{tgi_port}/health")
+    env = {**env, "LLM_API_URL": f"http://127.0.0.1:{tgi_port}", "LLM_API_URLS": f"http://127.0.0.1:{tgi_port}"}
+    processes.append(subprocess.Popen([sys.executable, "-m", "uvicorn", "src.api.main:app", "--port", str(api_port), "--log-level", "warning"], cwd=ROOT, env=env))
+    args.url = f"http://127.0.0.1:{api_port}"
+    _wait_http(f"{args.url}/ready")
+    return processes
+
+def git_revision() -> Dict[str, object]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True).stdout.strip())
+        return {"commit": commit, "dirty": dirty}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+
+# --- Comandos ---
+
+async def run_scenarios(args, pdfs: List[str], queries: List[str]) -> Dict[str, object]:
+    results = {}
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+        headers = await login(client, args.user, args.password)
+        for name in args.scenarios:
+            data = pdfs if name == "ingest" else queries
+            result = await SCENARIOS[name](client, headers, data, args)
+            results[name] = result.to_dict()
+            print(f"[{name}] {results[name]['requests']} requisições, {results[name]['errors']} erros, "
+                  f"{results[name]['rps']} req/s, latência {results[name]['latency_ms']}")
+    return results
+
+def command_run(args):
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Cenários desconhecidos: {', '.join(sorted(unknown))}")
+
+    workdir = tempfile.mkdtemp(prefix="benchmark_rag_")
+    pdfs = write_corpus(os.path.join(workdir, "corpus"), args.documents, max(args.requests, 1), args.seed)
+    with open(os.path.join(workdir, "corpus", "queries.json"), encoding="utf-8") as f:
+        queries = json.load(f)
+
+    report = {
+        **git_revision(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k != "func"},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "scenarios": {},
+    }
+
+    processes = []
+    try:
+        if args.spawn:
+            env = {
+                **os.environ,
+                "VECTOR_BACKEND": os.getenv("VECTOR_BACKEND", "local"),
+                "LOCAL_INDEX_DIR": os.path.join(workdir, "index"),
+                "STORAGE_DIR": os.path.join(workdir, "storage"),
+                "SERVER_TIMING": "true",
+            }
+            if env["VECTOR_BACKEND"] == "local":
+                if "ingest" in args.scenarios:
+                    raise SystemExit("O cenário 'ingest' exige o Qdrant; com --spawn, use VECTOR_BACKEND=qdrant.")
+                # O índice é gravado antes de a API subir (o índice local é lido por um único processo)
+                os.environ.update({k: env[k] for k in ("VECTOR_BACKEND", "LOCAL_INDEX_DIR")})
+                report["scenarios"]["seed"] = seed_index(pdfs, args.roles.split(","))
+                print(f"[seed] {report['scenarios']['seed']}")
+            processes = spawn_services(args, env)
+        report["scenarios"].update(asyncio.run(run_scenarios(args, pdfs, queries)))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait(timeout=30)
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Resultados gravados em {args.out}.")
+    return report
+
+def command_compare(args):
+    """Tabela com a variação de latência e vazão de cada cenário entre dois resultados."""
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"base: {(base.get('commit') or '?')[:10]}  novo: {(new.get('commit') or '?')[:10]}\n")
+    print(f"{'cenário':<8} {'métrica':<20} {'base':>10} {'novo':>10} {'variação':>9}")
+    for name, scenario in new["scenarios"].items():
+        reference = base["scenarios"].get(name)
+        if not reference or "latency_ms" not in scenario:
+            continue
+        rows = [(f"{p} (ms)", reference["latency_ms"].get(p), scenario["latency_ms"].get(p)) for p in ("p50", "p95", "p99")]
+        rows.append(("req/s", reference["rps"], scenario["rps"]))
+        for metric, before, after in rows:
+            if before is None or after is None:
+                continue
+            change = f"{(after - before) / before:+.1%}" if before else "-"
+            print(f"{name:<8} {metric:<20} {before:>10.2f} {after:>10.2f} {change:>9}")
+        stages = sorted(set(reference.get("stages_ms", {})) | set(scenario.get("stages_ms", {})))
+        for stage in stages:
+            before = reference.get("stages_ms", {}).get(stage, {}).get("p50")
+            after = scenario.get("stages_ms", {}).get(stage, {}).get("p50")
+            if before is not None and after is not None:
+                change = f"{(after - before) / before:+.1%}" if before else "-"
+                print(f"{name:<8} {stage:<20} {before:>10.2f} {after:>10.2f} {change:>9}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de carga da API RAG.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Executa os cenários de carga.")
+    run_parser.add_argument("--url", default="http://localhost:8000")
+    run_parser.add_argument("--spawn", action="store_true", help="Sobe o TGI simulado e a API localmente.")
+    run_parser.add_argument("--scenarios", default="query,batch", help="Cenários (ingest, query, batch), na ordem de execução.")
+    run_parser.add_argument("--documents", type=int, default=50, help="PDFs do corpus sintético (e do cenário ingest).")
+    run_parser.add_argument("--requests", type=int, default=200, help="Perguntas por cenário de consulta.")
+    run_parser.add_argument("--concurrency", type=int, default=8, help="Requisições simultâneas (ou clientes, na carga fechada).")
+    run_parser.add_argument("--ingest-concurrency", type=int, default=4)
+    run_parser.add_argument("--rate", type=float, help="Carga aberta: requisições por segundo (chegadas de Poisson).")
+    run_parser.add_argument("--batch-size", type=int, default=10)
+    run_parser.add_argument("--batch-generate", action="store_true", help="Gera a resposta do LLM também no /query/batch.")
+    run_parser.add_argument("--roles", default="admin")
+    run_parser.add_argument("--user", default="admin")
+    run_parser.add_argument("--password", default="admin")
+    run_parser.add_argument("--timeout", type=float, default=120)
+    run_parser.add_argument("--token-latency", type=float, default=0.02, help="TGI simulado (--spawn): segundos por token.")
+    run_parser.add_argument("--tokens", type=int, default=64, help="TGI simulado (--spawn): tokens por resposta.")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--out", help="Arquivo JSON de resultados.")
+    run_parser.set_defaults(func=command_run)
+
+    compare_parser = commands.add_parser("compare", help="Compara dois arquivos de resultados.")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.set_defaults(func=command_compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
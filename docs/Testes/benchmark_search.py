@@ -0,0 +1,239 @@
+# Benchmark recall x latência da busca vetorial, para escolher os parâmetros de produção
+# (SEARCH_HNSW_EF, VECTOR_QUANTIZATION, SEARCH_QUANTIZATION_RESCORE/OVERSAMPLING, ver vectordb.py).
+#
+# O gabarito é a busca exata (força bruta com NumPy) sobre os vetores exportados da coleção. Para cada
+# quantização, os vetores (menos as consultas, separadas do corpus) são gravados numa coleção temporária
+# do Qdrant, e cada combinação de hnsw_ef / rescore / oversampling é medida: recall@k e latência por consulta.
+#
+# Uso (a partir da raiz do repositório):
+#   python docs/Testes/benchmark_search.py export --out vetores.npz          # vetores e cargos da coleção (QDRANT_URL)
+#   python docs/Testes/benchmark_search.py run --vectors vetores.npz --quantization none,scalar,binary --out busca.json --plot busca.png
+#   python docs/Testes/benchmark_search.py run --synthetic --backend local  # índice local (VECTOR_BACKEND=local), sem Qdrant
+#
+# Com --role, consultas e gabarito aplicam o filtro de segurança do cargo (como na API).
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from qdrant_client.models import (
+    VectorParams,
+    Distance,
+    PointStruct,
+    PayloadSchemaType,
+    OptimizersConfigDiff,
+    HnswConfigDiff,
+    CollectionStatus,
+    Filter,
+    FieldCondition,
+    MatchValue,
+)
+from src.core.vectordb import build_search_params, quantization_config, VECTOR_DATATYPE
+from benchmark_projection import synthetic_vectors, normalize
+
+BENCHMARK_COLLECTION = "benchmark_search"
+
+def export_collection(out: str, limit: int):
+    """Grava os vetores densos e os cargos (allowed_roles) da coleção num .npz."""
+    from src.ingestion.qdrant_config import COLLECTION_NAME, get_qdrant_client
+    client = get_qdrant_client()
+    vectors, roles = [], []
+    offset = None
+    while len(vectors) < limit:
+        records, offset = client.scroll(collection_name=COLLECTION_NAME, limit=min(1000, limit - len(vectors)), offset=offset, with_payload=["allowed_roles"], with_vectors=True)
+        for r in records:
+            # Pontos com vetor esparso guardam o denso sob o nome ""
+            vectors.append(r.vector[""] if isinstance(r.vector, dict) else r.vector)
+            roles.append(json.dumps(r.payload.get("allowed_roles") or []))
+        if offset is None:
+            break
+    np.savez(out, vectors=np.asarray(vectors, dtype=np.float32), roles=np.asarray(roles))
+    print(f"{len(vectors)} vetores exportados de '{COLLECTION_NAME}' para {out}.")
+
+def ground_truth(queries: np.ndarray, corpus: np.ndarray, k: int, mask: np.ndarray = None) -> np.ndarray:
+    """Índices dos k vizinhos mais próximos (cosseno) de cada consulta, por força bruta."""
+    scores = normalize(queries) @ normalize(corpus).T
+    if mask is not None:
+        scores[:, ~mask] = -np.inf
+    best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(best, np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1), axis=1)
+
+def recall_at_k(expected: np.ndarray, found: list) -> float:
+    return float(np.mean([len(set(e) & set(f)) / len(e) for e, f in zip(expected, found)]))
+
+def measure(search, queries: np.ndarray, expected: np.ndarray, warmup: int = 10) -> dict:
+    """Executa search(consulta) -> ids para cada consulta; retorna recall@k e latência (ms)."""
+    for query in queries[:warmup]:
+        search(query)
+    found, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        found.append(search(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {
+        "recall": round(recall_at_k(expected, found), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "qps": round(len(queries) / (sum(latencies) / 1000), 1),
+    }
+
+def search_settings(quantization: str, efs, oversamplings):
+    """Combinações (hnsw_ef, exact, rescore, oversampling) a medir para uma quantização."""
+    settings = [(None, True, None, None)]
+    for ef in efs:
+        if quantization == "none":
+            settings.append((ef, False, None, None))
+            continue
+        settings.append((ef, False, False, None))
+        settings.extend((ef, False, True, oversampling) for oversampling in oversamplings)
+    return settings
+
+def run_qdrant(corpus, roles, queries, expected, args) -> list:
+    from qdrant_client import QdrantClient
+    client = QdrantClient(url=os.getenv("QDRANT_URL", "http://localhost:6333"), prefer_grpc=True)
+    role_filter = Filter(must=[FieldCondition(key="allowed_roles", match=MatchValue(value=args.role))]) if args.role else None
+    rows = []
+    for quantization in args.quantization:
+        collection = f"{BENCHMARK_COLLECTION}_{quantization}"
+        client.recreate_collection(
+            collection_name=collection,
+            vectors_config=VectorParams(size=corpus.shape[1], distance=Distance.COSINE, datatype=VECTOR_DATATYPE),
+            quantization_config=quantization_config(quantization),
+            hnsw_config=HnswConfigDiff(m=args.m, ef_construct=args.ef_construct),
+            # O HNSW é construído uma vez, depois da carga (ver _finish_version em reindex.py)
+            optimizers_config=OptimizersConfigDiff(indexing_threshold=0),
+        )
+        client.create_payload_index(collection_name=collection, field_name="allowed_roles", field_schema=PayloadSchemaType.KEYWORD, wait=True)
+        for start in range(0, len(corpus), 1000):
+            client.upsert(collection_name=collection, wait=True, points=[
+                PointStruct(id=i, vector=corpus[i].tolist(), payload={"allowed_roles": roles[i]})
+                for i in range(start, min(start + 1000, len(corpus)))
+            ])
+        # indexing_threshold=1 (KB): o HNSW é construído mesmo em coleções pequenas
+        client.update_collection(collection_name=collection, optimizers_config=OptimizersConfigDiff(indexing_threshold=1))
+        while client.get_collection(collection_name=collection).status != CollectionStatus.GREEN:
+            time.sleep(1)
+
+        for hnsw_ef, exact, rescore, oversampling in search_settings(quantization, args.ef, args.oversampling):
+            params = build_search_params(hnsw_ef, exact, rescore, oversampling)
+            search = lambda q: [h.id for h in client.search(collection_name=collection, query_vector=q.tolist(), query_filter=role_filter, search_params=params, limit=args.k, with_payload=False)]
+            row = {"backend": "qdrant", "quantization": quantization, "hnsw_ef": hnsw_ef, "exact": exact, "rescore": rescore, "oversampling": oversampling}
+            row.update(measure(search, queries, expected))
+            rows.append(row)
+            print(row)
+        if not args.keep:
+            client.delete_collection(collection_name=collection)
+    return rows
+
+def run_local(corpus, roles, queries, expected, args) -> list:
+    """Mesma medição sobre o índice local (HNSW do hnswlib a partir de LOCAL_HNSW_MIN_POINTS=0)."""
+    import src.core.local_index as local_index
+    local_index.LOCAL_HNSW_MIN_POINTS = 0
+    local_index.LOCAL_HNSW_FULL_SCAN_THRESHOLD = 0
+    index = local_index.LocalIndex(tempfile.mkdtemp(prefix="benchmark_search_"), corpus.shape[1])
+    index.upsert([PointStruct(id=i, vector=corpus[i].tolist(), payload={"allowed_roles": roles[i]}) for i in range(len(corpus))])
+    role_filter = Filter(must=[FieldCondition(key="allowed_roles", match=MatchValue(value=args.role))]) if args.role else None
+    rows = []
+    for hnsw_ef, exact, _, _ in search_settings("none", args.ef if index.hnsw is not None else [], []):
+        params = build_search_params(hnsw_ef, exact)
+        search = lambda q: [h.id for h in index.search(q, args.k, role_filter, params)]
+        row = {"backend": "local", "quantization": "none", "hnsw_ef": hnsw_ef, "exact": exact, "rescore": None, "oversampling": None}
+        row.update(measure(search, queries, expected))
+        rows.append(row)
+        print(row)
+    return rows
+
+def plot(rows: list, path: str):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("matplotlib não instalado; gráfico não gerado (os resultados estão no JSON).")
+        return
+    series = {}
+    for row in rows:
+        if row["exact"]:
+            continue
+        label = f"{row['backend']} {row['quantization']}" + (f" rescore={row['rescore']} x{row['oversampling'] or 1:g}" if row["rescore"] is not None else "")
+        series.setdefault(label, []).append(row)
+    figure, axes = plt.subplots(figsize=(8, 5))
+    for label, points in series.items():
+        axes.plot([p["p50_ms"] for p in points], [p["recall"] for p in points], marker="o", label=label)
+        for p in points:
+            axes.annotate(f"ef={p['hnsw_ef']}", (p["p50_ms"], p["recall"]), fontsize=7)
+    for row in rows:
+        if row["exact"]:
+            axes.scatter([row["p50_ms"]], [row["recall"]], marker="x", color="black")
+    axes.set_xlabel("latência p50 (ms)")
+    axes.set_ylabel("recall@k")
+    axes.legend(fontsize=7)
+    axes.grid(alpha=0.3)
+    figure.savefig(path, dpi=120, bbox_inches="tight")
+    print(f"Gráfico gravado em {path}.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark recall x latência da busca vetorial.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Exporta os vetores e cargos da coleção.")
+    export_parser.add_argument("--out", required=True)
+    export_parser.add_argument("--limit", type=int, default=200000)
+
+    run_parser = commands.add_parser("run", help="Mede recall@k e latência para cada configuração.")
+    run_parser.add_argument("--vectors", help="Arquivo .npz (export) ou .npy com os vetores.")
+    run_parser.add_argument("--synthetic", action="store_true")
+    run_parser.add_argument("--backend", choices=["qdrant", "local"], default="qdrant")
+    run_parser.add_argument("--queries", type=int, default=300)
+    run_parser.add_argument("--k", type=int, default=10)
+    run_parser.add_argument("--role", help="Aplica o filtro de segurança do cargo.")
+    run_parser.add_argument("--ef", default="16,32,64,128,256")
+    run_parser.add_argument("--quantization", default="none,scalar", help="Quantizações da coleção (none, scalar, binary).")
+    run_parser.add_argument("--oversampling", default="1,2,4", help="Oversampling com rescore (coleções quantizadas).")
+    run_parser.add_argument("--m", type=int, default=16)
+    run_parser.add_argument("--ef-construct", type=int, default=100)
+    run_parser.add_argument("--keep", action="store_true", help="Mantém as coleções temporárias no Qdrant.")
+    run_parser.add_argument("--out", help="Arquivo JSON de resultados.")
+    run_parser.add_argument("--plot", help="Gráfico recall x latência (PNG, requer matplotlib).")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        export_collection(args.out, args.limit)
+        return
+
+    args.ef = [int(ef) for ef in args.ef.split(",")]
+    args.quantization = args.quantization.split(",")
+    args.oversampling = [float(o) for o in args.oversampling.split(",")]
+
+    if args.synthetic:
+        vectors = synthetic_vectors(count=20000)
+        roles = [["admin", "analista"] if i % 4 == 0 else ["admin"] for i in range(len(vectors))]
+    else:
+        data = np.load(args.vectors)
+        vectors = (data["vectors"] if isinstance(data, np.lib.npyio.NpzFile) else data).astype(np.float32)
+        roles = [json.loads(r) for r in data["roles"]] if isinstance(data, np.lib.npyio.NpzFile) and "roles" in data else [["admin"]] * len(vectors)
+
+    # As consultas são vetores separados do corpus (como perguntas novas), escolhidos com semente fixa
+    order = np.random.default_rng(0).permutation(len(vectors))
+    queries, corpus = vectors[order[:args.queries]], vectors[order[args.queries:]]
+    corpus_roles = [roles[i] for i in order[args.queries:]]
+    mask = np.array([args.role in r for r in corpus_roles]) if args.role else None
+    expected = ground_truth(queries, corpus, args.k, mask)
+
+    runner = run_local if args.backend == "local" else run_qdrant
+    rows = runner(corpus, corpus_roles, queries, expected, args)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"k": args.k, "corpus": len(corpus), "queries": len(queries), "role": args.role, "results": rows}, f, indent=2)
+        print(f"Resultados gravados em {args.out}.")
+    if args.plot:
+        plot(rows, args.plot)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Servidor que simula o TGI (Text Generation Inference) para benchmarks e testes sem GPU.
+#
+# Implementa /generate, /generate_stream (SSE), /health e /info com o mesmo formato do TGI. A latência
+# é configurável: um tempo de prefill (fixo + proporcional ao tamanho do prompt) e um tempo por token
+# gerado; --max-batch limita as gerações simultâneas, como o tamanho máximo do lote do TGI.
+#
+# Uso (a partir da raiz do repositório):
+#   python docs/Testes/mock_tgi.py --port 8081 --token-latency 0.02
+#   LLM_API_URL=http://localhost:8081 uvicorn src.api.main:app
+#
+# Também pode ser iniciado pelo benchmark_rag.py (opção --spawn).
+
+import json
+import random
+import asyncio
+import argparse
+from typing import Optional
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+ANSWER_WORDS = (
+    "De acordo com a resolução, as instituições financeiras devem manter controles internos "
+    "compatíveis com a natureza e a complexidade de suas operações, observado o prazo previsto [FONTE]."
+).split()
+
+class MockTGI:
+    def __init__(self, token_latency: float = 0.02, prefill_latency: float = 0.05, prefill_per_1k_chars: float = 0.005,
+                 tokens: int = 64, max_batch: int = 0, error_rate: float = 0.0, seed: int = 0):
+        self.token_latency = token_latency
+        self.prefill_latency = prefill_latency
+        self.prefill_per_1k_chars = prefill_per_1k_chars
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.slots = asyncio.Semaphore(max_batch) if max_batch > 0 else None
+        self.requests = 0
+
+    def _token_count(self, parameters: dict) -> int:
+        return max(1, min(self.tokens, int(parameters.get("max_new_tokens") or self.tokens)))
+
+    def _words(self, count: int):
+        return [ANSWER_WORDS[i % len(ANSWER_WORDS)] for i in range(count)]
+
+    def _details(self, count: int) -> dict:
+        return {"finish_reason": "length", "generated_tokens": count, "seed": None}
+
+    async def _prefill(self, prompt: str):
+        await asyncio.sleep(self.prefill_latency + self.prefill_per_1k_chars * len(prompt) / 1000)
+
+    def _fails(self) -> bool:
+        self.requests += 1
+        return self.error_rate > 0 and self.rng.random() < self.error_rate
+
+    async def generate(self, body: dict) -> Optional[dict]:
+        if self._fails():
+            return None
+        count = self._token_count(body.get("parameters") or {})
+        await self._acquire()
+        try:
+            await self._prefill(body.get("inputs", ""))
+            await asyncio.sleep(self.token_latency * count)
+        finally:
+            self._release()
+        return {"generated_text": " ".join(self._words(count)), "details": self._details(count)}
+
+    async def generate_stream(self, body: dict):
+        count = self._token_count(body.get("parameters") or {})
+        await self._acquire()
+        try:
+            await self._prefill(body.get("inputs", ""))
+            words = self._words(count)
+            for i, word in enumerate(words):
+                await asyncio.sleep(self.token_latency)
+                last = i == len(words) - 1
+                event = {
+                    "token": {"id": i, "text": (" " if i else "") + word, "logprob": 0.0, "special": False},
+                    "generated_text": " ".join(words) if last else None,
+                    "details": self._details(count) if last else None,
+                }
+                yield f"data:{json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            self._release()
+
+    async def _acquire(self):
+        if self.slots is not None:
+            await self.slots.acquire()
+
+    def _release(self):
+        if self.slots is not None:
+            self.slots.release()
+
+def create_app(tgi: MockTGI) -> FastAPI:
+    app = FastAPI(title="Mock TGI")
+
+    @app.get("/health")
+    async def health():
+        return JSONResponse(None)
+
+    @app.get("/info")
+    async def info():
+        return {"model_id": "mock-tgi", "max_batch_total_tokens": None, "version": "mock"}
+
+    @app.post("/generate")
+    async def generate(request: Request):
+        data = await tgi.generate(await request.json())
+        if data is None:
+            return JSONResponse({"error": "Erro simulado", "error_type": "generation"}, status_code=500)
+        return data
+
+    @app.post("/generate_stream")
+    async def generate_stream(request: Request):
+        body = await request.json()
+        if tgi._fails():
+            return JSONResponse({"error": "Erro simulado", "error_type": "generation"}, status_code=500)
+        return StreamingResponse(tgi.generate_stream(body), media_type="text/event-stream")
+
+    return app
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor que simula o TGI.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--token-latency", type=float, default=0.02, help="Segundos por token gerado.")
+    parser.add_argument("--prefill-latency", type=float, default=0.05, help="Segundos fixos antes do primeiro token.")
+    parser.add_argument("--prefill-per-1k-chars", type=float, default=0.005, help="Segundos de prefill por 1000 caracteres do prompt.")
+    parser.add_argument("--tokens", type=int, default=64, help="Tokens gerados por resposta (limitado por max_new_tokens).")
+    parser.add_argument("--max-batch", type=int, default=0, help="Gerações simultâneas (0 = sem limite).")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fração das requisições que respondem 500.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import uvicorn
+    tgi = MockTGI(args.token_latency, args.prefill_latency, args.prefill_per_1k_chars, args.tokens, args.max_batch, args.error_rate, args.seed)
+    uvicorn.run(create_app(tgi), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# Corpus sintético no estilo das normas do Banco Central (resoluções com artigos, parágrafos, incisos
+# e alíneas) e consultas sobre ele, para benchmarks reprodutíveis: a mesma semente gera sempre os mesmos
+# documentos, PDFs e consultas.
+#
+# Uso (a partir da raiz do repositório):
+#   python docs/Testes/synthetic_corpus.py --out /tmp/corpus --documents 50 --seed 0
+# Gera /tmp/corpus/*.pdf e /tmp/corpus/queries.json.
+
+import os
+import json
+import random
+import argparse
+from typing import Dict, List
+
+TOPICS = {
+    "crédito": ["operações de crédito", "provisão para perdas esperadas", "classificação de risco do tomador", "garantias reais e fidejussórias"],
+    "câmbio": ["operações de câmbio", "contratos de câmbio", "remessas ao exterior", "registro no Sistema de Informações do Banco Central"],
+    "lavagem de dinheiro": ["prevenção à lavagem de dinheiro", "comunicação de operações suspeitas ao Coaf", "identificação de clientes", "pessoas expostas politicamente"],
+    "segurança cibernética": ["política de segurança cibernética", "contratação de serviços de computação em nuvem", "registro de incidentes relevantes", "plano de continuidade de negócios"],
+    "capital": ["requerimento mínimo de Patrimônio de Referência", "Adicional de Conservação de Capital", "ativos ponderados pelo risco", "Índice de Basileia"],
+    "ouvidoria": ["componente organizacional de ouvidoria", "atendimento às demandas dos clientes", "relatório semestral da ouvidoria", "prazo de resposta às reclamações"],
+    "pagamentos": ["arranjos de pagamento", "instituições de pagamento", "Pix", "liquidação das transações"],
+}
+SUBJECTS = ["As instituições financeiras", "As instituições autorizadas a funcionar pelo Banco Central do Brasil", "As cooperativas de crédito", "Os bancos múltiplos", "As sociedades de crédito direto"]
+VERBS = ["devem manter", "devem implementar", "estão obrigadas a divulgar", "devem submeter à aprovação do conselho de administração", "devem revisar anualmente"]
+QUALIFIERS = ["compatível com a natureza e a complexidade de suas operações", "na forma estabelecida pelo Banco Central do Brasil", "observados os critérios de proporcionalidade", "com periodicidade mínima anual", "no prazo de trinta dias"]
+ROMANS = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII"]
+
+def _sentence(rng: random.Random, subject: str) -> str:
+    return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {subject} {rng.choice(QUALIFIERS)}."
+
+def generate_document(rng: random.Random, number: int) -> Dict[str, object]:
+    """Uma resolução sintética: título, texto (artigos com parágrafos, incisos e alíneas) e os assuntos tratados."""
+    topic = rng.choice(list(TOPICS))
+    year = rng.randint(2015, 2025)
+    title = f"RESOLUÇÃO CMN Nº {number:,}".replace(",", ".") + f", DE {rng.randint(1, 28)} DE {rng.choice(['JANEIRO', 'MARÇO', 'JUNHO', 'SETEMBRO', 'DEZEMBRO'])} DE {year}"
+    lines = [title, f"Dispõe sobre {TOPICS[topic][0]} e dá outras providências.", ""]
+    for article in range(1, rng.randint(8, 20) + 1):
+        subject = rng.choice(TOPICS[topic])
+        lines.append(f"Art. {article}{'º' if article < 10 else ''} {_sentence(rng, subject)}")
+        for roman in ROMANS[:rng.randint(0, 4)]:
+            lines.append(f"{roman} - {rng.choice(TOPICS[topic])}, {rng.choice(QUALIFIERS)};")
+            for letter in "abc"[:rng.randint(0, 2)]:
+                lines.append(f"{letter}) {rng.choice(TOPICS[topic])};")
+        for paragraph in range(1, rng.randint(0, 3) + 1):
+            lines.append(f"§ {paragraph}º {_sentence(rng, rng.choice(TOPICS[topic]))}")
+        if rng.random() < 0.2:
+            lines.append(f"Parágrafo único. O disposto neste artigo aplica-se à Resolução CMN nº {rng.randint(3000, 5200)}, de {rng.randint(2000, year)}.")
+    lines.append(f"Art. {article + 1}. Esta Resolução entra em vigor na data de sua publicação.")
+    return {"number": number, "title": title, "topic": topic, "text": "\n".join(lines)}
+
+def generate_corpus(documents: int = 50, seed: int = 0) -> List[Dict[str, object]]:
+    rng = random.Random(seed)
+    numbers = rng.sample(range(4000, 5400), documents)
+    return [generate_document(rng, number) for number in numbers]
+
+def generate_queries(corpus: List[Dict[str, object]], count: int = 200, seed: int = 0) -> List[str]:
+    """Perguntas sobre os assuntos e as resoluções do corpus (algumas citam o número da resolução)."""
+    rng = random.Random(seed + 1)
+    templates = [
+        "Quais são as exigências sobre {subject}?",
+        "O que a Resolução CMN nº {number} estabelece sobre {subject}?",
+        "Qual o prazo para {subject} segundo a resolução {number}?",
+        "Como as cooperativas de crédito devem tratar {subject}?",
+    ]
+    queries = []
+    for _ in range(count):
+        document = rng.choice(corpus)
+        subject = rng.choice(TOPICS[document["topic"]])
+        queries.append(rng.choice(templates).format(subject=subject, number=f"{document['number']:,}".replace(",", ".")))
+    return queries
+
+def _wrap(text: str, width: int = 95) -> List[str]:
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + len(word) + 1 > width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.append(line)
+    return lines
+
+def _escape(line: str) -> bytes:
+    return line.encode("cp1252", errors="replace").replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+def text_to_pdf(text: str, lines_per_page: int = 50) -> bytes:
+    """PDF mínimo (Helvetica, WinAnsiEncoding, uma linha de texto por linha do documento), legível pelo pypdf."""
+    lines = _wrap(text)
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    font_id = 3 + 2 * len(pages)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [" + b" ".join(b"%d 0 R" % (3 + 2 * i) for i in range(len(pages))) + b"] /Count %d >>" % len(pages),
+    ]
+    for i, page in enumerate(pages):
+        content = b"BT /F1 10 Tf 14 TL 50 790 Td " + b" ".join(b"(" + _escape(line) + b") Tj T*" for line in page) + b" ET"
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents %d 0 R /Resources << /Font << /F1 %d 0 R >> >> >>" % (4 + 2 * i, font_id))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+
+    output = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return output
+
+def write_corpus(out_dir: str, documents: int = 50, queries: int = 200, seed: int = 0) -> List[str]:
+    """Grava os PDFs e o queries.json em out_dir; retorna os caminhos dos PDFs."""
+    os.makedirs(out_dir, exist_ok=True)
+    corpus = generate_corpus(documents, seed)
+    paths = []
+    for document in corpus:
+        path = os.path.join(out_dir, f"resolucao_{document['number']}.pdf")
+        with open(path, "wb") as f:
+            f.write(text_to_pdf(document["text"]))
+        paths.append(path)
+    with open(os.path.join(out_dir, "queries.json"), "w", encoding="utf-8") as f:
+        json.dump(generate_queries(corpus, queries, seed), f, ensure_ascii=False, indent=2)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um corpus sintético de resoluções em PDF e consultas sobre ele.")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = write_corpus(args.out, args.documents, args.queries, args.seed)
+    print(f"{len(paths)} PDFs e {args.queries} consultas gravados em {args.out}.")
+
+if __name__ == "__main__":
+    main()
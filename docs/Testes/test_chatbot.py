@@ -1 +1,59 @@
-# Responsável por testar a funcionalidade do módulo do chatbot
\ No newline at end of file
+# Responsável por testar a funcionalidade do módulo do chatbot
+
+from src.core.generator import StreamTrimmer, clean_response
+from src.core.replicas import ReplicaPool, LLM_CIRCUIT_FAILURES
+from src.core.profiling import SamplingProfiler
+
+def test_stream_trimmer_matches_clean_response():
+    # A limpeza incremental (streaming) deve produzir o mesmo texto da limpeza da resposta completa
+    raw = (
+        "  Você é um assistente de IA imparcial e analítico, especializado em regulamentações financeiras brasileiras.\n"
+        "A resposta é X [FONTE].\n\n \n\nMais texto. --- CONCLUSAO --- texto descartado"
+    )
+
+    for token_size in (1, 3, 7, 50):
+        trimmer = StreamTrimmer()
+        streamed = ""
+        for i in range(0, len(raw), token_size):
+            streamed += trimmer.feed(raw[i:i + token_size])
+        streamed += trimmer.finish()
+
+        assert streamed == clean_response(raw), f"Streaming com tokens de {token_size} caracteres divergiu."
+
+def test_replica_pool_routes_around_open_circuit():
+    # Escolhe a réplica com menos requisições pendentes e ignora a que está com o circuito aberto
+    pool = ReplicaPool(["http://tgi-a", "http://tgi-b"])
+    a, b = pool.replicas
+    a.outstanding = 3
+    assert pool.pick() is b
+
+    for _ in range(LLM_CIRCUIT_FAILURES):
+        pool.record_failure(b)
+    assert pool.pick() is a
+    assert pool.pick(exclude=[a]) is b  # sem alternativa, ainda tenta a réplica com falha
+
+    pool.record_success(b, 0.1)
+    a.outstanding = 0
+    b.outstanding = 1
+    assert pool.pick() is a
+
+def _busy_loop(seconds):
+    import time
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        sum(range(1000))
+
+def test_sampling_profiler_records_busy_function(tmp_path):
+    # A função que ocupa a CPU durante a sessão deve aparecer nas pilhas gravadas; o ID do perfil é
+    # gerado no servidor, não o X-Request-ID enviado pelo cliente
+    profiler = SamplingProfiler(interval_ms=1, output_dir=str(tmp_path))
+    session = profiler.start("explicit", "/query", request_id="req-1")
+    _busy_loop(0.2)
+    summary = profiler.stop(session)
+
+    assert summary["id"] != "req-1" and summary["request_id"] == "req-1"
+    assert any(item["function"].startswith("_busy_loop ") for item in summary["top_total"])
+    assert "_busy_loop (" in profiler.load(summary["id"], "folded")
+    assert profiler.load("../" + summary["id"]) is None
+    assert [p["id"] for p in profiler.list()] == [summary["id"]]
+
@@ -2,6 +2,18 @@
 
 from qdrant_client import QdrantClient
 from qdrant_client.http import models
+import re
+import random
+import numpy as np
+from src.ingestion.storage import ContentStore
+from src.ingestion.normalizer import normalize_text, normalize_text_reference, normalize_texts
+from src.core.chunker import TokenChunker
+from src.core.projection import Projection
+from src.core.local_index import LocalVectorDB
+from src.core.vectordb import build_search_params
+from src.ingestion.dedup import simhash, simhash_bands, hamming, DEDUP_MAX_HAMMING
+from src.ingestion.reindex import switch_alias, current_collection, list_versions, version_name
+from src.ingestion import documents
 
 def test_qdrant_vector_insertion():
     # Conecta ao Qdrant local (Docker deve estar rodando)
@@ -30,3 +42,182 @@ def test_qdrant_vector_insertion():
     # Valida se o vetor foi salvo corretamente
     assert len(result) == 1, "O vetor deve ser recuperado com sucesso."
     assert result[0].payload["source"] == "unit_test", "O payload deve corresponder ao inserido."
+
+def test_content_store_deduplicates_and_keeps_referenced_blobs(tmp_path):
+    store = ContentStore(str(tmp_path))
+
+    # O mesmo conteúdo, vindo de duas origens, é gravado uma única vez (nome = SHA-256)
+    blob_a, created_a = store.put_bytes(b"%PDF-1.4 conteudo", source="http://exemplo/a")
+    blob_b, created_b = store.put_bytes(b"%PDF-1.4 conteudo", source="http://exemplo/b")
+    assert blob_a == blob_b and created_a and not created_b
+    assert [f for f in tmp_path.iterdir() if not f.name.startswith(".")] == [tmp_path / blob_a]
+
+    # O blob só é removido quando a última origem deixa de referenciá-lo
+    assert store.unlink("http://exemplo/a") is None
+    assert (tmp_path / blob_a).exists()
+    assert store.unlink("http://exemplo/b") == blob_a
+    assert not (tmp_path / blob_a).exists()
+
+class WhitespaceTokenizer:
+    """Tokenizer de teste (um token por palavra), com a mesma interface do tokenizer do modelo."""
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False):
+        if return_offsets_mapping:
+            return {"offset_mapping": [m.span() for m in re.finditer(r"\S+", texts)]}
+        return {"input_ids": [t.split() for t in texts]}
+
+def test_token_chunker_respects_window_and_article_boundaries():
+    chunker = TokenChunker(WhitespaceTokenizer(), max_tokens=20, overlap_tokens=4, min_tokens=3)
+    text = (
+        "art. 1o esta norma regula as operacoes de credito. o disposto no art. 2 se aplica a todos. "
+        "art. 2o as instituicoes devem manter registros por cinco anos. os registros ficam disponiveis ao banco central. "
+        + "palavra " * 30
+    )
+    chunks = chunker.chunk(text)
+
+    # Nenhum chunk ultrapassa a janela e a contagem de tokens corresponde ao texto
+    assert all(c.token_count <= 20 and c.token_count == len(c.text.split()) for c in chunks)
+    # "art. 2" no meio de uma sentença não é tratado como início de artigo; "art. 2o" inicia um novo chunk
+    assert chunks[0].text.startswith("art. 1o") and "o disposto no art. 2 se aplica" in chunks[0].text
+    assert chunks[1].text.startswith("art. 2o")
+    # Sentenças longas são divididas por tokens, com sobreposição entre as janelas
+    long_pieces = [c for c in chunks if c.text.startswith("palavra")]
+    assert len(long_pieces) == 2 and sum(c.token_count for c in long_pieces) == 30 + 4
+    # "§" chega ao chunker como "SS" (normalize_text aplica o unidecode depois do lower)
+    paragraphs = chunker.chunk(normalize_text("Art. 3º O prazo é de trinta dias úteis. § 1º O prazo pode ser prorrogado uma vez."))
+    assert [c.text.split()[0] for c in paragraphs] == ["art.", "SS"]
+
+def test_normalizer_matches_reference_implementation():
+    # A normalização em passada única deve produzir exatamente a mesma saída da aplicação sequencial das regras
+    cases = [
+        "  Art. 5º O BANCO — conforme “Resolução” nº 4.595 .....  fim  ",
+        '(NR) art. 6 "(NR) art.  "(nr)x (nr)-----art. (nr)art..... ____ - - -',
+        "\u00a0Informações\n\n\tadicionais ẞ … \x1c",
+    ]
+    atoms = [".", " ", "-", "_", "\n", "(nr)", "art.", '"', "a", "É", "\xa0", "…"]
+    rng = random.Random(42)
+    cases += ["".join(rng.choice(atoms) for _ in range(rng.randint(0, 20))) for _ in range(5000)]
+
+    for text in cases:
+        assert normalize_text(text) == normalize_text_reference(text), repr(text)
+    assert normalize_texts(cases[:3]) == [normalize_text_reference(t) for t in cases[:3]]
+
+def test_simhash_detects_near_duplicate_chunks():
+    rng = random.Random(7)
+    words = "banco central resolucao instituicao credito prazo taxa juros cliente conta pagamento norma".split()
+    text = " ".join(rng.choice(words) for _ in range(200))
+    edited = text.replace("taxa", "juros", 1) + " vigencia imediata"
+    other = " ".join(rng.choice(words) for _ in range(200))
+
+    # Uma pequena edição mantém a assinatura próxima; um texto diferente, não
+    assert hamming(simhash(text), simhash(edited)) <= DEDUP_MAX_HAMMING
+    assert hamming(simhash(text), simhash(other)) > DEDUP_MAX_HAMMING
+    # Dentro da distância máxima, ao menos uma faixa é idêntica (é por ela que o candidato é encontrado no Qdrant)
+    assert set(simhash_bands(simhash(text))) & set(simhash_bands(simhash(edited)))
+
+def test_reindex_switches_alias_between_versions():
+    # Qdrant em memória: as versões são coleções <alias>_v<N> e o alias aponta para uma delas
+    client = QdrantClient(":memory:")
+    alias = "test_reindex"
+    for version in (1, 2):
+        for name in (version_name(alias, version), f"{version_name(alias, version)}_docs"):
+            client.create_collection(name, vectors_config=models.VectorParams(size=4, distance=models.Distance.COSINE))
+    client.upsert(version_name(alias, 2), points=[models.PointStruct(id=1, vector=[0.1] * 4, payload={"source": "v2"})])
+
+    switch_alias(client, version_name(alias, 1), alias)
+    assert current_collection(client, alias) == "test_reindex_v1"
+    assert client.count(alias).count == 0
+
+    # A troca substitui os dois aliases (chunks e documentos) de uma vez
+    switch_alias(client, version_name(alias, 2), alias)
+    assert current_collection(client, alias) == "test_reindex_v2"
+    assert current_collection(client, f"{alias}_docs") == "test_reindex_v2_docs"
+    assert client.count(alias).count == 1
+    assert list_versions(client, alias) == [1, 2]
+
+def test_deleted_chunk_passes_to_duplicates_without_widening_roles(monkeypatch):
+    # O chunk de um documento removido passa para as cópias (duplicate_sources) apenas com os cargos de cada uma
+    client = QdrantClient(":memory:")
+    monkeypatch.setattr(documents, "COLLECTION_NAME", "test_docs")
+    for name in ("test_docs", "test_docs_docs"):
+        client.create_collection(name, vectors_config=models.VectorParams(size=4, distance=models.Distance.COSINE))
+
+    def origin(source, roles):
+        return {"source": source, "display_name": source, "file_in_storage": f"{source}.pdf", "last_updated": "2025-01-01T00:00:00", "chunk_index": 1, "allowed_roles": roles}
+
+    client.upsert("test_docs", points=[models.PointStruct(id=1, vector=[0.1, 0.2, 0.3, 0.4], payload={
+        "chunk": "aviso legal", **origin("A", ["admin", "analista"]),
+        "duplicate_sources": [origin("B", ["admin"]), origin("C", ["analista"]), origin("D", ["admin"])],
+    })])
+    monkeypatch.setattr(documents, "get_content_store", lambda: None)
+    result = documents.delete_document(client, "A", remove_file=False)
+
+    assert result["chunks_reatribuidos"] == 1
+    chunks = {p.payload["source"]: p.payload for p in client.scroll("test_docs")[0]}
+    assert {s: (c["allowed_roles"], [d["source"] for d in c["duplicate_sources"]]) for s, c in chunks.items()} == {
+        "B": (["admin"], ["D"]),
+        "C": (["analista"], []),
+    }
+    assert {p.payload["source"]: p.payload["allowed_roles"] for p in client.scroll("test_docs_docs")[0]} == {"B": ["admin"], "C": ["analista"]}
+
+def test_pca_projection_reduces_dimension_and_keeps_neighbours(tmp_path):
+    # Vetores com a variância concentrada em 16 direções: o PCA para 16 dimensões preserva os vizinhos
+    rng = np.random.default_rng(0)
+    vectors = (rng.normal(size=(500, 16)) @ rng.normal(size=(16, 64))).astype(np.float32)
+    projection = Projection.fit(vectors, 16)
+    projection.save(tmp_path / "pca.npz")
+    loaded = Projection.load(tmp_path / "pca.npz")
+
+    reduced = loaded.apply(vectors)
+    assert reduced.shape == (500, 16) and loaded.explained_variance > 0.99
+    assert np.allclose(np.linalg.norm(reduced, axis=1), 1.0, atol=1e-5)
+
+    def neighbours(v):
+        v = v / np.linalg.norm(v, axis=1, keepdims=True)
+        return np.argsort(-(v[:20] @ v.T), axis=1)[:, 1:6]
+    expected, found = neighbours(vectors), neighbours(reduced.astype(np.float16).astype(np.float32))
+    assert np.mean([len(set(e) & set(f)) / 5 for e, f in zip(expected, found)]) > 0.9
+
+def test_local_vectordb_applies_role_filter_and_persists(tmp_path):
+    # Índice local (VECTOR_BACKEND=local): mesmos filtros de segurança do Qdrant, gravado em disco
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(40, 16)).astype(np.float32)
+    db = LocalVectorDB(collection_name="test_local", vector_size=16, path=str(tmp_path))
+    db.add_documents([
+        {
+            "point_id": i,
+            "embedding": vectors[i].tolist(),
+            "chunk": f"chunk {i}",
+            "source": f"doc-{i // 10}",
+            "chunk_index": i % 10 + 1,
+            "last_updated": "2025-01-01T00:00:00",
+            "allowed_roles": ["admin", "analista"] if i < 20 else ["admin"],
+        }
+        for i in range(40)
+    ])
+
+    security_filter = models.Filter(must=[models.FieldCondition(key="allowed_roles", match=models.MatchValue(value="analista"))])
+    results = db.search(vectors[30].tolist(), top_k=5, query_filter=security_filter)
+    assert len(results) == 5 and all(r["id"] < 20 for r in results), "O cargo só deve ver os chunks permitidos."
+    assert db.search(vectors[30].tolist(), top_k=1)[0]["id"] == 30, "Sem filtro, o próprio vetor deve ser o mais similar."
+    exact = db.search(vectors[30].tolist(), top_k=5, query_filter=security_filter, search_params=build_search_params(exact=True))
+    assert [r["id"] for r in exact] == [r["id"] for r in results]
+
+    neighbours = db.get_chunks_by_metadata_batch([("doc-0", 2), ("doc-3", 2)], user_role="analista")
+    assert [(n["source"], n["chunk_index"]) for n in neighbours] == [("doc-0", 2)]
+    # Pontos repetidos de uma chave (documento ingerido duas vezes) não podem esconder os vizinhos das outras
+    db.add_documents([{"point_id": 100 + i, "embedding": vectors[1].tolist(), "chunk": "chunk 1", "source": "doc-0", "chunk_index": 2, "allowed_roles": ["analista"]} for i in range(3)])
+    db.add_documents([{"point_id": 200, "embedding": vectors[2].tolist(), "chunk": "novo", "source": "doc-9", "chunk_index": 1, "allowed_roles": ["analista"]}])
+    neighbours = db.get_chunks_by_metadata_batch([("doc-0", 2), ("doc-9", 1)], user_role="analista")
+    assert sorted((n["source"], n["chunk_index"]) for n in neighbours) == [("doc-0", 2), ("doc-9", 1)]
+    # Chunk quase duplicado (não gravado de novo): o vizinho é resolvido pelo duplicate_sources do original
+    db.add_documents([{
+        "point_id": 300, "embedding": (-vectors[30]).tolist(), "chunk": "compartilhado", "source": "doc-5", "chunk_index": 1, "allowed_roles": ["analista"],
+        "duplicate_sources": [{"source": "doc-9", "chunk_index": 2, "display_name": "doc-9", "file_in_storage": "doc-9.pdf", "allowed_roles": ["analista"]}],
+    }])
+    neighbours = db.get_chunks_by_metadata_batch([("doc-9", 2)], user_role="analista")
+    assert [(n["source"], n["chunk_index"], n["chunk"]) for n in neighbours] == [("doc-9", 2, "compartilhado")]
+
+    reopened = LocalVectorDB(collection_name="test_local", vector_size=16, path=str(tmp_path))
+    assert reopened.count() == 45
+    assert [r["id"] for r in reopened.search(vectors[30].tolist(), top_k=5, query_filter=security_filter)] == [r["id"] for r in results]
@@ -16,3 +16,13 @@ def test_embedding_generation_consistency():
     # Testa se as duas execuções produzem resultados muito semelhantes
     similarity = np.dot(emb1, emb2) / (np.linalg.norm(emb1) * np.linalg.norm(emb2))
     assert similarity > 0.99, "Embeddings do mesmo texto devem ser praticamente idênticos."
+
+def test_sparse_encoder_keeps_regulatory_identifiers():
+    from src.core.sparse import sparse_encoder
+
+    # Identificadores como "4.893" devem casar com a grafia sem pontuação ("4893")
+    doc_vector = sparse_encoder.encode_documents(["resolucao 4.893 do bcb, art. 12"])[0]
+    query_vector = sparse_encoder.encode_query("resolucao 4893")
+
+    assert len(doc_vector.indices) == len(doc_vector.values), "Índices e pesos devem ter o mesmo tamanho."
+    assert set(query_vector.indices) <= set(doc_vector.indices), "Todos os termos da consulta devem estar no documento."
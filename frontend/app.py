@@ -1,4 +1,5 @@
 import os
+import json
 import requests
 import streamlit as st
 import pytz
@@ -9,6 +10,8 @@ from datetime import datetime
 # =========================================
 BACKEND_API = os.getenv("BACKEND_API", "http://rag-api:8000")
 PUBLIC_API_URL = os.getenv("PUBLIC_API_URL", "http://localhost:8000")
+# Prazo (segundos) enviado à API no cabeçalho X-Request-Timeout das consultas
+QUERY_TIMEOUT = os.getenv("QUERY_TIMEOUT", "120")
 
 def format_date(iso_timestamp):
     """Converte timestamp para uma data amigável do Brasil."""
@@ -24,6 +27,20 @@ def format_date(iso_timestamp):
         return iso_timestamp
 
 
+def iter_sse_events(response):
+    """Lê uma resposta Server-Sent Events (requests com stream=True) e produz pares (evento, dados)."""
+    event, data_lines = "message", []
+    for line in response.iter_lines(decode_unicode=True):
+        if line == "":
+            if data_lines:
+                yield event, json.loads("\n".join(data_lines))
+            event, data_lines = "message", []
+        elif line.startswith("event:"):
+            event = line[len("event:"):].strip()
+        elif line.startswith("data:"):
+            data_lines.append(line[len("data:"):].strip())
+
+
 # =========================================
 # ESTADO GLOBAL
 # =========================================
@@ -124,9 +141,9 @@ if menu == "Upload de Material":
 
     # ---------------------- PDF ----------------------
     with tab1:
-        st.subheader("Enviar um PDF")
+        st.subheader("Enviar PDFs")
 
-        pdf_file = st.file_uploader("Escolha um arquivo PDF", type=["pdf"])
+        pdf_files = st.file_uploader("Escolha um ou mais arquivos PDF", type=["pdf"], accept_multiple_files=True)
         cargos_pdf = st.multiselect(
             "Quem pode acessar este documento?",
             ["admin", "gerente", "analista", "aluno"],
@@ -134,12 +151,13 @@ if menu == "Upload de Material":
         )
 
         if st.button("Enviar PDF"):
-            if pdf_file is None:
+            if not pdf_files:
                 st.error("Selecione um arquivo.")
             else:
-                files = {"file": pdf_file}
+                # Todos os arquivos vão numa única requisição e são processados em paralelo pela API
+                files = [("files", (f.name, f, "application/pdf")) for f in pdf_files]
                 data = {"roles_csv": ",".join(cargos_pdf)}
-                with st.spinner("Enviando PDF..."):
+                with st.spinner("Enviando PDFs..."):
                     response = requests.post(
                         f"{BACKEND_API}/upload-pdf",
                         files=files,
@@ -219,15 +237,35 @@ if menu == "Chat / Perguntas":
             payload = {"query": question}
 
             with st.spinner("Buscando informações..."):
+                # Consome o /query/stream (Server-Sent Events): os chunks chegam primeiro e a
+                # resposta é exibida token a token, à medida que o LLM a gera.
                 response = requests.post(
-                    f"{BACKEND_API}/query",
+                    f"{BACKEND_API}/query/stream",
                     json=payload,
-                    headers={"Authorization": f"Bearer {st.session_state.token}"}
+                    headers={"Authorization": f"Bearer {st.session_state.token}", "X-Request-Timeout": QUERY_TIMEOUT},
+                    stream=True,
                 )
-                data = response.json()
+                if response.status_code != 200:
+                    st.error(response.json().get("detail", "Erro ao consultar a base."))
+                    st.stop()
+
+                data = {"answer": "", "chunks": []}
 
                 st.subheader("🧠 Resposta do sistema")
-                st.write(data.get("answer", "Sem resposta."))
+                answer_placeholder = st.empty()
+
+                for event, event_data in iter_sse_events(response):
+                    if event == "chunks":
+                        data["chunks"] = event_data
+                    elif event == "token":
+                        data["answer"] += event_data["text"]
+                        answer_placeholder.markdown(data["answer"] + "▌")
+                    elif event == "done":
+                        data["answer"] = event_data["answer"]
+                    elif event == "error":
+                        st.error(event_data.get("detail", "Erro na geração da resposta."))
+
+                answer_placeholder.write(data["answer"] or "Sem resposta.")
 
                 with st.expander("🔍 Ver chunks usados na resposta"):
                     # Explicação simples do que são chunks (AGORA dentro do dropdown)
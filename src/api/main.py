@@ -1,28 +1,124 @@
 import os
-import shutil
+import json
+import hashlib
 import uuid
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form, APIRouter, Depends, status
+import asyncio
+import math
+import time
+import signal
+import anyio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, APIRouter, Depends, Request, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from starlette.concurrency import run_in_threadpool
-from ..ingestion.process_pdf_url import process_pdf, process_url, process_batch_urls
-from ..chatbot.retriever import retrieve_relevant_chunks
-from ..ingestion.qdrant_config import get_qdrant_client, COLLECTION_NAME
-from ..core.embedder import Embedder
-from ..core.vectordb import VectorDB
+from ..ingestion.process_pdf_url import process_pdf, process_url, process_batch_urls, get_ingestion_client
+from ..chatbot.retriever import retrieve_relevant_chunks, retrieve_relevant_chunks_batch
+from ..ingestion.qdrant_config import COLLECTION_NAME
+from ..ingestion.storage import STORAGE_DIR, ContentStaticFiles, get_content_store
+from ..ingestion.documents import delete_document, document_point_ids, remove_previous_version, discard_new_version
+from ..ingestion.scraper import url_to_local_pdf
+from ..core.embedder import Embedder, get_shared_embedder
+from ..core.vectordb import VectorDB, create_vectordb, VECTOR_BACKEND
 from ..core.generator import generator
-from ..core.auth import Token, create_access_token, get_current_active_user, User, fake_users_db, verify_password, get_user, ACCESS_TOKEN_EXPIRE_MINUTES
+from ..core.scheduler import scheduler, SchedulerOverloaded, LLM_MAX_CONCURRENT, LLM_MAX_QUEUE
+from ..core.deadline import Deadline, DeadlineExceeded, DEADLINE_HEADER
+from ..core.log import get_logger, log_payload, request_id_var
+from ..core.metrics import registry, start_request_timings, reset_request_timings, server_timing_header, HTTP_REQUEST_SECONDS, PROMPT_CHARS, ERRORS, PROFILES
+from ..core.profiling import profiler, profile_requested, PROFILE_HEADER
+from ..core.auth import Token, create_access_token, get_current_active_user, get_current_admin_user, is_admin_token, User, fake_users_db, verify_password, get_user, ACCESS_TOKEN_EXPIRE_MINUTES
 from typing import Optional
-from datetime import timedelta
+from datetime import datetime, timedelta
 
-qdrant_client = get_qdrant_client()
+logger = get_logger(__name__)
 
-app = FastAPI(title="Bank of America PDF Upload API")
+# Estado da inicialização da API (exposto em /ready), com a duração de cada fase em segundos
+startup_state = {"ready": False, "error": None, "phases": {}, "attempts": {}, "total_seconds": None}
 
-# Monta a pasta de arquivos para serem acessíveis via URL
-app.mount("/files", StaticFiles(directory="/app/storage"), name="files")
+# Uma fase que falha (ex: Qdrant ainda fora do ar) é repetida até STARTUP_MAX_ATTEMPTS vezes, com espera
+# exponencial a partir de STARTUP_RETRY_BACKOFF segundos (limitada a STARTUP_RETRY_MAX_BACKOFF). Se ainda
+# assim falhar, o processo é encerrado (STARTUP_EXIT_ON_FAILURE) para que o gunicorn ou o Docker o reiniciem,
+# em vez de continuar de pé respondendo 503
+STARTUP_MAX_ATTEMPTS = int(os.getenv("STARTUP_MAX_ATTEMPTS", "5"))
+STARTUP_RETRY_BACKOFF = float(os.getenv("STARTUP_RETRY_BACKOFF", "5"))
+STARTUP_RETRY_MAX_BACKOFF = float(os.getenv("STARTUP_RETRY_MAX_BACKOFF", "60"))
+STARTUP_EXIT_ON_FAILURE = os.getenv("STARTUP_EXIT_ON_FAILURE", "true").lower() == "true"
+
+async def _startup_phase(name: str, init):
+    start = time.perf_counter()
+    try:
+        for attempt in range(1, STARTUP_MAX_ATTEMPTS + 1):
+            startup_state["attempts"][name] = attempt
+            try:
+                await init()
+                break
+            except Exception as e:
+                if attempt == STARTUP_MAX_ATTEMPTS:
+                    logger.error("[STARTUP ERROR] Falha na fase '%s' após %s tentativas: %s", name, attempt, e)
+                    raise
+                delay = min(STARTUP_RETRY_BACKOFF * 2 ** (attempt - 1), STARTUP_RETRY_MAX_BACKOFF)
+                logger.warning("[STARTUP] Falha na fase '%s' (tentativa %s/%s): %s. Nova tentativa em %.0fs.", name, attempt, STARTUP_MAX_ATTEMPTS, e, delay)
+                await asyncio.sleep(delay)
+    finally:
+        startup_state["phases"][name] = round(time.perf_counter() - start, 3)
+    logger.info("[STARTUP] Fase '%s' concluída em %.2fs.", name, startup_state["phases"][name])
+
+async def _init_embedder():
+    # Carrega o modelo (se ainda não foi pré-carregado) e faz um encode de aquecimento
+    global app_embedder
+    embedder = await run_in_threadpool(get_shared_embedder)
+    await run_in_threadpool(embedder.warmup)
+    app_embedder = embedder
+
+async def _init_vectordb():
+    # Conexão com o Qdrant (ou abertura do índice local, ver VECTOR_BACKEND) e criação/verificação das coleções e índices
+    global app_vectordb
+    app_vectordb = await run_in_threadpool(create_vectordb, collection_name=COLLECTION_NAME)
+    # Cliente usado pela ingestão (antes conectado no import de process_pdf_url); o índice local não tem ingestão pela API
+    if VECTOR_BACKEND != "local":
+        await run_in_threadpool(get_ingestion_client)
+
+async def _init_generator():
+    # Pool de conexões HTTP compartilhado com o TGI (keep-alive entre as requisições)
+    await generator.start()
+
+async def _initialize():
+    """Inicializa os recursos da API em paralelo e marca a API como pronta (/ready) ao final."""
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        _startup_phase("embedder", _init_embedder),
+        _startup_phase("vectordb", _init_vectordb),
+        _startup_phase("generator", _init_generator),
+        return_exceptions=True,
+    )
+    startup_state["total_seconds"] = round(time.perf_counter() - start, 3)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        startup_state["error"] = str(errors[0])
+        if STARTUP_EXIT_ON_FAILURE:
+            logger.error("[STARTUP ERROR] Inicialização falhou; encerrando o processo para que seja reiniciado.")
+            os.kill(os.getpid(), signal.SIGTERM)
+        return
+    startup_state["ready"] = True
+    logger.info("[STARTUP] API pronta em %.2fs (fases: %s).", startup_state["total_seconds"], startup_state["phases"])
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    A inicialização roda em background: a porta abre imediatamente, /live responde enquanto
+    os recursos são carregados e /ready só responde 200 quando a API pode receber tráfego.
+    """
+    init_task = asyncio.create_task(_initialize())
+    yield
+    init_task.cancel()
+    await generator.aclose()
+
+app = FastAPI(title="Bank of America PDF Upload API", lifespan=lifespan)
+
+# Monta a pasta de arquivos para serem acessíveis via URL (blobs imutáveis, com cache e ETag)
+app.mount("/files", ContentStaticFiles(directory=STORAGE_DIR), name="files")
 
 app.add_middleware(
     CORSMiddleware,
@@ -32,30 +128,182 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app_embedder = Embedder()
+app_embedder: Embedder = None
 app_vectordb: VectorDB = None
 
-STORAGE_DIR = "/app/storage"
-os.makedirs(STORAGE_DIR, exist_ok=True)
+# Limite de perguntas aceitas por requisição em /query/batch
+MAX_BATCH_QUERIES = int(os.getenv("MAX_BATCH_QUERIES", "500"))
+# Máximo de chunks por pergunta (top_k) em /query/batch
+MAX_BATCH_TOP_K = int(os.getenv("MAX_BATCH_TOP_K", "50"))
 
-router = APIRouter()
+# Intervalo (segundos) entre as verificações de desconexão do cliente durante uma consulta
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
 
-# Essencial para não dar problema de conexão na inicialização do qdrant
-@app.on_event("startup")
-async def startup_event():
-    global app_vectordb
-    
-    # A conexão e criação/verificação da coleção só ocorrem AQUI
-    # O Uvicorn espera isso terminar antes de abrir a porta 8000
-    print("[STARTUP] Inicializando conexão com VectorDB...")
+# Cabeçalho Server-Timing com os tempos de cada etapa: sempre (SERVER_TIMING=true)
+# ou apenas quando o cliente envia o cabeçalho X-Server-Timing
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+SERVER_TIMING_REQUEST_HEADER = "X-Server-Timing"
+
+# Cabeçalho com o ID da requisição (aceito do cliente/proxy ou gerado), incluído em todos os logs
+REQUEST_ID_HEADER = "X-Request-ID"
+
+# Upload de PDFs: tamanho máximo por arquivo, arquivos por requisição, tamanho dos blocos
+# gravados em disco e quantos arquivos são processados (extração/embedding/upsert) em paralelo
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "50")) * 1024 * 1024
+MAX_UPLOAD_FILES = int(os.getenv("MAX_UPLOAD_FILES", "20"))
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+UPLOAD_PARALLELISM = int(os.getenv("UPLOAD_PARALLELISM", "4"))
+PDF_MAGIC = b"%PDF-"
+
+# Limita quantos PDFs são processados ao mesmo tempo (entre todas as requisições do worker)
+_upload_semaphore = asyncio.Semaphore(UPLOAD_PARALLELISM)
+
+def configure_worker_limits(workers: int):
+    """
+    Divide entre os workers do gunicorn (chamado em cada um, após o fork) os limites configurados para
+    a instância: gerações simultâneas e fila do LLM (LLM_MAX_CONCURRENT, LLM_MAX_QUEUE) e PDFs
+    processados em paralelo (UPLOAD_PARALLELISM). Cada worker fica com pelo menos 1.
+    """
+    global _upload_semaphore
+    def share(total: int) -> int:
+        return max(1, math.ceil(total / workers))
+
+    scheduler.resize(share(LLM_MAX_CONCURRENT), share(LLM_MAX_QUEUE))
+    _upload_semaphore = asyncio.Semaphore(share(UPLOAD_PARALLELISM))
+
+def require_ready():
+    """Dependência das rotas que usam o modelo/Qdrant: responde 503 enquanto a API inicializa."""
+    if not startup_state["ready"]:
+        raise HTTPException(status_code=503, detail="API em inicialização. Tente novamente em instantes.", headers={"Retry-After": "5"})
+
+router = APIRouter(dependencies=[Depends(require_ready)])
+
+def _upload_too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload excede o limite de {MAX_UPLOAD_FILES} arquivos de {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+
+class UploadSizeLimitMiddleware:
+    """
+    Limita o corpo das requisições de upload (/upload-pdf e PUT /documents) a MAX_UPLOAD_FILES
+    arquivos de MAX_UPLOAD_BYTES. Recusa (413) pelo Content-Length antes de ler o corpo e, como o
+    cabeçalho pode faltar (Transfer-Encoding: chunked) ou mentir, também conta os bytes recebidos:
+    ao passar do limite, a leitura é interrompida com 413 e o multipart não é gravado até o fim.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._is_upload(scope):
+            return await self.app(scope, receive, send)
+
+        limit = MAX_UPLOAD_BYTES * MAX_UPLOAD_FILES
+        headers = dict(scope["headers"])
+        try:
+            content_length = int(headers.get(b"content-length", b"0"))
+        except ValueError:
+            content_length = 0
+        if content_length > limit:
+            error = _upload_too_large()
+            response = JSONResponse(status_code=error.status_code, content={"detail": error.detail})
+            return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Lançada durante a leitura do formulário: o FastAPI a repassa e responde 413
+                    raise _upload_too_large()
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    @staticmethod
+    def _is_upload(scope) -> bool:
+        path = scope["path"]
+        return path == "/upload-pdf" or (scope["method"] == "PUT" and path.startswith("/documents/"))
+
+# Registrado antes dos middlewares "http" (BaseHTTPMiddleware), que ficam por fora: a leitura do
+# corpo chega direto a limited_receive e o 413 não é embrulhado num ExceptionGroup pelo call_next
+app.add_middleware(UploadSizeLimitMiddleware)
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """
+    Registra a latência de cada requisição (por rota e status) e, se solicitado,
+    devolve os tempos das etapas da requisição no cabeçalho Server-Timing.
+    """
+    timings_token = None
+    if SERVER_TIMING or request.headers.get(SERVER_TIMING_REQUEST_HEADER):
+        timings_token = start_request_timings()
+    start = time.perf_counter()
+    status_code = 500
     try:
-        app_vectordb = VectorDB(collection_name=COLLECTION_NAME)
-        print("[STARTUP] Conexão com VectorDB estabelecida e coleção verificada.")
-    except Exception as e:
-        # Se falhar aqui, o Uvicorn NÃO VAI subir. O erro será explícito.
-        print(f"[STARTUP ERROR] Falha ao conectar ao Qdrant: {e}")
+        response = await call_next(request)
+        status_code = response.status_code
+        if timings_token is not None:
+            total = f"total;dur={(time.perf_counter() - start) * 1000:.1f}"
+            response.headers["Server-Timing"] = ", ".join(filter(None, [server_timing_header(), total]))
+        return response
+    finally:
+        route = getattr(request.scope.get("route"), "path", "other")
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route, status=str(status_code))
+        if timings_token is not None:
+            reset_request_timings(timings_token)
+
+@app.middleware("http")
+async def profiling_middleware(request: Request, call_next):
+    """
+    Executa a requisição sob o profiler por amostragem quando um administrador envia o cabeçalho
+    X-Profile: 1 (ou ?profile=1), ou quando ela é sorteada (PROFILE_SAMPLE_RATE). O perfil é gravado
+    com um ID gerado no servidor (ver /profiles), devolvido no cabeçalho X-Profile-Id.
+    """
+    if profile_requested(request.headers.get(PROFILE_HEADER)) or profile_requested(request.query_params.get("profile")):
+        if not is_admin_token(request.headers.get("authorization")):
+            return JSONResponse(status_code=403, content={"detail": "Profiling restrito a administradores."})
+        trigger = "explicit"
+    elif profiler.should_sample():
+        trigger = "sampled"
+    else:
+        return await call_next(request)
+
+    PROFILES.inc(trigger=trigger)
+    session = profiler.start(trigger, request.url.path, request_id_var.get() or "")
+    try:
+        response = await call_next(request)
+    except BaseException:
+        await run_in_threadpool(profiler.stop, session)
         raise
 
+    # O corpo pode ser um stream (ex: /query/stream): o perfil só é encerrado ao fim do envio
+    body_iterator = response.body_iterator
+
+    async def profiled_body():
+        try:
+            async for chunk in body_iterator:
+                yield chunk
+        finally:
+            await run_in_threadpool(profiler.stop, session)
+
+    response.body_iterator = profiled_body()
+    response.headers["X-Profile-Id"] = session.profile_id
+    return response
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    """Associa um ID à requisição (usado nos logs) e o devolve no cabeçalho X-Request-ID."""
+    request_id = (request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex)[:64]
+    token = request_id_var.set(request_id)
+    try:
+        response = await call_next(request)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+    finally:
+        request_id_var.reset(token)
+
 class URLPayload(BaseModel):
     url: str
     allowed_roles: list[str] = ["admin"]
@@ -66,6 +314,17 @@ class BatchURLPayload(BaseModel):
 
 class QueryRequest(BaseModel):
     query: str
+    updated_after: Optional[datetime] = None # Apenas documentos atualizados a partir desta data
+    updated_before: Optional[datetime] = None # Apenas documentos atualizados até esta data
+    recency_half_life_days: Optional[float] = Field(None, gt=0) # Se informado, favorece documentos mais recentes
+
+class BatchQueryRequest(BaseModel):
+    queries: list[str]
+    top_k: int = Field(5, ge=1, le=MAX_BATCH_TOP_K)
+    generate: bool = False # Se True, também gera a resposta do LLM para cada pergunta
+    updated_after: Optional[datetime] = None
+    updated_before: Optional[datetime] = None
+    recency_half_life_days: Optional[float] = Field(None, gt=0)
 
 class ChunkResponse(BaseModel):
     id: str | int
@@ -82,6 +341,33 @@ def read_root():
     """
     return {"message": "API rodando. Use http://127.0.0.1:8000/docs#/ para acessar o Swagger."}
 
+@app.get("/live")
+def liveness():
+    """
+    Liveness probe: o processo está de pé (mesmo durante a inicialização).
+    Responde 503 apenas se a inicialização falhou, para que o orquestrador reinicie o container.
+    """
+    if startup_state["error"]:
+        raise HTTPException(status_code=503, detail=f"Falha na inicialização: {startup_state['error']}")
+    return {"status": "alive"}
+
+@app.get("/ready")
+def readiness():
+    """
+    Readiness probe: 200 quando o modelo, o Qdrant e o cliente do LLM estão prontos; 503 enquanto isso.
+    Inclui a duração de cada fase da inicialização.
+    """
+    body = {
+        "status": "ready" if startup_state["ready"] else "starting",
+        "phases_seconds": startup_state["phases"],
+        "phase_attempts": startup_state["attempts"],
+        "total_seconds": startup_state["total_seconds"],
+        "error": startup_state["error"],
+    }
+    if not startup_state["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
 @app.get("/ingest/test")
 def test_qdrant_connection():
     """
@@ -89,7 +375,7 @@ def test_qdrant_connection():
     quantos documentos existem na coleção.
     """
     try:
-        count_result = qdrant_client.count(collection_name=COLLECTION_NAME, exact=True)
+        count_result = get_ingestion_client().count(collection_name=COLLECTION_NAME, exact=True)
         
         return {
             "status": "sucesso",
@@ -106,48 +392,154 @@ def test_qdrant_connection():
             "saude": "ERRO"
         }
 
-@app.post("/upload-pdf")
-async def upload_pdf(file: UploadFile = File(...), roles_csv: str = Form(default="admin", description="Cargos separados por vírgula (ex: admin, gerente)")):
+@app.get("/metrics")
+def metrics():
     """
-    Endpoint de envio de PDF únicos, de forma que o conteúdo seja extraído, normalizado,
-    separado em chunkings, convertido em embeddings e, por fim, salvo no banco Qdrant.
+    Métricas no formato texto do Prometheus: latência por etapa das consultas e da ingestão,
+    tamanho do prompt, tokens gerados, fila do LLM, reaproveitamentos (cache) e erros.
     """
-    if not file.filename.endswith(".pdf"):
-        return {"error": "Apenas arquivos PDF são aceitos."}
-    
-    file_name = file.filename
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
-    # Cria um nome único com UUID para salvar no disco, garantindo a exclusividade
-    file_extension = file_name.split('.')[-1]
-    unique_file_name_on_disk = f"{uuid.uuid4()}.{file_extension}"
+@app.get("/llm/pool")
+def llm_pool_stats():
+    """
+    Estatísticas do pool de conexões com o LLM (TGI), para acompanhar a saturação sob carga.
+    """
+    return generator.pool_stats()
 
-    file_path = os.path.join(STORAGE_DIR, unique_file_name_on_disk)
-    
-    allowed_roles = [role.strip() for role in roles_csv.split(",")]
-    
+@app.get("/llm/scheduler")
+def llm_scheduler_stats():
+    """
+    Métricas da fila de geração do LLM: profundidade da fila, tempo de espera,
+    requisições coalescidas (mesmo prompt) e requisições descartadas por sobrecarga.
+    """
+    return scheduler.stats()
+
+@app.get("/profiles")
+def list_profiles(limit: int = 50, current_user: User = Depends(get_current_admin_user)):
+    """Perfis gravados pelo profiler (mais recentes primeiro): ID da requisição, rota, duração e amostras."""
+    return profiler.list(limit)
+
+@app.get("/profiles/{profile_id}")
+def get_profile(profile_id: str, format: str = "json", current_user: User = Depends(get_current_admin_user)):
+    """
+    Perfil de uma requisição: resumo em JSON (funções com mais amostras) ou, com format=folded,
+    as pilhas no formato 'folded' para gerar o flamegraph (flamegraph.pl, speedscope, inferno).
+    """
+    if format not in ("json", "folded"):
+        raise HTTPException(status_code=400, detail="Formato inválido: use 'json' ou 'folded'.")
+    content = profiler.load(profile_id, format)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Perfil não encontrado.")
+    if format == "folded":
+        return PlainTextResponse(content)
+    return JSONResponse(json.loads(content))
+
+class UploadRejected(Exception):
+    """Arquivo recusado na validação do upload (não é PDF ou excede o tamanho máximo)."""
+
+async def _save_upload(file: UploadFile, file_path: str) -> str:
+    """
+    Grava o upload em disco em blocos, com I/O assíncrono (sem bloquear o event loop),
+    calculando o SHA-256 do conteúdo durante a gravação. Valida a assinatura %PDF- no
+    primeiro bloco e interrompe a gravação se o arquivo exceder MAX_UPLOAD_BYTES; em caso
+    de recusa, o arquivo parcial é removido. Retorna o SHA-256 (hex) do conteúdo.
+    """
+    size = 0
+    digest = hashlib.sha256()
     try:
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)    
+        async with await anyio.open_file(file_path, "wb") as buffer:
+            while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+                if size == 0 and not chunk.startswith(PDF_MAGIC):
+                    raise UploadRejected("O conteúdo do arquivo não é um PDF válido.")
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise UploadRejected(f"O arquivo excede o limite de {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+                digest.update(chunk)
+                await buffer.write(chunk)
+        if size == 0:
+            raise UploadRejected("O arquivo está vazio.")
+    except BaseException:
+        await anyio.Path(file_path).unlink(missing_ok=True)
+        raise
+    return digest.hexdigest()
 
-        # O link deve usar o nome único para que o FastAPI encontre no disco
-        local_link = f"/files/{unique_file_name_on_disk}" 
+async def _ingest_upload(file: UploadFile, allowed_roles: list[str]) -> dict:
+    """Salva um PDF enviado (endereçado pelo conteúdo) e o processa numa thread do pool, sem bloquear o event loop."""
+    file_name = file.filename or ""
+    if not file_name.lower().endswith(".pdf"):
+        return {"nome_original": file_name, "status": "erro", "detalhe": "Apenas arquivos PDF são aceitos."}
 
-        process_pdf(
-            file_path=file_path,
-            source_url=local_link,
-            file_name_in_storage=unique_file_name_on_disk,
-            display_name=file_name,
-            embedder=app_embedder,
-            allowed_roles=allowed_roles
-        )
-        
+    store = get_content_store()
+    temp_path = store.temp_path()
+
+    try:
+        digest = await _save_upload(file, temp_path)
+    except UploadRejected as e:
+        return {"nome_original": file_name, "status": "erro", "detalhe": str(e)}
+
+    # O arquivo é salvo como <sha256>.pdf: reenviar o mesmo conteúdo não duplica o arquivo em disco.
+    # O link deve usar o nome do blob para que o FastAPI encontre no disco
+    blob_name = f"{digest}.pdf"
+    local_link = f"/files/{blob_name}"
+    _, created = await run_in_threadpool(store.commit, temp_path, digest, local_link)
+
+    try:
+        async with _upload_semaphore:
+            inserted = await run_in_threadpool(
+                process_pdf,
+                file_path=store.path(blob_name),
+                source_url=local_link,
+                file_name_in_storage=blob_name,
+                display_name=file_name,
+                embedder=app_embedder,
+                allowed_roles=allowed_roles,
+            )
     except Exception as e:
-        print(f"Erro no processamento de {file_name}: {e}")
-        return {"status": "erro", "detalhe": f"Falha no processamento: {e}"}
-            
-    return {"status": "sucesso", "arquivo_salvo": unique_file_name_on_disk, "nome_original": file_name, "chunks_adicionados": "Verifique o log."}
+        logger.error("Erro no processamento de %s: %s", file_name, e)
+        return {"nome_original": file_name, "status": "erro", "detalhe": f"Falha no processamento: {e}"}
+
+    return {"nome_original": file_name, "status": "sucesso", "arquivo_salvo": blob_name, "chunks_adicionados": inserted, "duplicado": not created}
 
-@app.post("/upload-url")
+@app.post("/upload-pdf", dependencies=[Depends(require_ready)])
+async def upload_pdf(
+    file: Optional[UploadFile] = File(default=None, description="Um único PDF (mantido por compatibilidade)"),
+    files: list[UploadFile] = File(default=[], description="Um ou mais PDFs, processados em paralelo"),
+    roles_csv: str = Form(default="admin", description="Cargos separados por vírgula (ex: admin, gerente)"),
+):
+    """
+    Endpoint de envio de PDFs (um ou vários), de forma que o conteúdo seja extraído, normalizado,
+    separado em chunkings, convertido em embeddings e, por fim, salvo no banco Qdrant.
+    Os arquivos são gravados em disco em blocos e processados em paralelo, fora do event loop.
+    """
+    uploads = ([file] if file is not None else []) + list(files)
+    if file is not None and not files and not (file.filename or "").lower().endswith(".pdf"):
+        # Mesma resposta de antes para o campo 'file' (um único arquivo)
+        return {"error": "Apenas arquivos PDF são aceitos."}
+    if not uploads:
+        raise HTTPException(status_code=400, detail="Nenhum arquivo enviado.")
+    if len(uploads) > MAX_UPLOAD_FILES:
+        raise HTTPException(status_code=413, detail=f"Envie no máximo {MAX_UPLOAD_FILES} arquivos por requisição.")
+
+    allowed_roles = [role.strip() for role in roles_csv.split(",")]
+
+    results = await asyncio.gather(*[_ingest_upload(upload, allowed_roles) for upload in uploads])
+
+    succeeded = sum(1 for r in results if r["status"] == "sucesso")
+    if succeeded == len(results):
+        overall = "sucesso"
+    elif succeeded:
+        overall = "parcial"
+    else:
+        overall = "erro"
+
+    response = {"status": overall, "arquivos": results}
+    if len(results) == 1:
+        # Mesmos campos da resposta anterior (um único arquivo)
+        response.update({k: v for k, v in results[0].items() if k != "status"})
+    return response
+
+@app.post("/upload-url", dependencies=[Depends(require_ready)])
 async def upload_url(payload: URLPayload):
     """
     Endpoint de envio de URL únicas, de forma que o conteúdo seja convertido para PDF, extraído,
@@ -178,7 +570,7 @@ async def upload_url(payload: URLPayload):
             "mensagem": "Falha ao baixar, extrair ou processar a URL. Verifique os logs."
         }
 
-@app.post("/ingest/batch")
+@app.post("/ingest/batch", dependencies=[Depends(require_ready)])
 async def ingest_url_batch(payload: BatchURLPayload):
     """
     Endpoint de envio de URL em batch, de forma que o conteúdo seja convertido para PDF, extraído,
@@ -189,7 +581,7 @@ async def ingest_url_batch(payload: BatchURLPayload):
     if not urls_list:
         return {"error": "A lista de URLs está vazia.", "status": "erro"}
     
-    print(f"Recebida requisição de lote com {len(urls_list)} URLs.")
+    logger.info("Recebida requisição de lote com %s URLs.", len(urls_list))
     
     try:
         total_chunks = await run_in_threadpool(
@@ -212,6 +604,107 @@ async def ingest_url_batch(payload: BatchURLPayload):
             "detalhe": str(e)
         }
 
+def _document_source(source: str) -> str:
+    """
+    Source do documento a partir do caminho da rota. Os PDFs enviados têm source "/files/<arquivo>.pdf":
+    aceita tanto /documents//files/... quanto /documents/files/... (barra inicial omitida).
+    """
+    if source.startswith("files/"):
+        return f"/{source}"
+    return source
+
+@app.delete("/documents/{source:path}", dependencies=[Depends(require_ready)])
+async def remove_document(source: str, current_user: User = Depends(get_current_admin_user)):
+    """
+    Remove um documento (URL ou /files/<arquivo>.pdf, como no campo 'source' dos chunks) do Qdrant
+    e do armazenamento, por filtro sobre o campo indexado 'source' (sem recriar a coleção).
+    Restrito a administradores. Retorna quantos pontos foram afetados.
+    """
+    source = _document_source(source)
+    result = await run_in_threadpool(delete_document, get_ingestion_client(), source)
+    if not any(result.values()):
+        raise HTTPException(status_code=404, detail=f"Documento não encontrado: {source}")
+    logger.info("Documento %s removido por %s.", source, current_user.username)
+    return {"status": "sucesso", "source": source, **result}
+
+@app.put("/documents/{source:path}", dependencies=[Depends(require_ready)])
+async def replace_document(
+    source: str,
+    file: Optional[UploadFile] = File(default=None, description="Nova versão do PDF (opcional para URLs: sem arquivo, a URL é baixada novamente)"),
+    roles_csv: str = Form(default="admin", description="Cargos separados por vírgula (ex: admin, gerente)"),
+    current_user: User = Depends(get_current_admin_user),
+):
+    """
+    Substitui um documento: a nova versão é obtida (upload ou novo download da URL), gravada no
+    armazenamento sem substituir o arquivo atual e processada sob a mesma 'source', com novos IDs.
+    Só depois de a nova versão ser gravada os chunks antigos são removidos e a 'source' passa a
+    apontar para o novo arquivo. Se o processamento falhar ou não gerar nenhum chunk (ex: PDF
+    digitalizado, sem texto), a nova versão é descartada e o documento atual é mantido.
+    Restrito a administradores.
+    """
+    source = _document_source(source)
+    allowed_roles = [role.strip() for role in roles_csv.split(",")]
+    store = get_content_store()
+
+    # 1. Aquisição da nova versão (gravada no armazenamento, ainda sem substituir o arquivo da source)
+    if file is not None:
+        temp_path = store.temp_path()
+        try:
+            digest = await _save_upload(file, temp_path)
+        except UploadRejected as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        blob_name, _ = await run_in_threadpool(store.commit, temp_path, digest)
+        display_name = file.filename or source
+    elif source.startswith(("http://", "https://")):
+        local_pdf_path = await run_in_threadpool(url_to_local_pdf, source, STORAGE_DIR, False)
+        if not local_pdf_path:
+            raise HTTPException(status_code=502, detail=f"Falha ao baixar a nova versão de {source}.")
+        blob_name = os.path.basename(local_pdf_path)
+        display_name = source
+    else:
+        raise HTTPException(status_code=400, detail="Envie o novo arquivo PDF (apenas URLs podem ser baixadas novamente).")
+
+    # 2. Processamento da nova versão, com novos IDs e a data da substituição (que a distingue da anterior)
+    client = get_ingestion_client()
+    previous_ids = await run_in_threadpool(document_point_ids, client, source)
+    version = datetime.now().isoformat(timespec="milliseconds")
+    try:
+        async with _upload_semaphore:
+            inserted = await run_in_threadpool(
+                process_pdf,
+                file_path=store.path(blob_name),
+                source_url=source,
+                file_name_in_storage=blob_name,
+                display_name=display_name,
+                embedder=app_embedder,
+                allowed_roles=allowed_roles,
+                last_updated=version,
+                replacing=True,
+            )
+    except Exception as e:
+        ERRORS.inc(stage="ingestion")
+        logger.error("Erro no processamento da nova versão de %s: %s", source, e)
+        await run_in_threadpool(discard_new_version, client, source, previous_ids, version)
+        await run_in_threadpool(store.release, blob_name)
+        raise HTTPException(status_code=500, detail=f"A nova versão falhou no processamento; o documento atual foi mantido: {e}")
+    if not inserted:
+        await run_in_threadpool(discard_new_version, client, source, previous_ids, version)
+        await run_in_threadpool(store.release, blob_name)
+        raise HTTPException(status_code=422, detail="Nenhum chunk foi gerado a partir da nova versão (ex: PDF digitalizado, sem texto); o documento atual foi mantido.")
+
+    # 3. Remoção da versão anterior e troca do arquivo associado à source
+    removed = await run_in_threadpool(remove_previous_version, client, source, previous_ids, version)
+    await run_in_threadpool(store.link, source, blob_name)
+
+    logger.info("Documento %s substituído por %s.", source, current_user.username)
+    return {
+        "status": "sucesso",
+        "source": source,
+        "arquivo_salvo": blob_name,
+        "chunks_inseridos": inserted,
+        **removed,
+    }
+
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
     """
@@ -236,34 +729,28 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/query")
-async def handle_query(request: QueryRequest, current_user: User = Depends(get_current_active_user)):
+async def handle_query(request: QueryRequest, http_request: Request, current_user: User = Depends(get_current_active_user)):
     """
     Recebe uma pergunta (query) e o cargo do usuário (autenticação), busca no VectorDB aplicando o filtro de segurança e retorna os chunks de texto mais relevantes.
+    O prazo da requisição vem do cabeçalho X-Request-Timeout (ou do padrão REQUEST_TIMEOUT_DEFAULT):
+    esgotado o prazo, responde 504; se o cliente desconectar, o trabalho em andamento é cancelado.
     """
+    deadline = Deadline.from_header(http_request.headers.get(DEADLINE_HEADER))
     try:
         # Sobrescreve a role enviada no JSON pela role real do token (segurança)
         real_role = current_user.role
-        print(f"DEBUG: Usuário {current_user.username} (Role: {real_role}) fez uma query.")
+        logger.debug("Usuário %s (Role: %s) fez uma query.", current_user.username, real_role)
 
-        top_results = retrieve_relevant_chunks(
-            query=request.query,
-            embedder=app_embedder,
-            vectordb=app_vectordb,
-            user_role=real_role,
+        top_results, final_answer = await _run_until_deadline(
+            http_request,
+            deadline,
+            _answer_query(request, real_role, deadline),
         )
-        # Formata o contexto final para o LLM
-        formatted_context = "\n\n---\n\n".join([c['chunk'] for c in top_results])
-        print(f"DEBUG: Contexto fornecido ao LLM:\n{formatted_context}")
-
-        # Geração da Resposta
-        try:
-            final_answer = await generator.generate_response(
-                contexto=formatted_context,
-                pergunta=request.query
-            )
-        except Exception as e:
-            print(f"Erro inesperado no handle_query: {e}")
-            raise HTTPException(status_code=500, detail=f"Falha na geração da resposta pelo LLM: {e}")
+    except HTTPException:
+        raise
+    except DeadlineExceeded as e:
+        ERRORS.inc(stage="deadline")
+        raise HTTPException(status_code=504, detail=str(e))
     except ValueError as e:
         raise HTTPException(
             status_code=404, # Not found
@@ -278,4 +765,190 @@ async def handle_query(request: QueryRequest, current_user: User = Depends(get_c
         "chunks": top_results
     }
 
+async def _answer_query(request: QueryRequest, real_role: str, deadline: Deadline):
+    """Recuperação (no threadpool, sem bloquear o event loop) seguida da geração da resposta."""
+    top_results = await run_in_threadpool(
+        retrieve_relevant_chunks,
+        query=request.query,
+        embedder=app_embedder,
+        vectordb=app_vectordb,
+        user_role=real_role,
+        updated_after=request.updated_after,
+        updated_before=request.updated_before,
+        recency_half_life_days=request.recency_half_life_days,
+        deadline=deadline,
+    )
+    # Formata o contexto final para o LLM
+    formatted_context = "\n\n---\n\n".join([c['chunk'] for c in top_results])
+    log_payload(logger, "Contexto fornecido ao LLM", formatted_context)
+
+    # Geração da Resposta
+    try:
+        final_answer = await _generate_answer(formatted_context, request.query, deadline)
+    except SchedulerOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        logger.error("Erro inesperado no handle_query: %s", e)
+        raise HTTPException(status_code=500, detail=f"Falha na geração da resposta pelo LLM: {e}")
+    return top_results, final_answer
+
+async def _run_until_deadline(http_request: Request, deadline: Deadline, awaitable):
+    """
+    Aguarda 'awaitable' até o prazo da requisição, verificando periodicamente se o cliente
+    desconectou. Em qualquer dos dois casos, cancela o trabalho em andamento (a geração
+    compartilhada no escalonador só é cancelada quando ninguém mais a aguarda).
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=min(DISCONNECT_POLL_INTERVAL, deadline.remaining()))
+            if done:
+                return task.result()
+            if deadline.expired():
+                raise DeadlineExceeded(f"Prazo da requisição ({deadline.timeout:g}s) esgotado.")
+            if await http_request.is_disconnected():
+                logger.debug("Cliente desconectou; consulta cancelada.")
+                raise HTTPException(status_code=499, detail="Cliente desconectou antes da resposta.")
+    finally:
+        task.cancel()
+
+async def _generate_answer(contexto: str, pergunta: str, deadline: Deadline = None) -> str:
+    """
+    Gera a resposta do LLM pelo escalonador: perguntas idênticas em andamento (mesmo prompt, iniciadas
+    com um prazo igual ou maior) compartilham uma única chamada ao TGI, e o número de gerações simultâneas é limitado.
+    """
+    prompt = generator.build_prompt(contexto, pergunta)
+    PROMPT_CHARS.observe(len(prompt))
+    key = scheduler.prompt_key(prompt)
+    return await scheduler.run(key, lambda: generator.generate_response(contexto=contexto, pergunta=pergunta, deadline=deadline), deadline=deadline)
+
+def _sse_event(event: str, data) -> str:
+    """Formata um evento Server-Sent Events (SSE)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post("/query/stream")
+async def handle_query_stream(request: QueryRequest, http_request: Request, current_user: User = Depends(get_current_active_user)):
+    """
+    Versão em streaming de /query: responde com Server-Sent Events (text/event-stream).
+    - evento 'chunks': os chunks recuperados (enviado antes da geração começar)
+    - eventos 'token': trechos da resposta, à medida que o LLM os gera
+    - evento 'done': a resposta final completa (ou 'error', em caso de falha na geração)
+    O prazo (X-Request-Timeout) vale para todo o stream; se o cliente desconectar, o stream
+    (e a geração no TGI) é encerrado.
+    """
+    deadline = Deadline.from_header(http_request.headers.get(DEADLINE_HEADER))
+    real_role = current_user.role
+    logger.debug("Usuário %s (Role: %s) fez uma query (streaming).", current_user.username, real_role)
+
+    try:
+        top_results = await run_in_threadpool(
+            retrieve_relevant_chunks,
+            query=request.query,
+            embedder=app_embedder,
+            vectordb=app_vectordb,
+            user_role=real_role,
+            updated_after=request.updated_after,
+            updated_before=request.updated_before,
+            recency_half_life_days=request.recency_half_life_days,
+            deadline=deadline,
+        )
+    except DeadlineExceeded as e:
+        ERRORS.inc(stage="deadline")
+        raise HTTPException(status_code=504, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro interno inesperado no servidor: {e}")
+
+    formatted_context = "\n\n---\n\n".join([c['chunk'] for c in top_results])
+    PROMPT_CHARS.observe(len(generator.build_prompt(formatted_context, request.query)))
+
+    # Descarte rápido: com a fila de geração cheia, responde 503 antes de abrir o stream
+    if scheduler.is_saturated():
+        raise HTTPException(status_code=503, detail="Fila de geração cheia. Tente novamente em instantes.", headers={"Retry-After": "5"})
+
+    async def event_stream():
+        yield _sse_event("chunks", top_results)
+        answer = ""
+        try:
+            async with scheduler.slot(max_wait=deadline.remaining()):
+                async for piece in generator.generate_stream(contexto=formatted_context, pergunta=request.query, deadline=deadline):
+                    answer += piece
+                    yield _sse_event("token", {"text": piece})
+        except SchedulerOverloaded as e:
+            yield _sse_event("error", {"status": 503, "detail": str(e)})
+            return
+        except DeadlineExceeded as e:
+            ERRORS.inc(stage="deadline")
+            yield _sse_event("error", {"status": 504, "detail": str(e)})
+            return
+        except Exception as e:
+            logger.error("Erro inesperado no handle_query_stream: %s", e)
+            yield _sse_event("error", {"detail": f"Falha na geração da resposta pelo LLM: {e}"})
+            return
+        yield _sse_event("done", {"answer": answer})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/query/batch")
+async def handle_query_batch(request: BatchQueryRequest, http_request: Request, current_user: User = Depends(get_current_active_user)):
+    """
+    Recebe uma lista de perguntas e executa a recuperação em lote: um único embedding em lote,
+    uma única busca em lote no Qdrant (com o filtro de segurança do cargo) e uma única busca
+    pelos chunks vizinhos. Opcionalmente (generate=True), gera a resposta do LLM para cada pergunta.
+    """
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="A lista de perguntas está vazia.")
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"Máximo de {MAX_BATCH_QUERIES} perguntas por requisição.")
+
+    deadline = Deadline.from_header(http_request.headers.get(DEADLINE_HEADER))
+    real_role = current_user.role
+    logger.debug("Usuário %s (Role: %s) fez uma query em lote com %s perguntas.", current_user.username, real_role, len(request.queries))
+
+    try:
+        chunks_per_query = await run_in_threadpool(
+            retrieve_relevant_chunks_batch,
+            request.queries,
+            app_embedder,
+            app_vectordb,
+            real_role,
+            request.top_k,
+            updated_after=request.updated_after,
+            updated_before=request.updated_before,
+            recency_half_life_days=request.recency_half_life_days,
+            deadline=deadline,
+        )
+    except DeadlineExceeded as e:
+        ERRORS.inc(stage="deadline")
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro interno inesperado no servidor: {e}")
+
+    results = [{"query": q, "chunks": chunks} for q, chunks in zip(request.queries, chunks_per_query)]
+
+    if request.generate:
+        async def _answer(result):
+            if not result["chunks"]:
+                return "Nenhum documento relevante foi encontrado com base na sua consulta e permissões de acesso."
+            formatted_context = "\n\n---\n\n".join([c['chunk'] for c in result["chunks"]])
+            try:
+                return await _generate_answer(formatted_context, result["query"], deadline)
+            except SchedulerOverloaded as e:
+                return f"Erro: LLM sobrecarregado ({e})"
+            except DeadlineExceeded as e:
+                return f"Erro: {e}"
+
+        answers = await asyncio.gather(*[_answer(r) for r in results])
+        for result, answer in zip(results, answers):
+            result["answer"] = answer
+
+    return {"results": results}
+
 app.include_router(router)
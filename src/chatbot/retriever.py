@@ -1,101 +1,268 @@
+import os
+from datetime import datetime, timezone
 from ..core.embedder import Embedder
-from ..core.vectordb import VectorDB
-from qdrant_client.models import Filter, FieldCondition, MatchValue
+from ..core.vectordb import VectorDB, restrict_to_sources, with_date_range
+from ..core.sparse import sparse_encoder
+from ..core.deadline import Deadline
+from ..core.metrics import query_stage, ERRORS
+from ..core.log import get_logger
+from ..ingestion.normalizer import normalize_text
+from qdrant_client.models import Filter, FieldCondition, MatchValue, SearchParams
 from typing import List, Dict, Any
 
-def retrieve_relevant_chunks(query: str, embedder: Embedder, vectordb: VectorDB, user_role: str, top_k: int = 5):
+logger = get_logger(__name__)
+
+# Modo de busca padrão:
+#   - "hybrid": denso + esparso com RRF
+#   - "dense": apenas vetor denso
+#   - "two_stage": escolhe primeiro os documentos mais similares e depois busca (de forma híbrida)
+#     apenas entre os chunks desses documentos
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+
+# Quantos documentos o primeiro estágio do modo "two_stage" seleciona
+TWO_STAGE_TOP_DOCUMENTS = int(os.getenv("TWO_STAGE_TOP_DOCUMENTS", "10"))
+
+# Com o reranqueamento por recência, busca-se top_k * RECENCY_OVERSAMPLE candidatos antes de reordenar
+RECENCY_OVERSAMPLE = int(os.getenv("RECENCY_OVERSAMPLE", "3"))
+
+def retrieve_relevant_chunks(query: str, embedder: Embedder, vectordb: VectorDB, user_role: str, top_k: int = 5, mode: str = RETRIEVAL_MODE,
+                             updated_after: datetime = None, updated_before: datetime = None, recency_half_life_days: float = None,
+                             deadline: Deadline = None, search_params: SearchParams = None):
     """
     Função orquestradora (Retriever) que recebe uma query e os serviços 
     (embedder, vectordb), aplica os filtros de segurança e retorna os chunks relevantes.
+    No modo "hybrid", a consulta também é convertida em vetor esparso lexical, o que
+    favorece identificadores exatos (ex: "resolucao 4.893", "art. 12").
+    updated_after / updated_before restringem a busca a documentos atualizados no intervalo, e
+    recency_half_life_days (opcional) reordena os resultados favorecendo os mais recentes.
+    deadline (opcional): prazo da requisição; cada etapa verifica o tempo restante antes de começar
+    (lançando DeadlineExceeded) e as buscas no Qdrant usam esse tempo como timeout.
+    search_params (opcional): parâmetros do HNSW/quantização das buscas (ver build_search_params em vectordb.py);
+    por padrão, os definidos por SEARCH_HNSW_EF, SEARCH_EXACT e SEARCH_QUANTIZATION_*.
     """
     
-    print(f"[RETRIEVER] --- Iniciando processo de busca (Cargo: {user_role}) ---")
-    print(f"[RETRIEVER] Consulta recebida: '{query}'")
-    print("[RETRIEVER] Gerando embedding da query...")
+    logger.debug("[RETRIEVER] --- Iniciando processo de busca (Cargo: %s) ---", user_role)
+    logger.debug("[RETRIEVER] Consulta recebida: '%s'", query)
+    logger.debug("[RETRIEVER] Gerando embedding da query...")
     
     try:
-        query_embedding = embedder.embed([query])[0].tolist()
+        with query_stage("query_embedding"):
+            query_embedding = embedder.embed([query])[0].tolist()
     except Exception as e:
-        print(f"[ERRO RETRIEVER] Falha ao gerar embedding. Verifique se o método 'embed' existe: {e}")
+        ERRORS.inc(stage="query_embedding")
+        logger.error("[ERRO RETRIEVER] Falha ao gerar embedding. Verifique se o método 'embed' existe: %s", e)
         raise RuntimeError(f"Falha ao gerar embedding: {e}")
 
-    security_filter = Filter(
-        must=[
-            FieldCondition(
-                key="allowed_roles",
-                match=MatchValue(value=user_role) 
-            )
-        ]
-    )
+    # Vetor esparso gerado sobre o mesmo texto normalizado usado na ingestão
+    sparse_vector = None
+    if mode in ("hybrid", "two_stage"):
+        with query_stage("sparse_encoding"):
+            sparse_vector = sparse_encoder.encode_query(normalize_text(query))
+
+    security_filter = build_security_filter(user_role, updated_after, updated_before)
 
-    print(f"[RETRIEVER] Buscando top {top_k} resultados no Qdrant...")
+    # Primeiro estágio: restringe a busca de chunks aos documentos mais similares
+    if mode == "two_stage":
+        _check_deadline(deadline, "seleção de documentos")
+        security_filter = _restrict_to_top_documents([query_embedding], vectordb, [security_filter], deadline, search_params)[0]
+
+    logger.debug("[RETRIEVER] Buscando top %s resultados no Qdrant (modo: %s)...", top_k, mode)
+    _check_deadline(deadline, "busca vetorial")
     try:
-        top_results = vectordb.search(
-            query_embedding,
-            top_k=top_k,
-            query_filter=security_filter,
-        )
+        with query_stage("vector_search"):
+            top_results = vectordb.search(
+                query_embedding,
+                top_k=top_k * RECENCY_OVERSAMPLE if recency_half_life_days else top_k,
+                query_filter=security_filter,
+                sparse_vector=sparse_vector,
+                timeout=_qdrant_timeout(deadline),
+                search_params=search_params,
+            )
     except Exception as e:
+        ERRORS.inc(stage="vector_search")
         raise RuntimeError(f"Erro ao buscar no Qdrant: {e}")
 
+    if recency_half_life_days:
+        top_results = apply_recency_decay(top_results, recency_half_life_days)[:top_k]
+
     if not top_results:
         raise ValueError("Nenhum documento relevante foi encontrado com base na sua consulta e permissões de acesso.")
     
-    print(f"[RETRIEVER] {len(top_results)} resultados encontrados.\n")
+    logger.debug("[RETRIEVER] %s resultados encontrados.", len(top_results))
 
-    # Recuperação Expandida (Retrieval Expansion)
-    # Esta lista será o conjunto de chunks que terão o contexto expandido.
-    chunks_a_expandir = top_results[:2] # Pega o Chunk Top 1 e o Chunk Top 2
+    _check_deadline(deadline, "expansão de contexto")
+    final_context_list = expand_with_neighbours([top_results], vectordb, user_role, deadline)[0]
     
-    # Usa um dicionário para garantir que todos os chunks (principais + vizinhos) sejam únicos
-    final_context_map = {hit['id']: hit for hit in chunks_a_expandir}
+    logger.debug("Busca concluída. %s chunks no contexto final (principais + vizinhos).", len(final_context_list))
     
-    # Lista de chunks que têm metadados suficientes para expansão
-    chunks_to_expand = [
-        hit for hit in chunks_a_expandir 
-        if 'chunk_index' in hit and 'source' in hit and hit.get('chunk_index') is not None
-    ]
+    return final_context_list
 
-    print(f"[RETRIEVER] Iniciando Expansão de Contexto para {len(chunks_to_expand)} chunks...")
-    
-    for hit in chunks_to_expand:
-        source = hit.get('source')
-        
+def retrieve_relevant_chunks_batch(queries: List[str], embedder: Embedder, vectordb: VectorDB, user_role: str, top_k: int = 5, mode: str = RETRIEVAL_MODE,
+                                   updated_after: datetime = None, updated_before: datetime = None, recency_half_life_days: float = None,
+                                   deadline: Deadline = None, search_params: SearchParams = None) -> List[List[Dict[str, Any]]]:
+    """
+    Versão em lote do Retriever: gera os embeddings de todas as consultas numa única
+    passada do modelo, executa uma única busca em lote no Qdrant (um filtro de segurança
+    por consulta) e busca os chunks vizinhos de todas as consultas numa única requisição.
+    Retorna uma lista de chunks para cada consulta (vazia quando nada foi encontrado).
+    """
+    logger.debug("[RETRIEVER] --- Iniciando busca em lote de %s consultas (Cargo: %s) ---", len(queries), user_role)
+
+    try:
+        with query_stage("query_embedding"):
+            query_embeddings = embedder.embed(queries).tolist()
+    except Exception as e:
+        ERRORS.inc(stage="query_embedding")
+        logger.error("[ERRO RETRIEVER] Falha ao gerar embeddings em lote: %s", e)
+        raise RuntimeError(f"Falha ao gerar embedding: {e}")
+
+    sparse_vectors = None
+    if mode in ("hybrid", "two_stage"):
+        with query_stage("sparse_encoding"):
+            sparse_vectors = [sparse_encoder.encode_query(normalize_text(q)) for q in queries]
+
+    query_filters = [build_security_filter(user_role, updated_after, updated_before) for _ in queries]
+
+    if mode == "two_stage":
+        _check_deadline(deadline, "seleção de documentos")
+        query_filters = _restrict_to_top_documents(query_embeddings, vectordb, query_filters, deadline, search_params)
+
+    _check_deadline(deadline, "busca vetorial")
+    try:
+        with query_stage("vector_search"):
+            batch_results = vectordb.search_batch(
+                query_embeddings,
+                top_k=top_k * RECENCY_OVERSAMPLE if recency_half_life_days else top_k,
+                query_filters=query_filters,
+                sparse_vectors=sparse_vectors,
+                timeout=_qdrant_timeout(deadline),
+                search_params=search_params,
+            )
+    except Exception as e:
+        ERRORS.inc(stage="vector_search")
+        raise RuntimeError(f"Erro ao buscar no Qdrant: {e}")
+
+    if recency_half_life_days:
+        batch_results = [apply_recency_decay(results, recency_half_life_days)[:top_k] for results in batch_results]
+
+    _check_deadline(deadline, "expansão de contexto")
+    final_context_lists = expand_with_neighbours(batch_results, vectordb, user_role, deadline)
+
+    logger.debug("[RETRIEVER] Busca em lote concluída. %s chunks no total.", sum(len(c) for c in final_context_lists))
+
+    return final_context_lists
+
+def build_security_filter(user_role: str, updated_after: datetime = None, updated_before: datetime = None) -> Filter:
+    """
+    Filtro de segurança: só retorna chunks cujo 'allowed_roles' contém o cargo do usuário.
+    Opcionalmente, também restringe 'last_updated' ao intervalo de datas informado.
+    """
+    security_filter = Filter(
+        must=[
+            FieldCondition(
+                key="allowed_roles",
+                match=MatchValue(value=user_role) 
+            )
+        ]
+    )
+    return with_date_range(security_filter, updated_after, updated_before)
+
+def apply_recency_decay(results: List[Dict[str, Any]], half_life_days: float, now: datetime = None) -> List[Dict[str, Any]]:
+    """
+    Reordena os resultados multiplicando o score por um decaimento exponencial da idade do
+    documento: um documento com 'half_life_days' dias de idade tem o score reduzido pela metade.
+    Resultados sem 'last_updated' válido mantêm o score original.
+    """
+    for result in results:
         try:
-            chunk_index = int(hit.get('chunk_index'))
+            updated_at = datetime.fromisoformat(result.get("last_updated"))
         except (TypeError, ValueError):
-            print(f"Aviso: chunk_index inválido no chunk ID {hit['id']}. Pulando expansão.")
             continue
-            
-        neighbor_indices = []
-        
-        # Vizinho anterior: index - 1. (O índice começa em 1, então o mínimo é 1)
-        if chunk_index > 1:
-            neighbor_indices.append(chunk_index - 1)
-        
-        # Vizinho posterior: index + 1
-        neighbor_indices.append(chunk_index + 1)
-        
-        # Busca e adiciona os vizinhos
-        for neighbor_index in neighbor_indices:
-            neighbor_hits = vectordb.get_chunks_by_metadata(
-                source=source, 
-                chunk_index=neighbor_index,
-                user_role=user_role # Filtro de segurança obrigatório
-            )
-            
-            # Adiciona os vizinhos ao mapa (final_context_map)
-            for neighbor in neighbor_hits:
-                if neighbor['id'] not in final_context_map:
-                    final_context_map[neighbor['id']] = neighbor
-                    print(f"[RETRIEVER] -> Adicionado chunk vizinho (Index {neighbor_index}) do documento {source}.")
-
-    # Retorna a lista final de chunks (principais + vizinhos)
-    final_context_list = list(final_context_map.values())
-    
-    # Ordenar o contexto final por documento (source) e índice (index) para passar para o LLM
-    final_context_list.sort(key=lambda x: (x.get('source', ''), x.get('chunk_index', 9999)))
-    
-    print(f"\nBusca concluída. {len(final_context_list)} chunks no contexto final (principais + vizinhos).\n")
-    
-    return final_context_list
+
+        # Timestamps sem fuso horário são gravados com o horário local do servidor
+        reference = now or (datetime.now(timezone.utc) if updated_at.tzinfo else datetime.now())
+        age_days = max((reference - updated_at).total_seconds() / 86400, 0.0)
+        result["score"] = result["score"] * 0.5 ** (age_days / half_life_days)
+
+    return sorted(results, key=lambda r: r["score"], reverse=True)
+
+def _check_deadline(deadline: Deadline, stage: str):
+    if deadline is not None:
+        deadline.check(stage)
+
+def _qdrant_timeout(deadline: Deadline):
+    return deadline.qdrant_timeout() if deadline is not None else None
+
+def _restrict_to_top_documents(query_embeddings: List[List[float]], vectordb: VectorDB, query_filters: List[Filter], deadline: Deadline = None, search_params: SearchParams = None) -> List[Filter]:
+    """
+    Primeiro estágio da busca em dois estágios: seleciona os documentos mais similares a cada
+    consulta e restringe o filtro de cada uma a esses documentos. Se a coleção de documentos
+    ainda não tiver vetores (dados antigos), mantém o filtro original (busca plana).
+    """
+    with query_stage("document_search"):
+        top_sources = vectordb.search_documents_batch(query_embeddings, top_k=TWO_STAGE_TOP_DOCUMENTS, query_filters=query_filters, timeout=_qdrant_timeout(deadline), search_params=search_params)
+
+    restricted = []
+    for query_filter, sources in zip(query_filters, top_sources):
+        if sources:
+            logger.debug("[RETRIEVER] Primeiro estágio: busca restrita a %s documentos.", len(sources))
+            restricted.append(restrict_to_sources(query_filter, sources))
+        else:
+            restricted.append(query_filter)
+    return restricted
+
+def expand_with_neighbours(results_per_query: List[List[Dict[str, Any]]], vectordb: VectorDB, user_role: str, deadline: Deadline = None) -> List[List[Dict[str, Any]]]:
+    """
+    Recuperação Expandida (Retrieval Expansion): para cada consulta, adiciona ao contexto os
+    chunks vizinhos (index - 1 e index + 1) dos 2 melhores resultados. Os vizinhos de todas
+    as consultas são buscados numa única requisição ao VectorDB (inclusive os quase duplicados,
+    gravados por outro documento, ver neighbours_filter).
+    """
+    wanted_per_query = []
+    all_keys = set()
+
+    for top_results in results_per_query:
+        # Pega o Chunk Top 1 e o Chunk Top 2
+        chunks_a_expandir = top_results[:2]
+        wanted = set()
+
+        for hit in chunks_a_expandir:
+            if hit.get('chunk_index') is None or not hit.get('source'):
+                continue
+            try:
+                chunk_index = int(hit.get('chunk_index'))
+            except (TypeError, ValueError):
+                logger.warning("Aviso: chunk_index inválido no chunk ID %s. Pulando expansão.", hit['id'])
+                continue
+
+            # Vizinho anterior: index - 1. (O índice começa em 1, então o mínimo é 1)
+            if chunk_index > 1:
+                wanted.add((hit['source'], chunk_index - 1))
+            # Vizinho posterior: index + 1
+            wanted.add((hit['source'], chunk_index + 1))
+
+        wanted_per_query.append(wanted)
+        all_keys |= wanted
+
+    logger.debug("[RETRIEVER] Iniciando Expansão de Contexto: %s chunks vizinhos a buscar...", len(all_keys))
+    with query_stage("neighbour_expansion"):
+        neighbours = vectordb.get_chunks_by_metadata_batch(sorted(all_keys), user_role=user_role, timeout=_qdrant_timeout(deadline)) if all_keys else []
+    neighbours_by_key = {(n['source'], n['chunk_index']): n for n in neighbours}
+
+    final_context_lists = []
+    for top_results, wanted in zip(results_per_query, wanted_per_query):
+        # Usa um dicionário para garantir que todos os chunks (principais + vizinhos) sejam únicos
+        final_context_map = {hit['id']: hit for hit in top_results[:2]}
+
+        for key in sorted(wanted):
+            neighbour = neighbours_by_key.get(key)
+            if neighbour and neighbour['id'] not in final_context_map:
+                final_context_map[neighbour['id']] = neighbour
+                logger.debug("[RETRIEVER] -> Adicionado chunk vizinho (Index %s) do documento %s.", key[1], key[0])
+
+        # Ordenar o contexto final por documento (source) e índice (index) para passar para o LLM
+        final_context_list = list(final_context_map.values())
+        final_context_list.sort(key=lambda x: (x.get('source', ''), x.get('chunk_index', 9999)))
+        final_context_lists.append(final_context_list)
+
+    return final_context_lists
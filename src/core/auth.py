@@ -117,4 +117,20 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
 async def get_current_active_user(current_user: User = Depends(get_current_user)):
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Usuário inativo")
-    return current_user
\ No newline at end of file
+    return current_user
+async def get_current_admin_user(current_user: User = Depends(get_current_active_user)):
+    """Restringe a rota aos administradores (ex: remoção e substituição de documentos)."""
+    if current_user.role != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Operação restrita a administradores.")
+    return current_user
+
+def is_admin_token(authorization: Optional[str]) -> bool:
+    """Indica se o cabeçalho Authorization traz o token de um administrador ativo (usado fora das dependências, ex: middlewares)."""
+    if not authorization or not authorization.lower().startswith("bearer "):
+        return False
+    try:
+        payload = jwt.decode(authorization[7:].strip(), SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return False
+    user = get_user(fake_users_db, username=payload.get("sub") or "")
+    return user is not None and not user.disabled and user.role == "admin"
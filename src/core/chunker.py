@@ -0,0 +1,108 @@
+import re
+from typing import List, NamedTuple
+
+# Fim de sentença: pontuação seguida de espaço
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+")
+# Abreviações comuns em textos normativos, que terminam em ponto mas não encerram a sentença (ex: "art. 5")
+_ABBREVIATION = re.compile(r"\b(arts?|inc|incs|al|n|no|nos|par|cap|fl|fls|p|pag|sr|sra|dr|dra|ex|etc)\.$")
+# Início de um artigo, parágrafo, capítulo ou seção. O texto já chega normalizado (minúsculo e sem acentos);
+# o unidecode, aplicado depois do lower(), transforma "§ 1º" em "SS 1o"
+_SECTION_START = re.compile(r"^(art\.?\s*\d|ss\s*\d|paragrafo unico|capitulo\b|secao\b|titulo\b|anexo\b)", re.IGNORECASE)
+
+class Chunk(NamedTuple):
+    text: str
+    token_count: int # tokens do chunk, sem os tokens especiais do modelo
+
+def split_sentences(text: str) -> List[str]:
+    """Divide o texto em sentenças, sem quebrar em abreviações como 'art.' ou 'inc.'."""
+    sentences = []
+    for piece in _SENTENCE_END.split(text.strip()):
+        if not piece:
+            continue
+        if sentences and _ABBREVIATION.search(sentences[-1]):
+            sentences[-1] = f"{sentences[-1]} {piece}"
+        else:
+            sentences.append(piece)
+    return sentences
+
+class TokenChunker:
+    """
+    Divide o texto em chunks que cabem na janela do modelo de embeddings (em tokens do próprio
+    tokenizer do modelo), para que nenhum trecho seja truncado silenciosamente no encode.
+
+    - Os chunks são montados com sentenças inteiras; só uma sentença maior que a janela é
+      dividida no meio, por tokens.
+    - Um novo artigo/parágrafo/capítulo inicia um novo chunk (se o atual já tiver ao menos
+      min_tokens), para que cada chunk fique, sempre que possível, dentro de um único dispositivo.
+    - Entre chunks consecutivos do mesmo trecho, as últimas sentenças (até overlap_tokens)
+      são repetidas no início do chunk seguinte, preservando o contexto na fronteira.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int, overlap_tokens: int = 0, min_tokens: int = 0):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens deve ser positivo.")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(max(overlap_tokens, 0), max_tokens // 2)
+        self.min_tokens = min_tokens
+
+    def _count_tokens(self, sentences: List[str]) -> List[int]:
+        encoded = self.tokenizer(sentences, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def _split_long_sentence(self, sentence: str) -> List[Chunk]:
+        """Divide uma sentença maior que a janela em janelas de tokens (com sobreposição)."""
+        offsets = self.tokenizer(sentence, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+        step = self.max_tokens - self.overlap_tokens
+        pieces = []
+        for start in range(0, len(offsets), step):
+            window = offsets[start:start + self.max_tokens]
+            pieces.append(Chunk(sentence[window[0][0]:window[-1][1]], len(window)))
+            if start + self.max_tokens >= len(offsets):
+                break
+        return pieces
+
+    def chunk(self, text: str) -> List[Chunk]:
+        sentences = split_sentences(text)
+        if not sentences:
+            return []
+        counts = self._count_tokens(sentences)
+
+        chunks: List[Chunk] = []
+        current: List[int] = [] # índices das sentenças do chunk em montagem
+        current_tokens = 0
+
+        def flush(keep_overlap: bool):
+            nonlocal current, current_tokens
+            if not current:
+                return
+            chunks.append(Chunk(" ".join(sentences[i] for i in current), current_tokens))
+            carried: List[int] = []
+            carried_tokens = 0
+            if keep_overlap:
+                for i in reversed(current):
+                    if carried_tokens + counts[i] > self.overlap_tokens:
+                        break
+                    carried.insert(0, i)
+                    carried_tokens += counts[i]
+            current, current_tokens = carried, carried_tokens
+
+        for i, (sentence, count) in enumerate(zip(sentences, counts)):
+            if count > self.max_tokens:
+                flush(keep_overlap=False)
+                chunks.extend(self._split_long_sentence(sentence))
+                continue
+
+            if _SECTION_START.match(sentence) and current_tokens >= self.min_tokens:
+                flush(keep_overlap=False)
+            elif current_tokens + count > self.max_tokens:
+                flush(keep_overlap=True)
+                # A sobreposição não pode impedir que a sentença caiba no chunk
+                while current and current_tokens + count > self.max_tokens:
+                    current_tokens -= counts[current.pop(0)]
+
+            current.append(i)
+            current_tokens += count
+
+        flush(keep_overlap=False)
+        return chunks
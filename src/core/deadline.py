@@ -0,0 +1,58 @@
+import os
+import math
+import time
+from typing import Optional
+
+# Prazo padrão (em segundos) de uma requisição de consulta, quando o cliente não envia o cabeçalho
+REQUEST_TIMEOUT_DEFAULT = float(os.getenv("REQUEST_TIMEOUT_DEFAULT", "60"))
+# Prazo máximo aceito no cabeçalho (evita que um cliente prenda recursos indefinidamente)
+REQUEST_TIMEOUT_MAX = float(os.getenv("REQUEST_TIMEOUT_MAX", "600"))
+
+# Cabeçalho HTTP com o prazo, em segundos, que o cliente está disposto a esperar pela resposta
+DEADLINE_HEADER = "X-Request-Timeout"
+
+class DeadlineExceeded(Exception):
+    """O prazo da requisição se esgotou antes da resposta ficar pronta (a API responde 504)."""
+
+class Deadline:
+    """
+    Prazo absoluto de uma requisição, repassado a cada etapa (embedding, buscas no Qdrant, LLM).
+    Cada etapa usa o tempo restante para limitar o próprio timeout e desiste assim que o prazo
+    se esgota, em vez de continuar trabalhando numa resposta que o cliente não vai mais receber.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def from_header(cls, value: Optional[str]) -> "Deadline":
+        """Cria o prazo a partir do cabeçalho X-Request-Timeout (ou usa o padrão, se ausente/inválido)."""
+        try:
+            timeout = float(value) if value else REQUEST_TIMEOUT_DEFAULT
+        except ValueError:
+            timeout = REQUEST_TIMEOUT_DEFAULT
+        # "nan"/"inf" são aceitos por float(), mas não servem como prazo
+        if not math.isfinite(timeout) or timeout <= 0:
+            timeout = REQUEST_TIMEOUT_DEFAULT
+        return cls(min(timeout, REQUEST_TIMEOUT_MAX))
+
+    def remaining(self) -> float:
+        """Segundos restantes até o prazo (nunca negativo)."""
+        return max(self.expires_at - time.monotonic(), 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str):
+        """Lança DeadlineExceeded se o prazo já se esgotou antes de iniciar a etapa 'stage'."""
+        if self.expired():
+            raise DeadlineExceeded(f"Prazo da requisição ({self.timeout:g}s) esgotado antes de: {stage}.")
+
+    def cap(self, timeout: float) -> float:
+        """Limita um timeout ao tempo restante."""
+        return min(timeout, self.remaining())
+
+    def qdrant_timeout(self) -> int:
+        """Timeout para as chamadas ao Qdrant, que aceita apenas segundos inteiros."""
+        return max(1, math.ceil(self.remaining()))
@@ -1,19 +1,127 @@
+import os
 import re
 import json
+import threading
+import numpy as np
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
+from typing import List, Optional
+from .chunker import Chunk, TokenChunker
+from .projection import Projection
+
+# Tamanho máximo de um chunk, em tokens do modelo (0 = janela máxima do modelo, descontados os tokens especiais)
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "0"))
+# Tokens repetidos entre chunks consecutivos (contexto na fronteira)
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+# Tamanho mínimo do chunk para que um novo artigo/parágrafo inicie outro chunk
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))
+
+# Orçamento de tokens por lote no encode da ingestão: chunks de tamanho parecido são agrupados,
+# com lotes maiores para chunks curtos, reduzindo o padding (que é processado como se fosse texto)
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "16384"))
+EMBED_MAX_BATCH_SIZE = int(os.getenv("EMBED_MAX_BATCH_SIZE", "256"))
+# Modelo de embeddings (trocá-lo exige reindexar a coleção, ver ingestion/reindex.py)
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "all-MiniLM-L6-v2")
+
+# Redução de dimensionalidade dos embeddings (vetores menores no Qdrant e nos upserts):
+#   - "none": dimensão original do modelo (384 no all-MiniLM-L6-v2)
+#   - "pca": PCA ajustado sobre o corpus (arquivo EMBEDDING_PROJECTION_PATH, ver core/projection.py)
+#   - "matryoshka": truncamento para EMBEDDING_DIM, para modelos treinados com Matryoshka
+# Mudar a dimensão exige reindexar a coleção (ingestion/reindex.py), com o mesmo valor na API.
+EMBEDDING_PROJECTION = os.getenv("EMBEDDING_PROJECTION", "none").lower()
+EMBEDDING_PROJECTION_PATH = os.getenv("EMBEDDING_PROJECTION_PATH", "")
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "0"))
 
 class Embedder:
-    def __init__(self, model_name="all-MiniLM-L6-v2", chunk_size=200):
-        self.model = SentenceTransformer(model_name)
-        self.chunk_size = chunk_size
+    def __init__(self, model_name=EMBEDDING_MODEL, max_chunk_tokens: Optional[int] = None, chunk_overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 projection: str = EMBEDDING_PROJECTION, projection_path: str = EMBEDDING_PROJECTION_PATH, dim: int = EMBEDDING_DIM):
+        # Importado aqui: carregar o torch/sentence-transformers é lento e só é necessário ao criar o modelo
+        from sentence_transformers import SentenceTransformer
+        if projection != "none" and dim <= 0:
+            # A dimensão também define o tamanho dos vetores na criação da coleção (ver VectorDB)
+            raise ValueError(f"EMBEDDING_DIM é obrigatório com EMBEDDING_PROJECTION={projection}.")
+        if projection == "matryoshka":
+            # O próprio modelo trunca os vetores nas primeiras 'dim' dimensões
+            self.model = SentenceTransformer(model_name, truncate_dim=dim)
+        else:
+            self.model = SentenceTransformer(model_name)
+
+        self.projection: Optional[Projection] = None
+        if projection == "pca":
+            self.projection = Projection.load(projection_path)
+            if self.projection.output_dim != dim:
+                raise ValueError(f"O PCA em {projection_path} reduz para {self.projection.output_dim} dimensões, não {dim}.")
+        elif projection not in ("none", "matryoshka"):
+            raise ValueError(f"EMBEDDING_PROJECTION inválido: {projection}")
+
+        # Janela do modelo (ex: 256 tokens no all-MiniLM-L6-v2), descontando [CLS] e [SEP]
+        tokenizer = self.model.tokenizer
+        window = self.model.max_seq_length - tokenizer.num_special_tokens_to_add(pair=False)
+        max_chunk_tokens = max_chunk_tokens or CHUNK_MAX_TOKENS or window
+        self.chunker = TokenChunker(tokenizer, min(max_chunk_tokens, window), chunk_overlap_tokens, CHUNK_MIN_TOKENS)
 
     def chunk_text(self, text: str):
-        """Divide o texto em pedaços fixos."""
-        tokens = text.split()
-        for i in range(0, len(tokens), self.chunk_size):
-            yield " ".join(tokens[i : i + self.chunk_size])
-
-    def embed(self, texts):
-        """Transforma lista de textos em embeddings SBERT."""
-        return self.model.encode(texts, convert_to_numpy=True)
+        """Divide o texto em chunks que cabem na janela do modelo (ver TokenChunker)."""
+        for chunk in self.chunker.chunk(text):
+            yield chunk.text
+
+    def chunk_text_with_counts(self, text: str) -> List[Chunk]:
+        """Como chunk_text, mas retorna também o número de tokens de cada chunk (usado no encode por faixas de tamanho)."""
+        return self.chunker.chunk(text)
+
+    @property
+    def dimension(self) -> int:
+        """Dimensão dos vetores gerados (após a projeção, se houver): tamanho dos vetores da coleção."""
+        if self.projection is not None:
+            return self.projection.output_dim
+        return self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts, token_counts: Optional[List[int]] = None):
+        """
+        Transforma lista de textos em embeddings SBERT (reduzidos, se houver projeção). Com token_counts
+        (ex: chunks da ingestão), os textos são ordenados por tamanho e agrupados em lotes com até
+        EMBED_BATCH_TOKENS tokens, para que cada lote seja preenchido (padding) até um tamanho
+        próximo do dos seus textos.
+        """
+        embeddings = self._encode(texts, token_counts)
+        if self.projection is not None:
+            embeddings = self.projection.apply(embeddings)
+        return embeddings
+
+    def _encode(self, texts, token_counts: Optional[List[int]] = None):
+        if token_counts is None or len(texts) <= 1:
+            return self.model.encode(texts, convert_to_numpy=True)
+
+        order = sorted(range(len(texts)), key=lambda i: token_counts[i])
+        embeddings = None
+        batch: List[int] = []
+
+        def encode_batch(indices: List[int]):
+            nonlocal embeddings
+            vectors = self.model.encode([texts[i] for i in indices], batch_size=len(indices), convert_to_numpy=True)
+            if embeddings is None:
+                embeddings = np.empty((len(texts), vectors.shape[1]), dtype=vectors.dtype)
+            embeddings[indices] = vectors
+
+        for i in order:
+            # O lote é preenchido até o maior texto dele, que é o atual (ordem crescente)
+            if batch and ((len(batch) + 1) * max(token_counts[i], 1) > EMBED_BATCH_TOKENS or len(batch) >= EMBED_MAX_BATCH_SIZE):
+                encode_batch(batch)
+                batch = []
+            batch.append(i)
+        encode_batch(batch)
+        return embeddings
+
+    def warmup(self):
+        """Executa um encode descartável, para que a primeira consulta não pague a inicialização preguiçosa do modelo."""
+        self.embed(["aquecimento do modelo de embeddings"])
+
+_shared_embedder = None
+_shared_embedder_lock = threading.Lock()
+
+def get_shared_embedder() -> Embedder:
+    """Instância única do Embedder no processo (o modelo é carregado uma única vez)."""
+    global _shared_embedder
+    with _shared_embedder_lock:
+        if _shared_embedder is None:
+            _shared_embedder = Embedder()
+        return _shared_embedder
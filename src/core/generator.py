@@ -1,12 +1,172 @@
 import os
+import json
+import time
+import asyncio
 import httpx
-import requests
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, AsyncIterator
+from .replicas import ReplicaPool, Replica
+from .deadline import Deadline, DeadlineExceeded
+from .log import get_logger, log_payload
+from .metrics import registry, query_stage, record_timing, QUERY_STAGE_SECONDS, LLM_GENERATED_TOKENS, ERRORS
+
+logger = get_logger(__name__)
 
 # A URL da API do TGI (Text Generation Inference) definida no docker-compose
 LLM_API_URL = os.getenv("LLM_API_URL", "http://localhost:8080")
 
+# Lista de réplicas do TGI separadas por vírgula (se não definida, usa apenas LLM_API_URL)
+LLM_API_URLS = [url.strip() for url in os.getenv("LLM_API_URLS", LLM_API_URL).split(",") if url.strip()]
+
+# Hedging: se a réplica escolhida não responder em LLM_HEDGE_DELAY_MS, dispara a mesma
+# requisição em uma segunda réplica e usa a resposta que chegar primeiro (0 = desativado)
+LLM_HEDGE_DELAY_MS = float(os.getenv("LLM_HEDGE_DELAY_MS", "0"))
+
+# Configuração do pool de conexões HTTP com o TGI
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "16"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "500"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "30"))
+
+# Limite de tokens gerados e vazão estimada do TGI, usados para reduzir max_new_tokens
+# de acordo com o tempo restante no prazo da requisição
+LLM_MAX_NEW_TOKENS = int(os.getenv("LLM_MAX_NEW_TOKENS", "256"))
+LLM_MIN_NEW_TOKENS = int(os.getenv("LLM_MIN_NEW_TOKENS", "32"))
+LLM_TOKENS_PER_SECOND = float(os.getenv("LLM_TOKENS_PER_SECOND", "20"))
+
+try:
+    import h2  # noqa: F401 (HTTP/2 só é usado se o pacote 'h2' estiver instalado)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Marcadores de fim inesperados: a resposta é cortada na primeira ocorrência de qualquer um deles
+END_RESPONSE_PATTERNS = [
+    "--- CONCLUSAO ---",
+    "No entanto, a resposta",
+    "Desculpe, não encontrei informações relevantes",
+    "--- CONTEXTO FORNECIDO ---", 
+    "PERGUNTA DO USUÁRIO:",
+    "INSTRUÇÕES DE RESPOSTA:",
+    "### RESPOSTA:",
+]
+
+# Repetições do PRÓPRIO PROMPT que o LLM pode ter gerado no INÍCIO da resposta (removidas em ordem)
+PROMPT_START_PATTERNS = [
+    "Você é um assistente de IA imparcial e analítico, especializado em regulamentações financeiras brasileiras.",
+    "Sua missão é responder à PERGUNTA DO USUÁRIO com base **EXCLUSIVAMENTE** e **DIRETAMENTE** no CONTEXTO fornecido.",
+    "INSTRUÇÕES DE RESPOSTA:",
+    "1. **Restrição Rigorosa (Anti-Alucinação):",
+    "2. **Acurácia e Concisão:",
+    "3. **Rastreabilidade (Citação Obrigatória):",
+    "4. **Formato:",
+    "--- CONTEXTO FORNECIDO ---", 
+    "PERGUNTA DO USUÁRIO:",
+    "### RESPOSTA:",
+]
+
+_END_RESPONSE_REGEX = re.compile("|".join(re.escape(p) for p in END_RESPONSE_PATTERNS), re.IGNORECASE)
+_PROMPT_START_REGEXES = [re.compile("^" + re.escape(p), re.IGNORECASE) for p in PROMPT_START_PATTERNS]
+_BLANK_LINES_REGEX = re.compile(r'\s*\n\s*\n\s*')
+
+def clean_response(raw_text: str) -> str:
+    """
+    Limpa a resposta bruta do LLM: corta no primeiro marcador de fim, remove repetições
+    do prompt no início e reduz múltiplas quebras de linha para duas.
+    """
+    text_final = raw_text.strip()
+
+    # Remover Conclusões e Marcadores de Fim Inesperados
+    match = _END_RESPONSE_REGEX.search(text_final)
+    if match:
+        text_final = text_final[:match.start()].strip()
+        logger.debug("Padrão de fim '%s' encontrado e texto cortado.", match.group(0))
+
+    # Para remover repetições do prompt do INÍCIO da resposta
+    for pattern in _PROMPT_START_REGEXES:
+        text_final_prev = text_final
+        text_final = pattern.sub('', text_final, 1).strip()
+        if text_final != text_final_prev: # Verifica se houve alguma substituição
+            logger.debug("Padrão de início '%s' removido do texto.", pattern.pattern)
+
+    # Limpeza geral de espaços em branco e quebras de linha extras
+    text_final = _BLANK_LINES_REGEX.sub('\n\n', text_final) # Reduz múltiplas quebras de linha para duas
+    return text_final.strip() # Remove espaços em branco do início e fim
+
+class StreamTrimmer:
+    """
+    Aplica a limpeza de clean_response de forma incremental, sobre os tokens de um stream.
+
+    - Segura os últimos caracteres (o tamanho do maior marcador de fim) até ter certeza de que
+      não formam o começo de um marcador de fim; ao encontrar um marcador, para o stream.
+    - No início, segura o texto enquanto ele ainda puder ser uma repetição do prompt.
+    - Nunca emite espaços em branco finais, para que a redução de quebras de linha
+      seja aplicada sobre sequências completas de espaços.
+    """
+
+    _HOLD_BACK = max(len(p) for p in END_RESPONSE_PATTERNS) - 1
+
+    def __init__(self):
+        self.raw = ""          # texto bruto recebido até agora
+        self.emitted_upto = 0  # posição (em self.raw) até onde o texto já foi emitido
+        self.start_done = False
+        self._start_index = 0  # próximo padrão de início a verificar
+        self.stopped = False
+
+    def feed(self, text: str) -> str:
+        """Recebe um novo trecho do stream e retorna o texto que já pode ser emitido."""
+        if self.stopped:
+            return ""
+        search_from = max(len(self.raw) - self._HOLD_BACK, 0)
+        self.raw += text
+
+        match = _END_RESPONSE_REGEX.search(self.raw, search_from)
+        if match:
+            self.raw = self.raw[:match.start()]
+            self.stopped = True
+            return self._emit(final=True)
+        return self._emit(final=False)
+
+    def finish(self) -> str:
+        """Fim do stream: emite o restante do texto."""
+        self.stopped = True
+        return self._emit(final=True)
+
+    def _strip_prompt_start(self, final: bool) -> bool:
+        """Remove repetições do prompt no início; retorna False se ainda não é possível decidir."""
+        while self._start_index < len(PROMPT_START_PATTERNS):
+            text = self.raw[self.emitted_upto:].lstrip()
+            pattern = PROMPT_START_PATTERNS[self._start_index]
+            if len(text) < len(pattern) and not final and pattern.lower().startswith(text.lower()):
+                return False # o texto ainda pode vir a ser esta repetição do prompt
+            match = _PROMPT_START_REGEXES[self._start_index].match(text)
+            skipped = len(self.raw) - self.emitted_upto - len(text)
+            if match:
+                self.emitted_upto += skipped + match.end()
+            self._start_index += 1
+
+        # Remove os espaços em branco iniciais da resposta
+        self.emitted_upto = len(self.raw) - len(self.raw[self.emitted_upto:].lstrip())
+        return True
+
+    def _emit(self, final: bool) -> str:
+        if not self.start_done:
+            if not self._strip_prompt_start(final):
+                return ""
+            self.start_done = True
+
+        safe_end = len(self.raw) if final else len(self.raw) - self._HOLD_BACK
+        # Não emite espaços em branco finais (podem fazer parte de uma sequência de quebras de linha)
+        safe_end = min(safe_end, len(self.raw[:max(safe_end, 0)].rstrip()))
+        if safe_end <= self.emitted_upto:
+            return ""
+
+        piece = self.raw[self.emitted_upto:safe_end]
+        self.emitted_upto = safe_end
+        return _BLANK_LINES_REGEX.sub('\n\n', piece)
+
 class Generator:
     """
     Cliente para chamar o serviço de geração de texto (LLM) que está sendo executado 
@@ -15,106 +175,303 @@ class Generator:
 
     def __init__(self, prompt_template: str):
         self.prompt_template = prompt_template
-        self.endpoint = f"{LLM_API_URL}/generate"
-        print(f"[GENERATOR] Endpoint LLM configurado para: {self.endpoint}")
+        self.replicas = ReplicaPool(LLM_API_URLS)
+        self.endpoint = ", ".join(f"{r.url}/generate" for r in self.replicas.replicas)
+        self._client: httpx.AsyncClient | None = None
+        self._transport: httpx.AsyncHTTPTransport | None = None
+        self._in_flight = 0
+        self._total_requests = 0
+        self._hedged_total = 0
+        self._hedge_wins = 0
+        logger.info("[GENERATOR] Endpoint LLM configurado para: %s", self.endpoint)
 
-    async def generate_response(self, contexto: str, pergunta: str) -> str:
+    async def start(self):
         """
-        Formata o prompt RAG e chama a API do LLM para gerar a resposta.
+        Cria o cliente HTTP compartilhado (pool de conexões com keep-alive) com o TGI.
+        Deve ser chamado na inicialização da aplicação; se não for, o cliente é criado no primeiro uso.
         """
-        
-        # Formata o prompt final RAG
-        formatted_prompt = self.prompt_template.format(
+        if self._client is not None:
+            return
+        # Sem base_url: cada requisição usa a URL absoluta da réplica escolhida
+        limits = httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        )
+        # HTTP/2 é negociado via TLS (ALPN); em URLs http:// o cliente continua em HTTP/1.1 com keep-alive
+        self._transport = httpx.AsyncHTTPTransport(limits=limits, http2=HTTP2_AVAILABLE)
+        self._client = httpx.AsyncClient(
+            transport=self._transport,
+            timeout=httpx.Timeout(
+                connect=LLM_CONNECT_TIMEOUT,
+                read=LLM_READ_TIMEOUT,
+                write=LLM_CONNECT_TIMEOUT,
+                pool=LLM_POOL_TIMEOUT,
+            ),
+        )
+        logger.info("[GENERATOR] Pool de conexões criado (máx. %s conexões, HTTP/2: %s).", LLM_MAX_CONNECTIONS, HTTP2_AVAILABLE)
+        await self.replicas.start(self._client)
+
+    async def aclose(self):
+        """Fecha o cliente HTTP compartilhado (encerramento da aplicação)."""
+        await self.replicas.stop()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._transport = None
+            logger.info("[GENERATOR] Pool de conexões encerrado.")
+
+    async def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            await self.start()
+        return self._client
+
+    def pool_stats(self) -> Dict[str, Any]:
+        """
+        Estatísticas do pool de conexões com o TGI, para acompanhar a saturação sob carga.
+        'in_flight' próximo de 'max_connections' indica que novas requisições estão esperando conexão.
+        """
+        connections = []
+        pool = getattr(self._transport, "_pool", None)
+        if pool is not None:
+            connections = pool.connections
+        return {
+            "started": self._client is not None,
+            "http2_available": HTTP2_AVAILABLE,
+            "max_connections": LLM_MAX_CONNECTIONS,
+            "max_keepalive_connections": LLM_MAX_KEEPALIVE_CONNECTIONS,
+            "connections_open": len(connections),
+            "connections_idle": sum(1 for c in connections if c.is_idle()),
+            "in_flight": self._in_flight,
+            "total_requests": self._total_requests,
+            "hedge_delay_ms": LLM_HEDGE_DELAY_MS,
+            "hedged_total": self._hedged_total,
+            "hedge_wins": self._hedge_wins,
+            "replicas": self.replicas.stats(),
+        }
+
+    def build_prompt(self, contexto: str, pergunta: str) -> str:
+        """Formata o prompt final RAG."""
+        return self.prompt_template.format(
             contexto=contexto,
             pergunta=pergunta
         )
-        
-        # Configura os parâmetros de geração
-        payload = {
+
+    def _max_new_tokens(self, deadline: Deadline = None) -> int:
+        """
+        Reduz max_new_tokens para o que cabe no tempo restante do prazo (pela vazão estimada
+        LLM_TOKENS_PER_SECOND). Se não couber nem LLM_MIN_NEW_TOKENS, desiste antes de chamar o TGI.
+        """
+        if deadline is None:
+            return LLM_MAX_NEW_TOKENS
+        budget = int(deadline.remaining() * LLM_TOKENS_PER_SECOND)
+        if budget < LLM_MIN_NEW_TOKENS:
+            raise DeadlineExceeded(f"Tempo restante ({deadline.remaining():.1f}s) insuficiente para a geração da resposta.")
+        return min(LLM_MAX_NEW_TOKENS, budget)
+
+    def _request_timeout(self, deadline: Deadline = None):
+        """Timeout HTTP da chamada ao TGI, limitado ao tempo restante do prazo."""
+        if deadline is None:
+            return httpx.USE_CLIENT_DEFAULT
+        return httpx.Timeout(
+            connect=deadline.cap(LLM_CONNECT_TIMEOUT),
+            read=deadline.cap(LLM_READ_TIMEOUT),
+            write=deadline.cap(LLM_CONNECT_TIMEOUT),
+            pool=deadline.cap(LLM_POOL_TIMEOUT),
+        )
+
+    def _build_payload(self, formatted_prompt: str, max_new_tokens: int = LLM_MAX_NEW_TOKENS) -> Dict[str, Any]:
+        """Configura os parâmetros de geração."""
+        return {
             "inputs": formatted_prompt,
             "parameters": {
                 "do_sample": True,
                 "temperature": 0.05,  # Baixa temperatura para respostas factuais
-                "max_new_tokens": 256,
+                "max_new_tokens": max_new_tokens,
                 "repetition_penalty": 1.03,
                 "return_full_text": False,
+                "details": True, # Inclui a contagem de tokens gerados (métricas)
                 "stop_sequences": ["--- CONCLUSAO ---", "No entanto, a resposta", "### RESPOSTA"],
             }
         }
+
+    async def _post_to_replica(self, client: httpx.AsyncClient, replica: Replica, payload: Dict[str, Any], deadline: Deadline = None) -> Any:
+        """Envia a requisição de geração a uma réplica, registrando sucesso/falha para o circuit breaker."""
+        replica.outstanding += 1
+        start = time.monotonic()
+        try:
+            response = await client.post(f"{replica.url}/generate", json=payload, timeout=self._request_timeout(deadline))
+            response.raise_for_status() # Gera exceção para códigos 4xx/5xx
+            data = response.json()
+        except httpx.HTTPStatusError as e:
+            # Erros 4xx são da requisição, não da réplica
+            if e.response.status_code >= 500:
+                self.replicas.record_failure(replica)
+            raise
+        except httpx.HTTPError:
+            # Timeout causado pelo prazo da requisição não é falha da réplica
+            if deadline is None or not deadline.expired():
+                self.replicas.record_failure(replica)
+            raise
+        finally:
+            replica.outstanding -= 1
+        self.replicas.record_success(replica, time.monotonic() - start)
+        return data
+
+    async def _post_generate(self, client: httpx.AsyncClient, payload: Dict[str, Any], deadline: Deadline = None) -> Any:
+        """
+        Chama o /generate na réplica com menos requisições pendentes. Com hedging ativo, se ela
+        não responder em LLM_HEDGE_DELAY_MS, dispara a mesma requisição em uma segunda réplica
+        e retorna a primeira resposta bem-sucedida (a outra é cancelada).
+        """
+        primary = self.replicas.pick()
+        first = asyncio.ensure_future(self._post_to_replica(client, primary, payload, deadline))
+        pending = {first}
+        try:
+            if LLM_HEDGE_DELAY_MS <= 0 or len(self.replicas.replicas) < 2:
+                return await first
+
+            done, _ = await asyncio.wait(pending, timeout=LLM_HEDGE_DELAY_MS / 1000)
+            secondary = None if done else self.replicas.pick(exclude=[primary])
+            if secondary is None:
+                return await first
+
+            self._hedged_total += 1
+            second = asyncio.ensure_future(self._post_to_replica(client, secondary, payload, deadline))
+            pending.add(second)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def generate_response(self, contexto: str, pergunta: str, deadline: Deadline = None) -> str:
+        """
+        Formata o prompt RAG e chama a API do LLM para gerar a resposta.
+        Com um prazo (deadline), o timeout da chamada e max_new_tokens são reduzidos ao tempo
+        restante, e DeadlineExceeded é lançada se o prazo se esgotar.
+        """
+        payload = self._build_payload(self.build_prompt(contexto, pergunta), self._max_new_tokens(deadline))
         
-        async with httpx.AsyncClient(timeout=500) as client:
-            # Faz a chamada POST para a API TGI
-            try:
-                response = await client.post(f"{LLM_API_URL}/generate", json=payload)
-                response.raise_for_status() # Gera exceção para códigos 4xx/5xx
+        client = await self._get_client()
+        self._in_flight += 1
+        self._total_requests += 1
+        # Faz a chamada POST para a API TGI (reaproveitando as conexões do pool)
+        try:
+            with query_stage("llm_generation"):
+                data = await self._post_generate(client, payload, deadline)
+            
+            # Tenta extrair a resposta de uma lista ou de um objeto único.
+            raw_text = None
+            if isinstance(data, list) and data and 'generated_text' in data[0]:
+                raw_text = data[0]['generated_text'].strip()
+                log_payload(logger, "Resposta bruta do LLM", raw_text)
+                data = data[0]
+            elif isinstance(data, dict) and 'generated_text' in data:
+                raw_text = data['generated_text'].strip()
 
-                data = response.json()
+            generated_tokens = (data.get('details') or {}).get('generated_tokens') if isinstance(data, dict) else None
+            if generated_tokens is not None:
+                LLM_GENERATED_TOKENS.observe(generated_tokens)
                 
-                # Tenta extrair a resposta de uma lista ou de um objeto único.
-                raw_text = None
-                if isinstance(data, list) and data and 'generated_text' in data[0]:
-                    raw_text = data[0]['generated_text'].strip()
-                    print(f"DEBUG: Resposta bruta do LLM: {raw_text}")
-                elif isinstance(data, dict) and 'generated_text' in data:
-                    raw_text = data['generated_text'].strip()
-                    
-                if raw_text:
-                    text_final = raw_text.strip()
-                    
-                    # Remover Conclusões e Marcadores de Fim Inesperados
-                    end_response_patterns = [
-                        r"--- CONCLUSAO ---",
-                        r"No entanto, a resposta",
-                        r"Desculpe, não encontrei informações relevantes",
-                        r"--- CONTEXTO FORNECIDO ---", 
-                        r"PERGUNTA DO USUÁRIO:",
-                        r"INSTRUÇÕES DE RESPOSTA:",
-                        r"### RESPOSTA:",
-                    ]    
-                    
-                    for pattern in end_response_patterns:
-                        match = re.search(pattern, text_final, re.IGNORECASE | re.DOTALL) 
-                        if match:
-                            text_final = text_final[:match.start()].strip()
-                            print(f"DEBUG: Padrão de fim '{pattern}' encontrado e texto cortado.")
-
-                    # Remover Repetições do PRÓPRIO PROMPT que o LLM pode ter gerado.
-                    prompt_start_patterns = [
-                        r"^Você é um assistente de IA imparcial e analítico, especializado em regulamentações financeiras brasileiras.",
-                        r"^Sua missão é responder à PERGUNTA DO USUÁRIO com base \*\*EXCLUSIVAMENTE\*\* e \*\*DIRETAMENTE\*\* no CONTEXTO fornecido\.",
-                        r"^INSTRUÇÕES DE RESPOSTA:",
-                        r"^1\. \*\*Restrição Rigorosa \(Anti-Alucinação\):",
-                        r"^2\. \*\*Acurácia e Concisão:",
-                        r"^3\. \*\*Rastreabilidade \(Citação Obrigatória\):",
-                        r"^4\. \*\*Formato:",
-                        r"^--- CONTEXTO FORNECIDO ---", 
-                        r"^PERGUNTA DO USUÁRIO:",
-                        r"^### RESPOSTA:",
-                    ]
-                    
-                    # Para remover repetições do prompt do INÍCIO da resposta
-                    for pattern in prompt_start_patterns:
-                        text_final_prev = text_final
-                        text_final = re.sub(pattern, '', text_final, 1, flags=re.IGNORECASE | re.DOTALL).strip()
-                        if text_final != text_final_prev: # Verifica se houve alguma substituição
-                            print(f"DEBUG: Padrão de início '{pattern}' removido do texto.")
-                               
-                    # Limpeza geral de espaços em branco e quebras de linha extras
-                    text_final = re.sub(r'\s*\n\s*\n\s*', '\n\n', text_final) # Reduz múltiplas quebras de linha para duas
-                    text_final = text_final.strip() # Remove espaços em branco do início e fim
-                            
-                    # Se o LLM parou logo após a resposta, isso será a resposta.
-                    return text_final
-                
-                print(f"DEBUG: Formato de resposta do LLM inesperado: {data}")
-                return "Erro: Formato de resposta do LLM inválido."
+            if raw_text:
+                # Se o LLM parou logo após a resposta, isso será a resposta.
+                return clean_response(raw_text)
+            
+            logger.warning("Formato de resposta do LLM inesperado: %s", data)
+            return "Erro: Formato de resposta do LLM inválido."
+
+        except httpx.TimeoutException:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("Prazo da requisição esgotado durante a geração da resposta.")
+            ERRORS.inc(stage="llm_generation")
+            return "Erro: O LLM excedeu o tempo limite (Timeout)."
+        except httpx.HTTPError as e:
+            ERRORS.inc(stage="llm_generation")
+            return f"Erro ao conectar ou receber resposta do LLM: {e}"
+        except Exception as e:
+            ERRORS.inc(stage="llm_generation")
+            return f"Erro inesperado no gerador: {e}"
+        finally:
+            self._in_flight -= 1
+
+    async def generate_stream(self, contexto: str, pergunta: str, deadline: Deadline = None) -> AsyncIterator[str]:
+        """
+        Versão em streaming de generate_response: consome o endpoint /generate_stream do TGI
+        (Server-Sent Events) e produz os trechos da resposta à medida que os tokens chegam.
+        A mesma limpeza de generate_response (marcadores de fim, repetições do prompt e
+        quebras de linha extras) é aplicada de forma incremental pelo StreamTrimmer.
+        Erros de conexão/timeout são propagados como exceções do httpx; com um prazo (deadline),
+        o stream é interrompido com DeadlineExceeded quando o prazo se esgota.
+        """
+        payload = self._build_payload(self.build_prompt(contexto, pergunta), self._max_new_tokens(deadline))
+        trimmer = StreamTrimmer()
+
+        client = await self._get_client()
+        # O streaming não usa hedging: os tokens já estão sendo enviados ao cliente
+        replica = self.replicas.pick()
+        replica.outstanding += 1
+        self._in_flight += 1
+        self._total_requests += 1
+        start = time.monotonic()
+        generated_tokens = 0
+        try:
+            async with client.stream("POST", f"{replica.url}/generate_stream", json=payload, timeout=self._request_timeout(deadline)) as response:
+                try:
+                    response.raise_for_status()
+                except httpx.HTTPStatusError:
+                    if response.status_code >= 500:
+                        self.replicas.record_failure(replica)
+                    raise
+                async for line in response.aiter_lines():
+                    if deadline is not None and deadline.expired():
+                        raise DeadlineExceeded("Prazo da requisição esgotado durante a geração da resposta.")
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    if "error" in event:
+                        raise RuntimeError(f"Erro do LLM durante o streaming: {event['error']}")
 
-            except requests.exceptions.Timeout:
-                return "Erro: O LLM excedeu o tempo limite (Timeout)."
-            except requests.exceptions.RequestException as e:
-                return f"Erro ao conectar ou receber resposta do LLM: {e}"
-            except Exception as e:
-                return f"Erro inesperado no gerador: {e}"
+                    token = event.get("token") or {}
+                    if token.get("special"):
+                        continue
+                    generated_tokens += 1
+                    if generated_tokens == 1:
+                        # Tempo até o primeiro token (inclui a espera na fila do TGI e o prefill)
+                        QUERY_STAGE_SECONDS.observe(time.monotonic() - start, stage="llm_first_token")
+                        record_timing("llm_first_token", time.monotonic() - start)
+                    piece = trimmer.feed(token.get("text", ""))
+                    if piece:
+                        yield piece
+                    # Marcador de fim encontrado: encerra o stream (e a geração no TGI)
+                    if trimmer.stopped:
+                        break
+
+            elapsed = time.monotonic() - start
+            self.replicas.record_success(replica, elapsed)
+            QUERY_STAGE_SECONDS.observe(elapsed, stage="llm_generation")
+            record_timing("llm_generation", elapsed)
+            LLM_GENERATED_TOKENS.observe(generated_tokens)
+            piece = trimmer.finish()
+            if piece:
+                yield piece
+        except httpx.TransportError as e:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded("Prazo da requisição esgotado durante a geração da resposta.") from e
+            self.replicas.record_failure(replica)
+            ERRORS.inc(stage="llm_generation")
+            raise
+        finally:
+            replica.outstanding -= 1
+            self._in_flight -= 1
 
 # Template RAG
 RAG_PROMPT_TEMPLATE = """
@@ -143,4 +500,6 @@ PERGUNTA DO USUÁRIO: {pergunta}
 # Inicialização da instância do Gerador
 generator = Generator(prompt_template=RAG_PROMPT_TEMPLATE)
 
+registry.gauge("rag_llm_in_flight", "Chamadas ao LLM em andamento.", lambda: generator._in_flight)
+
 # response = generator.generate_response(contexto=contexto_final, pergunta=query)
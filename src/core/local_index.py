@@ -0,0 +1,431 @@
+import os
+import json
+import threading
+import numpy as np
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from qdrant_client.models import (
+    Filter,
+    FieldCondition,
+    MatchValue,
+    MatchAny,
+    NestedCondition,
+    PointStruct,
+    ScoredPoint,
+    SparseVector,
+    SearchParams,
+)
+from .vectordb import (
+    VectorDB,
+    DEFAULT_VECTOR_SIZE,
+    default_vector_size,
+    VECTOR_DATATYPE,
+    Datatype,
+    document_collection_name,
+    build_document_point,
+    with_date_range,
+    DEFAULT_SEARCH_PARAMS,
+    neighbours_filter,
+    _hit_to_result,
+    _results_by_key,
+)
+from .log import get_logger
+
+try:
+    import hnswlib
+except ImportError: # sem o hnswlib, toda busca é exata (força bruta com NumPy)
+    hnswlib = None
+
+logger = get_logger(__name__)
+
+# Índice vetorial embutido no processo, usado no lugar do Qdrant quando VECTOR_BACKEND=local
+# (benchmarks, CI e instalações pequenas, com um único processo). Cada coleção fica num diretório:
+#   - vectors.bin: vetores normalizados (float16 ou float32, ver VECTOR_DATATYPE), lidos por memory-map
+#   - points.jsonl: log (apenas acréscimos) de ID, linha e payload de cada ponto gravado ou removido
+#   - hnsw.bin: grafo HNSW (opcional, pacote hnswlib), criado quando a coleção passa de LOCAL_HNSW_MIN_POINTS
+# Fica fora do STORAGE_DIR, que é servido publicamente em /files (o log guarda o texto e os cargos de cada chunk)
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "/app/data/vector_index")
+# Abaixo desse número de pontos, a busca é sempre exata (NumPy); acima, usa o HNSW se o hnswlib estiver instalado
+LOCAL_HNSW_MIN_POINTS = int(os.getenv("LOCAL_HNSW_MIN_POINTS", "20000"))
+# Filtros que selecionam até esse número de pontos (ex: um cargo com poucos documentos) usam a busca exata
+# sobre o subconjunto, mais rápida e precisa que percorrer o grafo descartando os pontos filtrados
+LOCAL_HNSW_FULL_SCAN_THRESHOLD = int(os.getenv("LOCAL_HNSW_FULL_SCAN_THRESHOLD", "10000"))
+LOCAL_HNSW_M = int(os.getenv("LOCAL_HNSW_M", "16"))
+LOCAL_HNSW_EF_CONSTRUCT = int(os.getenv("LOCAL_HNSW_EF_CONSTRUCT", "100"))
+LOCAL_HNSW_EF = int(os.getenv("LOCAL_HNSW_EF", "128"))
+
+# Campos com índice invertido (valor -> linhas): os filtros do VectorDB usam apenas estes campos e 'last_updated'
+_INDEXED_FIELDS = ("allowed_roles", "source", "chunk_index")
+# Linhas avaliadas por vez na busca exata (limita a cópia float16 -> float32 em memória)
+_SCAN_BLOCK = 65536
+
+def _timestamp(value) -> float:
+    """Converte um datetime ou string ISO em timestamp (sem fuso horário = UTC, como no Qdrant)."""
+    if value is None:
+        return np.nan
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(str(value))
+        except ValueError:
+            return np.nan
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def _as_values(value) -> list:
+    return value if isinstance(value, list) else [value]
+
+class LocalIndex:
+    """
+    Uma coleção do índice local: vetores num arquivo memory-mapped, payloads em memória
+    (recarregados do log points.jsonl) e, para coleções grandes, um grafo HNSW.
+    """
+
+    def __init__(self, path: str, dim: int, dtype=np.float16):
+        self.path = path
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.ids: List[Any] = []                    # linha -> ID do ponto
+        self.payloads: List[Optional[dict]] = []    # linha -> payload (None = removido)
+        self.rows: Dict[Any, int] = {}              # ID do ponto -> linha
+        self.timestamps = np.empty(0, dtype=np.float64)
+        self.keyword_rows: Dict[str, Dict[Any, set]] = {field: {} for field in _INDEXED_FIELDS}
+        self.vectors = None
+        self.hnsw = None
+        self.lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._load()
+
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+    def _meta_path(self):
+        return os.path.join(self.path, "meta.json")
+
+    def _load(self):
+        meta_path = self._meta_path()
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["dim"] != self.dim:
+                logger.warning("Aviso: índice local '%s' tem vetores de %s dimensões (esperado: %s); reindexe após mudar o modelo ou a projeção.", self.path, meta["dim"], self.dim)
+            self.dim, self.dtype = meta["dim"], np.dtype(meta["dtype"])
+            self._open_vectors(meta["capacity"])
+        else:
+            self._open_vectors(1024)
+
+        log_path = os.path.join(self.path, "points.jsonl")
+        if os.path.exists(log_path):
+            with open(log_path, encoding="utf-8") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    if entry.get("deleted"):
+                        self._forget(entry["id"])
+                    else:
+                        self._remember(entry["id"], entry["row"], entry["payload"])
+        self._load_hnsw()
+
+    def _open_vectors(self, capacity: int):
+        """Abre (ou cria/aumenta) o arquivo de vetores com espaço para 'capacity' linhas."""
+        vectors_path = os.path.join(self.path, "vectors.bin")
+        current = os.path.getsize(vectors_path) // (self.dim * self.dtype.itemsize) if os.path.exists(vectors_path) else 0
+        if current < capacity:
+            with open(vectors_path, "ab") as f:
+                f.truncate(capacity * self.dim * self.dtype.itemsize)
+        self.vectors = np.memmap(vectors_path, dtype=self.dtype, mode="r+", shape=(capacity, self.dim))
+        with open(self._meta_path(), "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "dtype": self.dtype.name, "capacity": capacity}, f)
+        if self.hnsw is not None:
+            self.hnsw.resize_index(capacity)
+
+    def _remember(self, point_id, row: int, payload: dict):
+        """Registra o payload da linha nas estruturas em memória (índices invertidos e datas)."""
+        self._forget(point_id)
+        while len(self.payloads) <= row:
+            self.ids.append(None)
+            self.payloads.append(None)
+        if len(self.timestamps) <= row:
+            self.timestamps = np.concatenate([self.timestamps, np.full(max(row + 1, 2 * len(self.timestamps)) - len(self.timestamps), np.nan)])
+        self.ids[row], self.payloads[row], self.rows[point_id] = point_id, payload, row
+        self.timestamps[row] = _timestamp(payload.get("last_updated"))
+        for field in _INDEXED_FIELDS:
+            for value in _as_values(payload.get(field)):
+                if value is not None:
+                    self.keyword_rows[field].setdefault(value, set()).add(row)
+
+    def _forget(self, point_id):
+        row = self.rows.pop(point_id, None)
+        if row is None:
+            return
+        payload = self.payloads[row]
+        for field in _INDEXED_FIELDS:
+            for value in _as_values(payload.get(field)):
+                self.keyword_rows[field].get(value, set()).discard(row)
+        self.payloads[row] = None
+        self.timestamps[row] = np.nan
+
+    def upsert(self, points: List[Any]):
+        """Grava (ou sobrescreve, pelo ID) pontos com vetor denso normalizado e payload."""
+        if not points:
+            return
+        with self.lock:
+            rows = [self.rows.get(p.id) for p in points]
+            next_row = len(self.payloads)
+            for i, row in enumerate(rows):
+                if row is None:
+                    rows[i], next_row = next_row, next_row + 1
+            if next_row > self.vectors.shape[0]:
+                self._open_vectors(max(next_row, 2 * self.vectors.shape[0]))
+
+            vectors = np.asarray([p.vector for p in points], dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms > 0, norms, 1.0)
+            self.vectors[rows] = vectors.astype(self.dtype)
+            self.vectors.flush()
+
+            with open(os.path.join(self.path, "points.jsonl"), "a", encoding="utf-8") as f:
+                for point, row in zip(points, rows):
+                    payload = dict(point.payload or {})
+                    self._remember(point.id, row, payload)
+                    f.write(json.dumps({"id": point.id, "row": row, "payload": payload}, ensure_ascii=False) + "\n")
+
+            if self.hnsw is not None:
+                self.hnsw.add_items(vectors, rows)
+                self._save_hnsw()
+            elif hnswlib is not None and self.count >= LOCAL_HNSW_MIN_POINTS:
+                self._build_hnsw()
+
+    def delete(self, point_ids: List[Any]):
+        with self.lock:
+            with open(os.path.join(self.path, "points.jsonl"), "a", encoding="utf-8") as f:
+                for point_id in point_ids:
+                    if point_id in self.rows:
+                        self._forget(point_id)
+                        f.write(json.dumps({"id": point_id, "deleted": True}) + "\n")
+
+    # --- HNSW ---
+
+    def _build_hnsw(self):
+        rows = np.fromiter(self.rows.values(), dtype=np.int64)
+        logger.info("Construindo o índice HNSW de '%s' (%s pontos)...", self.path, len(rows))
+        self.hnsw = hnswlib.Index(space="ip", dim=self.dim)
+        self.hnsw.init_index(max_elements=self.vectors.shape[0], M=LOCAL_HNSW_M, ef_construction=LOCAL_HNSW_EF_CONSTRUCT)
+        for start in range(0, len(rows), _SCAN_BLOCK):
+            block = rows[start:start + _SCAN_BLOCK]
+            self.hnsw.add_items(np.asarray(self.vectors[block], dtype=np.float32), block)
+        self._save_hnsw()
+
+    def _save_hnsw(self):
+        self.hnsw.save_index(os.path.join(self.path, "hnsw.bin"))
+
+    def _load_hnsw(self):
+        if hnswlib is None or self.count < LOCAL_HNSW_MIN_POINTS:
+            return
+        hnsw_path = os.path.join(self.path, "hnsw.bin")
+        if not os.path.exists(hnsw_path):
+            self._build_hnsw()
+            return
+        self.hnsw = hnswlib.Index(space="ip", dim=self.dim)
+        self.hnsw.load_index(hnsw_path, max_elements=self.vectors.shape[0])
+        # Linhas gravadas depois do último save (ex: queda do processo) entram no grafo agora
+        missing = np.setdiff1d(np.fromiter(self.rows.values(), dtype=np.int64), np.asarray(self.hnsw.get_ids_list(), dtype=np.int64))
+        if len(missing):
+            self.hnsw.add_items(np.asarray(self.vectors[missing], dtype=np.float32), missing)
+
+    # --- Filtros ---
+
+    def filter_mask(self, query_filter: Optional[Filter]) -> np.ndarray:
+        """Máscara booleana (por linha) dos pontos que satisfazem o filtro (mesma semântica do Qdrant)."""
+        alive = np.zeros(len(self.payloads), dtype=bool)
+        alive[list(self.rows.values())] = True
+        if query_filter is None:
+            return alive
+        return alive & self._filter_mask(query_filter)
+
+    def _rows_mask(self, rows) -> np.ndarray:
+        mask = np.zeros(len(self.payloads), dtype=bool)
+        mask[list(rows)] = True
+        return mask
+
+    def _filter_mask(self, query_filter: Filter) -> np.ndarray:
+        mask = np.ones(len(self.payloads), dtype=bool)
+        for condition in _as_values(query_filter.must or []):
+            mask &= self._condition_mask(condition)
+        if query_filter.should:
+            should = np.zeros(len(self.payloads), dtype=bool)
+            for condition in _as_values(query_filter.should):
+                should |= self._condition_mask(condition)
+            mask &= should
+        for condition in _as_values(query_filter.must_not or []):
+            mask &= ~self._condition_mask(condition)
+        return mask
+
+    def _condition_mask(self, condition) -> np.ndarray:
+        if isinstance(condition, Filter):
+            return self._filter_mask(condition)
+        if isinstance(condition, NestedCondition):
+            # Algum item da lista (ex: duplicate_sources) satisfaz todas as condições (apenas MatchValue)
+            nested = condition.nested
+            return self._rows_mask(
+                row for row in self.rows.values()
+                if any(all(c.match.value in _as_values(item.get(c.key)) for c in _as_values(nested.filter.must or []))
+                       for item in self.payloads[row].get(nested.key) or [])
+            )
+        if not isinstance(condition, FieldCondition):
+            raise ValueError(f"Condição não suportada pelo índice local: {type(condition).__name__}")
+
+        if condition.range is not None:
+            if condition.key != "last_updated":
+                raise ValueError(f"Intervalo não suportado pelo índice local no campo '{condition.key}'.")
+            mask = ~np.isnan(self.timestamps[:len(self.payloads)])
+            bounds = condition.range
+            for bound, compare in ((bounds.gte, np.greater_equal), (bounds.gt, np.greater), (bounds.lte, np.less_equal), (bounds.lt, np.less)):
+                if bound is not None:
+                    mask &= compare(self.timestamps[:len(self.payloads)], _timestamp(bound))
+            return mask
+
+        if isinstance(condition.match, MatchValue):
+            values = [condition.match.value]
+        elif isinstance(condition.match, MatchAny):
+            values = condition.match.any
+        else:
+            raise ValueError(f"Condição não suportada pelo índice local no campo '{condition.key}'.")
+
+        if condition.key in self.keyword_rows:
+            index = self.keyword_rows[condition.key]
+            return self._rows_mask(set().union(*(index.get(v, set()) for v in values)))
+        # Campos sem índice invertido: avaliação ponto a ponto
+        wanted = set(values)
+        return self._rows_mask(
+            row for row in self.rows.values()
+            if wanted.intersection(_as_values(self.payloads[row].get(condition.key)))
+        )
+
+    # --- Busca ---
+
+    def search(self, query_vector, top_k: int, query_filter: Optional[Filter] = None, search_params: Optional[SearchParams] = None) -> List[ScoredPoint]:
+        """Busca por similaridade; search_params aceita hnsw_ef e exact (a quantização não se aplica ao índice local)."""
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        query = query / norm if norm > 0 else query
+
+        with self.lock:
+            mask = self.filter_mask(query_filter)
+            candidates = np.flatnonzero(mask)
+            if len(candidates) == 0:
+                return []
+            exact = search_params is not None and search_params.exact
+            if self.hnsw is not None and not exact and len(candidates) > LOCAL_HNSW_FULL_SCAN_THRESHOLD:
+                rows, scores = self._search_hnsw(query, top_k, mask, search_params.hnsw_ef if search_params else None)
+            else:
+                rows, scores = self._search_exact(query, top_k, candidates)
+            return [
+                ScoredPoint(id=self.ids[row], version=0, score=float(score), payload=self.payloads[row])
+                for row, score in zip(rows, scores)
+            ]
+
+    def _search_exact(self, query: np.ndarray, top_k: int, candidates: np.ndarray):
+        """Busca exata (produto interno dos vetores normalizados = similaridade do cosseno) sobre as linhas candidatas."""
+        scores = np.empty(len(candidates), dtype=np.float32)
+        for start in range(0, len(candidates), _SCAN_BLOCK):
+            block = candidates[start:start + _SCAN_BLOCK]
+            scores[start:start + len(block)] = np.asarray(self.vectors[block], dtype=np.float32) @ query
+        k = min(top_k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return candidates[best], scores[best]
+
+    def _search_hnsw(self, query: np.ndarray, top_k: int, mask: np.ndarray, hnsw_ef: Optional[int] = None):
+        # O filtro é aplicado durante a travessia do grafo (os pontos filtrados não ocupam vagas no top_k)
+        self.hnsw.set_ef(max(hnsw_ef or LOCAL_HNSW_EF, top_k))
+        labels, distances = self.hnsw.knn_query(query, k=min(top_k, int(mask.sum())), filter=lambda row: bool(mask[row]))
+        # No espaço "ip", a distância do hnswlib é 1 - produto interno
+        return labels[0], 1.0 - distances[0]
+
+    def scroll(self, query_filter: Optional[Filter], limit: Optional[int] = None) -> List[ScoredPoint]:
+        with self.lock:
+            rows = np.flatnonzero(self.filter_mask(query_filter))[:limit]
+            return [ScoredPoint(id=self.ids[row], version=0, score=0.0, payload=self.payloads[row]) for row in rows]
+
+class LocalVectorDB(VectorDB):
+    """
+    VectorDB sobre o índice local (mesma interface: add_documents, search, search_batch,
+    search_documents_batch e get_chunks_by_metadata[_batch], com os mesmos filtros de segurança).
+    Guarda apenas o vetor denso: a busca híbrida usa só o ramo denso, como nas coleções sem vetor esparso.
+    A ingestão pela API (process_pdf, remoção de documentos, reindexação) continua exigindo o Qdrant.
+    """
+
+    def __init__(self, collection_name="documents", vector_size=DEFAULT_VECTOR_SIZE, path=LOCAL_INDEX_DIR, **kwargs):
+        self.client = None
+        self.collection_name = collection_name
+        self.documents_collection_name = document_collection_name(collection_name)
+        vector_size = vector_size or default_vector_size()
+        self.sparse_enabled = False
+        dtype = np.float16 if VECTOR_DATATYPE == Datatype.FLOAT16 else np.float32
+        self.index = LocalIndex(os.path.join(path, self.collection_name), vector_size, dtype)
+        self.documents_index = LocalIndex(os.path.join(path, self.documents_collection_name), vector_size, dtype)
+        self.vector_size = self.index.dim
+        logger.info("Índice local '%s' aberto com %s pontos (HNSW: %s).", self.collection_name, self.index.count, self.index.hnsw is not None)
+
+    def count(self) -> int:
+        return self.index.count
+
+    def add_documents(self, docs):
+        points = []
+        for doc in docs:
+            point_id = doc.pop("point_id")
+            doc.pop("sparse_embedding", None)
+            embedding = doc.pop("embedding")
+            points.append(PointStruct(id=point_id, vector=list(map(float, embedding)), payload=doc))
+        self.index.upsert(points)
+        logger.info("%s documentos adicionados ao índice local '%s'.", len(points), self.collection_name)
+
+        vectors_by_source = {}
+        payload_by_source = {}
+        for point in points:
+            source = point.payload.get("source")
+            if not source:
+                continue
+            vectors_by_source.setdefault(source, []).append(point.vector)
+            payload_by_source.setdefault(source, {
+                key: point.payload[key]
+                for key in ("display_name", "file_in_storage", "last_updated", "allowed_roles")
+                if key in point.payload
+            })
+        self.add_document_vectors(vectors_by_source, payload_by_source)
+
+    def add_document_vectors(self, vectors_by_source: Dict[str, list], payload_by_source: Dict[str, Dict[str, Any]] = None):
+        if not vectors_by_source:
+            return
+        payload_by_source = payload_by_source or {}
+        self.documents_index.upsert([
+            build_document_point(source, vectors, payload_by_source.get(source, {}))
+            for source, vectors in vectors_by_source.items()
+        ])
+
+    def search(self, query_vector, top_k=5, query_filter: Filter = None, sparse_vector: SparseVector = None, updated_after: datetime = None, updated_before: datetime = None, timeout: int = None, search_params: SearchParams = None):
+        query_filter = with_date_range(query_filter, updated_after, updated_before)
+        return [_hit_to_result(h) for h in self.index.search(query_vector, top_k, query_filter, search_params or DEFAULT_SEARCH_PARAMS)]
+
+    def search_batch(self, query_vectors, top_k=5, query_filters: List[Filter] = None, sparse_vectors: List[SparseVector] = None, timeout: int = None, search_params: SearchParams = None) -> List[List[Dict[str, Any]]]:
+        query_filters = query_filters or [None] * len(query_vectors)
+        return [
+            [_hit_to_result(h) for h in self.index.search(vector, top_k, query_filter, search_params or DEFAULT_SEARCH_PARAMS)]
+            for vector, query_filter in zip(query_vectors, query_filters)
+        ]
+
+    def search_documents_batch(self, query_vectors, top_k=10, query_filters: List[Filter] = None, timeout: int = None, search_params: SearchParams = None) -> List[List[str]]:
+        query_filters = query_filters or [None] * len(query_vectors)
+        return [
+            [h.payload["source"] for h in self.documents_index.search(vector, top_k, query_filter, search_params or DEFAULT_SEARCH_PARAMS) if h.payload.get("source")]
+            for vector, query_filter in zip(query_vectors, query_filters)
+        ]
+
+    def get_chunks_by_metadata(self, source: str, chunk_index: int, user_role: str) -> List[Dict[str, Any]]:
+        return self.get_chunks_by_metadata_batch([(source, chunk_index)], user_role)
+
+    def get_chunks_by_metadata_batch(self, keys: List[tuple], user_role: str, timeout: int = None) -> List[Dict[str, Any]]:
+        if not keys:
+            return []
+        return _results_by_key(self.index.scroll(neighbours_filter(keys, user_role), limit=None), keys)
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+import logging.handlers
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+# Nível mínimo dos logs da aplicação (DEBUG, INFO, WARNING, ERROR)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Formato da saída: "json" (uma linha JSON por registro) ou "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+
+# Logs com payload grande (contexto enviado ao LLM, resposta bruta do LLM) ficam desligados por padrão:
+# só são registrados em nível DEBUG e numa fração LOG_PAYLOAD_SAMPLE_RATE (0 a 1) das requisições,
+# truncados em LOG_PAYLOAD_MAX_CHARS caracteres
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0"))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+
+# Logger raiz da aplicação: todos os módulos usam loggers filhos dele (ex: "src.core.generator")
+APP_LOGGER_NAME = __name__.split(".")[0]
+
+# ID da requisição atual, incluído em todos os registros feitos durante a requisição
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Atributos padrão de um LogRecord; os demais (passados via 'extra') vão como campos no JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+class RequestIdFilter(logging.Filter):
+    """Anota o registro com o ID da requisição (executado na thread que fez o log, antes da fila)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+_listener: logging.handlers.QueueListener = None
+
+def configure_logging():
+    """
+    Configura o logger da aplicação (idempotente). Os registros são colocados numa fila
+    em memória (QueueHandler) e escritos no stdout por uma thread separada (QueueListener),
+    de modo que a escrita não bloqueia o caminho da requisição.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if LOG_FORMAT == "json":
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    queue_handler = logging.handlers.QueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RequestIdFilter())
+
+    app_logger = logging.getLogger(APP_LOGGER_NAME)
+    app_logger.handlers = [queue_handler]
+    app_logger.setLevel(LOG_LEVEL)
+    app_logger.propagate = False
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+def _reset_after_fork():
+    # A thread do QueueListener não sobrevive ao fork (ex: workers do gunicorn com preload_app):
+    # o processo filho recria a fila e a thread de escrita, senão os logs ficariam presos na fila
+    global _listener
+    if _listener is not None:
+        _listener = None
+        configure_logging()
+
+def shutdown_logging():
+    """Esvazia a fila e encerra a thread de escrita dos logs."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+atexit.register(shutdown_logging)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def get_logger(name: str) -> logging.Logger:
+    """Retorna o logger do módulo, configurando o logging da aplicação no primeiro uso."""
+    configure_logging()
+    return logging.getLogger(name)
+
+def log_payload(logger: logging.Logger, message: str, payload: str):
+    """
+    Registra um payload grande (em DEBUG), apenas se amostrado por LOG_PAYLOAD_SAMPLE_RATE.
+    Com a configuração padrão (taxa 0), não faz nada nem formata o payload.
+    """
+    if LOG_PAYLOAD_SAMPLE_RATE <= 0 or not logger.isEnabledFor(logging.DEBUG):
+        return
+    if random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    text = str(payload)
+    logger.debug("%s: %s", message, text[:LOG_PAYLOAD_MAX_CHARS], extra={"payload_chars": len(text), "truncated": len(text) > LOG_PAYLOAD_MAX_CHARS})
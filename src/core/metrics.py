@@ -0,0 +1,280 @@
+import os
+import json
+import time
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Registro de métricas no formato texto do Prometheus (exposto em GET /metrics).
+# Implementação mínima (contadores, gauges e histogramas com labels), sem dependências externas.
+
+# Com vários workers (gunicorn), cada processo grava periodicamente os próprios valores neste diretório
+# (um arquivo por PID) e o /metrics soma os de todos; vazio = apenas os valores do processo atual
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+# Intervalo (em segundos) entre as gravações dos valores de cada worker
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+PROMPT_CHARS_BUCKETS = (500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+TOKENS_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024)
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self, values: Optional[Dict[Tuple[str, ...], Any]] = None) -> List[str]:
+        if values is None:
+            values = self.snapshot()
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples(values)
+
+    @abstractmethod
+    def snapshot(self) -> Dict[Tuple[str, ...], Any]:
+        """Cópia dos valores da métrica, por combinação de labels."""
+
+    @abstractmethod
+    def merge(self, a: Any, b: Any) -> Any:
+        """Soma os valores de dois processos para a mesma combinação de labels."""
+
+    @abstractmethod
+    def _samples(self, values: Dict[Tuple[str, ...], Any]) -> List[str]:
+        """Linhas com os valores da métrica (uma por combinação de labels)."""
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, a: float, b: float) -> float:
+        return a + b
+
+    def _samples(self, values: Dict[Tuple[str, ...], float]) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in sorted(values.items())]
+
+class Gauge(_Metric):
+    """Gauge lido no momento da coleta, a partir de uma função (ex: profundidade da fila do LLM)."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, function: Callable[[], float]):
+        super().__init__(name, documentation)
+        self._function = function
+
+    def snapshot(self) -> Dict[Tuple[str, ...], float]:
+        return {(): float(self._function())}
+
+    def merge(self, a: float, b: float) -> float:
+        return a + b
+
+    def _samples(self, values: Dict[Tuple[str, ...], float]) -> List[str]:
+        return [f"{self.name} {_format_value(values.get((), 0.0))}"]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * len(self.buckets))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[List[int], float]]:
+        with self._lock:
+            return {key: (list(counts), self._sums[key]) for key, counts in self._counts.items()}
+
+    def merge(self, a: Tuple[List[int], float], b: Tuple[List[int], float]) -> Tuple[List[int], float]:
+        return [x + y for x, y in zip(a[0], b[0])], a[1] + b[1]
+
+    def _samples(self, values: Dict[Tuple[str, ...], Tuple[List[int], float]]) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+def _write_json(path: str, data):
+    # Grava num arquivo temporário e o troca de uma vez: quem lê nunca vê um arquivo pela metade
+    temp = f"{path}.tmp"
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(temp, path)
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, function: Callable[[], float]) -> Gauge:
+        return self._register(Gauge(name, documentation, function))
+
+    def _register(self, metric: _Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Texto no formato de exposição do Prometheus (text/plain; version=0.0.4). Com METRICS_MULTIPROC_DIR,
+        soma os valores gravados por todos os workers (os deste processo são gravados antes da leitura).
+        """
+        merged = self._merge_processes() if METRICS_MULTIPROC_DIR else {}
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(merged.get(metric.name) if METRICS_MULTIPROC_DIR else None))
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, pid: Optional[int] = None):
+        """Grava os valores deste processo em METRICS_MULTIPROC_DIR/<pid>.json (troca atômica do arquivo)."""
+        path = os.path.join(METRICS_MULTIPROC_DIR, f"{pid or os.getpid()}.json")
+        _write_json(path, {metric.name: [[list(key), value] for key, value in metric.snapshot().items()] for metric in self._metrics})
+
+    def mark_process_dead(self, pid: int):
+        """
+        Chamado pelo mestre quando um worker termina: os gauges dele (valores instantâneos, como a
+        fila do LLM) deixam de ser somados, mas os contadores e histogramas continuam, para que os
+        totais expostos não diminuam.
+        """
+        path = os.path.join(METRICS_MULTIPROC_DIR, f"{pid}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        gauges = {metric.name for metric in self._metrics if isinstance(metric, Gauge)}
+        _write_json(path, {name: values for name, values in data.items() if name not in gauges})
+
+    def start_snapshot_writer(self):
+        """Grava os valores deste processo a cada METRICS_FLUSH_INTERVAL segundos (thread em segundo plano)."""
+        def loop():
+            while True:
+                try:
+                    self.write_snapshot()
+                except OSError:
+                    pass
+                time.sleep(METRICS_FLUSH_INTERVAL)
+
+        threading.Thread(target=loop, name="metrics-snapshot", daemon=True).start()
+
+    def _merge_processes(self) -> Dict[str, Dict[Tuple[str, ...], Any]]:
+        self.write_snapshot()
+        by_name = {metric.name: metric for metric in self._metrics}
+        merged: Dict[str, Dict[Tuple[str, ...], Any]] = {}
+        for file_name in os.listdir(METRICS_MULTIPROC_DIR):
+            if not file_name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(METRICS_MULTIPROC_DIR, file_name), encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, entries in data.items():
+                metric = by_name.get(name)
+                if metric is None:
+                    continue
+                values = merged.setdefault(name, {})
+                for key, value in entries:
+                    key = tuple(key)
+                    values[key] = metric.merge(values[key], value) if key in values else value
+        return merged
+
+# Inicialização do registro e das métricas da aplicação
+registry = MetricsRegistry()
+
+HTTP_REQUEST_SECONDS = registry.histogram("rag_http_request_seconds", "Latência das requisições HTTP.", ["method", "route", "status"])
+QUERY_STAGE_SECONDS = registry.histogram("rag_query_stage_seconds", "Latência de cada etapa de uma consulta (embedding, buscas, expansão, fila e geração).", ["stage"])
+INGESTION_STAGE_SECONDS = registry.histogram("rag_ingestion_stage_seconds", "Latência de cada etapa da ingestão (fetch, render, parse, normalize, chunk, dedup, embed, upsert).", ["stage"])
+PROMPT_CHARS = registry.histogram("rag_prompt_chars", "Tamanho (em caracteres) do prompt enviado ao LLM.", buckets=PROMPT_CHARS_BUCKETS)
+LLM_GENERATED_TOKENS = registry.histogram("rag_llm_generated_tokens", "Tokens gerados por resposta do LLM.", buckets=TOKENS_BUCKETS)
+CACHE_HITS = registry.counter("rag_cache_hits_total", "Resultados reaproveitados (ex: gerações coalescidas com o mesmo prompt).", ["cache"])
+ERRORS = registry.counter("rag_errors_total", "Erros por etapa.", ["stage"])
+DUPLICATE_CHUNKS = registry.counter("rag_ingestion_duplicate_chunks_total", "Chunks quase duplicados ignorados na ingestão (SimHash).")
+PROFILES = registry.counter("rag_profiles_total", "Requisições executadas sob o profiler por amostragem (explícitas ou sorteadas).", ["trigger"])
+
+# Tempos da requisição atual (cabeçalho Server-Timing); None quando não solicitados
+_request_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_timings", default=None)
+
+def start_request_timings():
+    """Passa a acumular os tempos das etapas da requisição atual (ver server_timing_header)."""
+    return _request_timings.set([])
+
+def reset_request_timings(token):
+    _request_timings.reset(token)
+
+def server_timing_header() -> str:
+    """Valor do cabeçalho Server-Timing com os tempos acumulados (em milissegundos)."""
+    timings = _request_timings.get() or []
+    return ", ".join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings)
+
+def record_timing(name: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+@contextmanager
+def timed(histogram: Histogram, stage: str):
+    """Mede a duração do bloco, registra no histograma (label 'stage') e nos tempos da requisição."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(elapsed, stage=stage)
+        record_timing(stage, elapsed)
+
+def query_stage(stage: str):
+    return timed(QUERY_STAGE_SECONDS, stage)
+
+def ingestion_stage(stage: str):
+    return timed(INGESTION_STAGE_SECONDS, stage)
@@ -0,0 +1,207 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import threading
+from collections import Counter
+from typing import Dict, List, Optional
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Profiling por amostragem: uma thread captura, a cada PROFILE_INTERVAL_MS, a pilha de todas as threads
+# do processo (event loop e threadpool: embedding, pypdf, normalização, chamadas ao Qdrant e ao TGI).
+# Uma requisição é perfilada quando um administrador envia o cabeçalho X-Profile: 1 (ou ?profile=1), ou,
+# continuamente, numa fração PROFILE_SAMPLE_RATE das requisições. Há uma única thread de amostragem, por
+# mais requisições perfiladas ao mesmo tempo, então o custo fica limitado pelo intervalo de amostragem.
+# As amostras cobrem o processo inteiro: requisições simultâneas aparecem no mesmo perfil.
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Fora do STORAGE_DIR, servido publicamente em /files: os perfis só são acessíveis por GET /profiles
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/app/data/profiles")
+# Perfis mantidos em disco (os mais antigos são apagados)
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_HEADER = "X-Profile"
+# Valores do cabeçalho X-Profile (ou do parâmetro ?profile=) que ativam o profiling
+PROFILE_TRUE_VALUES = ("1", "true", "yes", "on")
+PROFILE_MAX_DEPTH = 128
+
+# Funções em que uma thread está apenas esperando (threadpool ocioso, event loop sem eventos):
+# essas amostras são contadas como ociosas e ficam fora do flamegraph
+_IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("handlers.py", "dequeue"),
+}
+
+def _safe_id(profile_id: str) -> str:
+    """O ID recebido em /profiles/{id} vira nome de arquivo: só caracteres seguros."""
+    return re.sub(r"[^A-Za-z0-9_-]", "_", profile_id)[:64]
+
+def profile_requested(value: Optional[str]) -> bool:
+    """Indica se o valor do cabeçalho X-Profile (ou de ?profile=) pede o profiling (ex: '1', 'true')."""
+    return (value or "").strip().lower() in PROFILE_TRUE_VALUES
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES
+
+def _collapse(frame) -> str:
+    """Pilha no formato 'folded' (raiz;...;folha), usado pelo flamegraph.pl, speedscope e inferno."""
+    labels = []
+    while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+class ProfileSession:
+    """
+    Amostras acumuladas durante uma requisição. O ID do perfil é gerado no servidor (o X-Request-ID
+    vem do cliente e poderia sobrescrever outro perfil); o ID da requisição fica no resumo.
+    """
+
+    def __init__(self, trigger: str, path: str, request_id: str = ""):
+        self.profile_id = uuid.uuid4().hex
+        self.request_id = request_id
+        self.trigger = trigger
+        self.path = path
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle_samples = 0
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.0
+
+    def summary(self, top: int = 25) -> Dict[str, object]:
+        """Funções com mais amostras: 'self' (no topo da pilha) e 'total' (em qualquer ponto da pilha)."""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        busy = sum(self.stacks.values()) or 1
+        return {
+            "id": self.profile_id,
+            "request_id": self.request_id,
+            "trigger": self.trigger,
+            "path": self.path,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 1),
+            "interval_ms": PROFILE_INTERVAL_MS,
+            "samples": self.samples,
+            "idle_samples": self.idle_samples,
+            "top_self": [{"function": f, "samples": c, "percent": round(100 * c / busy, 1)} for f, c in own.most_common(top)],
+            "top_total": [{"function": f, "samples": c, "percent": round(100 * c / busy, 1)} for f, c in total.most_common(top)],
+        }
+
+class SamplingProfiler:
+    """Thread de amostragem compartilhada pelas sessões ativas (só roda enquanto há alguma)."""
+
+    def __init__(self, interval_ms: float = PROFILE_INTERVAL_MS, output_dir: str = PROFILE_DIR):
+        self.interval = interval_ms / 1000
+        self.output_dir = output_dir
+        self._sessions: List[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def should_sample(self) -> bool:
+        return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+    def start(self, trigger: str, path: str = "", request_id: str = "") -> ProfileSession:
+        session = ProfileSession(trigger, path, request_id)
+        with self._lock:
+            self._sessions.append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        return session
+
+    def stop(self, session: ProfileSession) -> Dict[str, object]:
+        """
+        Encerra a sessão, grava os arquivos do perfil e retorna o resumo. Depois de removida da lista
+        (sob a trava usada pela amostragem), a sessão não recebe mais amostras e pode ser lida sem a trava.
+        """
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+        session.duration = time.perf_counter() - session.start
+        summary = session.summary()
+        try:
+            self._save(session, summary)
+        except OSError as e:
+            logger.warning("[PROFILE] Não foi possível gravar o perfil %s: %s", session.profile_id, e)
+        return summary
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._sessions:
+                    self._thread = None
+                    return
+            # As pilhas são montadas fora da trava; os contadores das sessões só mudam com ela (ver stop)
+            frames = sys._current_frames()
+            samples = [None if _is_idle(frame) else _collapse(frame) for thread_id, frame in frames.items() if thread_id != own_id]
+            del frames
+            with self._lock:
+                for session in self._sessions:
+                    for stack in samples:
+                        session.samples += 1
+                        if stack is None:
+                            session.idle_samples += 1
+                        else:
+                            session.stacks[stack] += 1
+            time.sleep(self.interval)
+
+    def _path(self, profile_id: str, extension: str) -> str:
+        return os.path.join(self.output_dir, f"{profile_id}.{extension}")
+
+    def _save(self, session: ProfileSession, summary: Dict[str, object]):
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(self._path(session.profile_id, "folded"), "w", encoding="utf-8") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in session.stacks.most_common())
+        with open(self._path(session.profile_id, "json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        self._prune()
+
+    def _prune(self):
+        summaries = sorted((e for e in os.scandir(self.output_dir) if e.name.endswith(".json")), key=lambda e: e.stat().st_mtime)
+        for entry in summaries[:max(0, len(summaries) - PROFILE_MAX_FILES)]:
+            profile_id = entry.name[:-len(".json")]
+            for extension in ("json", "folded"):
+                try:
+                    os.remove(self._path(profile_id, extension))
+                except FileNotFoundError:
+                    pass
+
+    def load(self, profile_id: str, extension: str = "json") -> Optional[str]:
+        """Conteúdo de um perfil gravado ('json' ou 'folded'), ou None se não existir."""
+        try:
+            with open(self._path(_safe_id(profile_id), extension), encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def list(self, limit: int = 50) -> List[Dict[str, object]]:
+        """Perfis gravados, do mais recente para o mais antigo (sem as listas de funções)."""
+        if not os.path.isdir(self.output_dir):
+            return []
+        entries = sorted((e for e in os.scandir(self.output_dir) if e.name.endswith(".json")), key=lambda e: e.stat().st_mtime, reverse=True)
+        profiles = []
+        for entry in entries[:limit]:
+            with open(entry.path, encoding="utf-8") as f:
+                summary = json.load(f)
+            profiles.append({k: v for k, v in summary.items() if not k.startswith("top_")})
+        return profiles
+
+# Instância compartilhada pelos middlewares e rotas da API
+profiler = SamplingProfiler()
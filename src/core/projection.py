@@ -0,0 +1,86 @@
+import sys
+import argparse
+import numpy as np
+from typing import Optional
+
+# Redução de dimensionalidade dos embeddings por PCA, ajustado sobre os vetores do próprio corpus.
+# Os componentes são gravados num arquivo .npz (mean, components) e aplicados pelo Embedder
+# a todos os vetores (chunks e consultas), ver EMBEDDING_PROJECTION em embedder.py.
+#
+# Ajuste a partir dos vetores já gravados no Qdrant (dimensão original do modelo):
+#   python -m src.core.projection fit --dim 128 --out /app/storage/.pca-128.npz
+
+class Projection:
+    """Projeção linear (PCA): subtrai a média, projeta nos componentes principais e normaliza (L2)."""
+
+    def __init__(self, mean: np.ndarray, components: np.ndarray, explained_variance: Optional[float] = None):
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.asarray(components, dtype=np.float32) # (dim de saída, dim de entrada)
+        self.explained_variance = explained_variance
+
+    @property
+    def input_dim(self) -> int:
+        return self.components.shape[1]
+
+    @property
+    def output_dim(self) -> int:
+        return self.components.shape[0]
+
+    @classmethod
+    def fit(cls, vectors: np.ndarray, dim: int) -> "Projection":
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if dim <= 0 or dim > min(vectors.shape):
+            raise ValueError(f"Dimensão {dim} inválida para {vectors.shape[0]} vetores de dimensão {vectors.shape[1]}.")
+        mean = vectors.mean(axis=0)
+        # Componentes principais pela SVD da matriz centralizada
+        _, singular_values, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        variance = singular_values ** 2
+        return cls(mean, vt[:dim], float(variance[:dim].sum() / variance.sum()))
+
+    @classmethod
+    def load(cls, path: str) -> "Projection":
+        data = np.load(path)
+        explained = float(data["explained_variance"]) if "explained_variance" in data else None
+        return cls(data["mean"], data["components"], explained)
+
+    def save(self, path: str):
+        np.savez(path, mean=self.mean, components=self.components, explained_variance=self.explained_variance or 0.0)
+
+    def apply(self, vectors: np.ndarray) -> np.ndarray:
+        reduced = (np.asarray(vectors, dtype=np.float32) - self.mean) @ self.components.T
+        norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+        return reduced / np.where(norms > 0, norms, 1.0)
+
+def _load_collection_vectors(limit: int) -> np.ndarray:
+    """Vetores densos gravados na coleção (amostra de até 'limit'), para o ajuste do PCA."""
+    from ..ingestion.qdrant_config import COLLECTION_NAME, get_qdrant_client
+    client = get_qdrant_client()
+    vectors = []
+    offset = None
+    while len(vectors) < limit:
+        records, offset = client.scroll(collection_name=COLLECTION_NAME, limit=min(1000, limit - len(vectors)), offset=offset, with_payload=False, with_vectors=True)
+        # Pontos com vetor esparso guardam o denso sob o nome ""
+        vectors.extend(r.vector[""] if isinstance(r.vector, dict) else r.vector for r in records)
+        if offset is None:
+            break
+    return np.asarray(vectors, dtype=np.float32)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.core.projection", description="Ajuste do PCA dos embeddings.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    fit_parser = commands.add_parser("fit", help="Ajusta o PCA sobre os vetores da coleção (ou de um arquivo .npy).")
+    fit_parser.add_argument("--dim", type=int, required=True, help="Dimensão reduzida.")
+    fit_parser.add_argument("--out", required=True, help="Arquivo .npz de saída (EMBEDDING_PROJECTION_PATH).")
+    fit_parser.add_argument("--vectors", help="Arquivo .npy com os vetores (padrão: vetores da coleção no Qdrant).")
+    fit_parser.add_argument("--limit", type=int, default=50000, help="Máximo de vetores usados no ajuste.")
+    args = parser.parse_args(argv)
+
+    vectors = np.load(args.vectors)[:args.limit] if args.vectors else _load_collection_vectors(args.limit)
+    projection = Projection.fit(vectors, args.dim)
+    projection.save(args.out)
+    print(f"PCA {projection.input_dim} -> {projection.output_dim} ajustado com {len(vectors)} vetores "
+          f"({projection.explained_variance:.1%} da variância). Salvo em {args.out}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+import httpx
+from typing import Any, Dict, Iterable, List, Optional
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Intervalo entre as verificações de saúde (/health) de cada réplica do TGI
+LLM_HEALTH_INTERVAL = float(os.getenv("LLM_HEALTH_INTERVAL", "10"))
+LLM_HEALTH_TIMEOUT = float(os.getenv("LLM_HEALTH_TIMEOUT", "2"))
+
+# Circuit breaker: após N falhas consecutivas, a réplica fica fora do balanceamento por alguns segundos
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "3"))
+LLM_CIRCUIT_COOLDOWN = float(os.getenv("LLM_CIRCUIT_COOLDOWN", "30"))
+
+class Replica:
+    """Estado de uma réplica do TGI: requisições pendentes, saúde e circuit breaker."""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.open_until = 0.0 # circuito aberto (réplica ignorada) até este instante (time.monotonic)
+        self.requests_total = 0
+        self.failures_total = 0
+        self.latency_ewma = None
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.open_until
+
+    def stats(self, now: float) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit_open": now < self.open_until,
+            "outstanding": self.outstanding,
+            "requests_total": self.requests_total,
+            "failures_total": self.failures_total,
+            "latency_ewma_seconds": self.latency_ewma,
+        }
+
+class ReplicaPool:
+    """
+    Conjunto de réplicas do TGI com balanceamento por menor número de requisições pendentes
+    (least outstanding requests), verificação periódica de saúde e circuit breaker.
+    """
+
+    def __init__(self, urls: Iterable[str]):
+        self.replicas: List[Replica] = [Replica(url) for url in urls]
+        if not self.replicas:
+            raise ValueError("Nenhuma URL de LLM configurada.")
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def pick(self, exclude: Iterable[Replica] = ()) -> Optional[Replica]:
+        """
+        Escolhe a réplica disponível com menos requisições pendentes. Se nenhuma estiver
+        disponível (todas com falha), tenta a que tem o circuito aberto há mais tempo,
+        para não recusar a requisição sem ao menos uma tentativa.
+        """
+        now = time.monotonic()
+        candidates = [r for r in self.replicas if r not in exclude]
+        if not candidates:
+            return None
+        available = [r for r in candidates if r.available(now)]
+        if available:
+            return min(available, key=lambda r: r.outstanding)
+        return min(candidates, key=lambda r: r.open_until)
+
+    def record_success(self, replica: Replica, latency: float):
+        replica.requests_total += 1
+        replica.consecutive_failures = 0
+        replica.open_until = 0.0
+        replica.latency_ewma = latency if replica.latency_ewma is None else 0.8 * replica.latency_ewma + 0.2 * latency
+
+    def record_failure(self, replica: Replica):
+        replica.requests_total += 1
+        replica.failures_total += 1
+        replica.consecutive_failures += 1
+        if replica.consecutive_failures >= LLM_CIRCUIT_FAILURES:
+            replica.open_until = time.monotonic() + LLM_CIRCUIT_COOLDOWN
+            logger.warning("[REPLICAS] Circuito aberto para %s por %ss (%s falhas seguidas).", replica.url, LLM_CIRCUIT_COOLDOWN, replica.consecutive_failures)
+
+    async def probe(self, client: httpx.AsyncClient):
+        """Consulta o /health de todas as réplicas em paralelo e atualiza o estado de saúde."""
+        async def _probe_one(replica: Replica):
+            try:
+                response = await client.get(f"{replica.url}/health", timeout=LLM_HEALTH_TIMEOUT)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            if healthy != replica.healthy:
+                logger.info("[REPLICAS] Réplica %s agora está %s.", replica.url, 'saudável' if healthy else 'indisponível')
+            replica.healthy = healthy
+
+        await asyncio.gather(*[_probe_one(r) for r in self.replicas])
+
+    async def start(self, client: httpx.AsyncClient):
+        """Inicia a verificação periódica de saúde (só faz sentido com mais de uma réplica)."""
+        if self._probe_task is not None or len(self.replicas) < 2:
+            return
+
+        async def _loop():
+            while True:
+                await self.probe(client)
+                await asyncio.sleep(LLM_HEALTH_INTERVAL)
+
+        self._probe_task = asyncio.create_task(_loop())
+
+    async def stop(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            try:
+                await self._probe_task
+            except asyncio.CancelledError:
+                pass
+            self._probe_task = None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [r.stats(now) for r in self.replicas]
@@ -0,0 +1,173 @@
+import os
+import math
+import time
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from .deadline import Deadline, DeadlineExceeded
+from .metrics import registry, record_timing, QUERY_STAGE_SECONDS, CACHE_HITS, ERRORS
+
+# Configuração do controle de admissão das gerações no LLM. Os limites valem para a instância da API:
+# com vários workers (gunicorn), cada um fica com uma parte (ver configure_worker_limits em main.py)
+LLM_MAX_CONCURRENT = int(os.getenv("LLM_MAX_CONCURRENT", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "64"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+
+class SchedulerOverloaded(Exception):
+    """A fila de gerações está cheia ou o tempo máximo de espera foi excedido (a API responde 503)."""
+
+class _Flight:
+    """Geração em andamento de um prompt, com o prazo de quem a iniciou (que define max_new_tokens e o timeout)."""
+
+    def __init__(self, task: asyncio.Task, expires_at: float):
+        self.task = task
+        self.expires_at = expires_at
+        self.waiters = 0
+
+class GenerationScheduler:
+    """
+    Escalonador das chamadas ao LLM (TGI), na frente do Generator:
+
+    - Single-flight: requisições em andamento com o mesmo prompt compartilham uma única chamada ao TGI,
+      desde que o prazo de quem a iniciou termine depois do prazo de quem chega (senão, a resposta
+      seria truncada ou cancelada pelo prazo menor).
+    - Controle de admissão: no máximo 'max_concurrent' gerações simultâneas; as demais esperam
+      numa fila limitada ('max_queue') por até 'queue_timeout' segundos, e depois são descartadas
+      rapidamente com SchedulerOverloaded, em vez de acumular até o timeout do LLM.
+    """
+
+    def __init__(self, max_concurrent: int = LLM_MAX_CONCURRENT, max_queue: int = LLM_MAX_QUEUE, queue_timeout: float = LLM_QUEUE_TIMEOUT):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._in_flight: Dict[str, List[_Flight]] = {}
+
+        # Métricas
+        self.queue_depth = 0
+        self.running = 0
+        self.completed_total = 0
+        self.coalesced_total = 0
+        self.shed_total = 0
+        self.wait_seconds_sum = 0.0
+        self.wait_seconds_max = 0.0
+        self.wait_count = 0
+
+    def resize(self, max_concurrent: int, max_queue: int):
+        """Redefine os limites antes do uso (ex: a parte de cada worker do gunicorn, ver gunicorn_conf.py)."""
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+
+    @staticmethod
+    def prompt_key(prompt: str) -> str:
+        """Chave de coalescência: hash do prompt completo."""
+        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+    async def run(self, key: str, generate: Callable[[], Awaitable[Any]], deadline: Optional[Deadline] = None) -> Any:
+        """
+        Executa generate() respeitando o limite de concorrência. Se já houver uma geração em andamento
+        com a mesma chave e um prazo que termina depois do prazo desta requisição, aguarda o resultado
+        dela em vez de chamar o LLM de novo. A geração compartilhada só é cancelada quando todos os que
+        a aguardam desistem. O prazo (opcional) também limita a espera na fila.
+        """
+        expires_at = deadline.expires_at if deadline is not None else math.inf
+        flights = self._in_flight.setdefault(key, [])
+        flight = next((f for f in flights if f.expires_at >= expires_at), None)
+        if flight is not None:
+            self.coalesced_total += 1
+            CACHE_HITS.inc(cache="llm_coalesced")
+        else:
+            max_wait = deadline.remaining() if deadline is not None else None
+            flight = _Flight(asyncio.ensure_future(self._run_admitted(generate, max_wait)), expires_at)
+            flights.append(flight)
+            flight.task.add_done_callback(lambda _, flight=flight: self._finish(key, flight))
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if not flight.task.done():
+                flight.waiters -= 1
+                if flight.waiters == 0:
+                    flight.task.cancel()
+            raise
+
+    def _finish(self, key: str, flight: _Flight):
+        flights = self._in_flight.get(key, [])
+        if flight in flights:
+            flights.remove(flight)
+        if not flights:
+            self._in_flight.pop(key, None)
+
+    async def _run_admitted(self, generate: Callable[[], Awaitable[Any]], max_wait: Optional[float] = None) -> Any:
+        async with self.slot(max_wait):
+            return await generate()
+
+    @asynccontextmanager
+    async def slot(self, max_wait: Optional[float] = None):
+        """
+        Reserva uma das vagas de geração (também usado pelo streaming, que não é coalescido).
+        Lança SchedulerOverloaded se a fila estiver cheia ou se a espera exceder queue_timeout,
+        e DeadlineExceeded se a espera exceder max_wait (prazo da requisição) antes disso.
+        """
+        if self.is_saturated():
+            self.shed_total += 1
+            ERRORS.inc(stage="llm_overloaded")
+            raise SchedulerOverloaded(f"Fila de geração cheia ({self.queue_depth} requisições aguardando).")
+
+        timeout = self.queue_timeout if max_wait is None else min(self.queue_timeout, max_wait)
+        self.queue_depth += 1
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.shed_total += 1
+            ERRORS.inc(stage="llm_overloaded")
+            if timeout < self.queue_timeout:
+                raise DeadlineExceeded("Prazo da requisição esgotado enquanto aguardava na fila de geração.")
+            raise SchedulerOverloaded(f"Tempo máximo de espera na fila de geração excedido ({self.queue_timeout}s).")
+        finally:
+            self.queue_depth -= 1
+            waited = time.monotonic() - start
+            self.wait_count += 1
+            self.wait_seconds_sum += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            QUERY_STAGE_SECONDS.observe(waited, stage="llm_queue_wait")
+            record_timing("llm_queue_wait", waited)
+
+        self.running += 1
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self.completed_total += 1
+            self._semaphore.release()
+
+    def is_saturated(self) -> bool:
+        """Indica se uma nova requisição seria descartada imediatamente (fila cheia)."""
+        return self.queue_depth >= self.max_queue and self._semaphore.locked()
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas da fila de geração (profundidade, tempo de espera, coalescências e descartes)."""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "queue_depth": self.queue_depth,
+            "running": self.running,
+            "in_flight_prompts": len(self._in_flight),
+            "in_flight_generations": sum(len(flights) for flights in self._in_flight.values()),
+            "completed_total": self.completed_total,
+            "coalesced_total": self.coalesced_total,
+            "shed_total": self.shed_total,
+            "wait_seconds_avg": self.wait_seconds_sum / self.wait_count if self.wait_count else 0.0,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
+
+# Inicialização da instância do escalonador
+scheduler = GenerationScheduler()
+
+registry.gauge("rag_llm_queue_depth", "Gerações aguardando uma vaga na fila do LLM.", lambda: scheduler.queue_depth)
+registry.gauge("rag_llm_running", "Gerações em execução no LLM.", lambda: scheduler.running)
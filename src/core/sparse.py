@@ -0,0 +1,73 @@
+import re
+import zlib
+from collections import Counter
+from typing import List
+from qdrant_client.models import SparseVector
+
+# Nome do vetor esparso (named sparse vector) na coleção do Qdrant.
+# O vetor denso continua sendo o vetor padrão (sem nome) da coleção.
+SPARSE_VECTOR_NAME = "text"
+
+# Tokens alfanuméricos, preservando identificadores numéricos como "4.893", "12/2023" ou "3.040-a"
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.,/\-][a-z0-9]+)*")
+_SEPARATORS_PATTERN = re.compile(r"[.,/\-]")
+
+class SparseEncoder:
+    """
+    Gera vetores esparsos lexicais (estilo BM25) a partir do texto normalizado (normalize_text).
+
+    Cada token é mapeado para um índice fixo via CRC32, dispensando vocabulário. O peso
+    de cada termo no documento usa a saturação de frequência do BM25 (k1, b); o IDF é
+    calculado pelo próprio Qdrant (Modifier.IDF), o que mantém os vetores já gravados
+    válidos à medida que o corpus cresce.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, avg_doc_length: float = 200.0):
+        self.k1 = k1
+        self.b = b
+        self.avg_doc_length = avg_doc_length
+
+    def tokenize(self, text: str) -> List[str]:
+        """Extrai os tokens do texto (já em lowercase e sem acentos)."""
+        if not text:
+            return []
+        tokens = []
+        for token in _TOKEN_PATTERN.findall(text):
+            tokens.append(token)
+            # "4.893" também é indexado como "4893", para casar com as duas grafias
+            if _SEPARATORS_PATTERN.search(token):
+                tokens.append(_SEPARATORS_PATTERN.sub("", token))
+        return tokens
+
+    @staticmethod
+    def _token_index(token: str) -> int:
+        return zlib.crc32(token.encode("utf-8"))
+
+    def _to_sparse_vector(self, weights: dict) -> SparseVector:
+        # Tokens diferentes podem colidir no mesmo índice; nesse caso os pesos são somados
+        merged = {}
+        for token, weight in weights.items():
+            index = self._token_index(token)
+            merged[index] = merged.get(index, 0.0) + weight
+        indices = sorted(merged)
+        return SparseVector(indices=indices, values=[merged[i] for i in indices])
+
+    def encode_documents(self, texts: List[str]) -> List[SparseVector]:
+        """Converte chunks em vetores esparsos com a frequência de termos saturada do BM25."""
+        vectors = []
+        for text in texts:
+            tokens = self.tokenize(text)
+            length_norm = 1 - self.b + self.b * (len(tokens) / self.avg_doc_length)
+            weights = {
+                token: (tf * (self.k1 + 1)) / (tf + self.k1 * length_norm)
+                for token, tf in Counter(tokens).items()
+            }
+            vectors.append(self._to_sparse_vector(weights))
+        return vectors
+
+    def encode_query(self, text: str) -> SparseVector:
+        """Converte a consulta em vetor esparso (peso 1 por termo; o IDF é aplicado pelo Qdrant)."""
+        return self._to_sparse_vector({token: 1.0 for token in self.tokenize(text)})
+
+# Inicialização da instância do codificador esparso
+sparse_encoder = SparseEncoder()
@@ -1,22 +1,244 @@
 import os
+import uuid
+import numpy as np
+from datetime import datetime
 from qdrant_client import QdrantClient
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from qdrant_client.models import (
     VectorParams,
+    SparseVectorParams,
+    SparseVector,
+    Modifier,
     PointStruct,
     Distance,
     PayloadSchemaType,
     Filter,
     FieldCondition,
     MatchValue,
+    MatchAny,
+    NestedCondition,
+    Nested,
+    DatetimeRange,
+    Prefetch,
+    FusionQuery,
+    Fusion,
+    SearchRequest,
+    QueryRequest,
+    Datatype,
+    SearchParams,
+    QuantizationSearchParams,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    BinaryQuantization,
+    BinaryQuantizationConfig,
 )
+from .sparse import SPARSE_VECTOR_NAME
+from .log import get_logger
+
+logger = get_logger(__name__)
+
+# Dimensão dos vetores na criação das coleções: a reduzida (EMBEDDING_DIM) ou, se vazia, a do modelo
+# de embeddings configurado (ver default_vector_size)
+DEFAULT_VECTOR_SIZE = int(os.getenv("EMBEDDING_DIM", "0")) or None
+# Tipo dos vetores densos gravados nas novas coleções: float16 ocupa metade da memória do float32
+# (coleções existentes mantêm o tipo com que foram criadas; para trocá-lo, reindexe a coleção)
+VECTOR_DATATYPE = Datatype.FLOAT16 if os.getenv("VECTOR_DATATYPE", "float16").lower() == "float16" else Datatype.FLOAT32
+# gRPC (porta 6334, QDRANT_GRPC_PORT): os vetores trafegam em binário, em vez de listas de números em
+# JSON (REST). Opcional: exige que a porta gRPC do Qdrant esteja acessível a partir da API
+QDRANT_PREFER_GRPC = os.getenv("QDRANT_PREFER_GRPC", "false").lower() == "true"
+QDRANT_GRPC_PORT = int(os.getenv("QDRANT_GRPC_PORT", "6334"))
+
+# Quantização dos vetores densos nas novas coleções: "none", "scalar" (int8, 4x menor) ou "binary" (32x menor).
+# As buscas usam os vetores quantizados e, com rescore, reordenam os candidatos pelos vetores originais
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+
+# Parâmetros padrão de cada busca (escolha-os com docs/Testes/benchmark_search.py):
+#   - SEARCH_HNSW_EF: tamanho da lista de candidatos do HNSW (maior = mais recall e mais latência; vazio = ef da coleção)
+#   - SEARCH_EXACT: busca exata (sem HNSW), para medir ou depurar o recall
+#   - SEARCH_QUANTIZATION_RESCORE / SEARCH_QUANTIZATION_OVERSAMPLING: reordenação pelos vetores originais
+#     de oversampling * top_k candidatos da busca quantizada (vazio = decisão do Qdrant)
+SEARCH_HNSW_EF = int(os.getenv("SEARCH_HNSW_EF", "0")) or None
+SEARCH_EXACT = os.getenv("SEARCH_EXACT", "false").lower() == "true"
+SEARCH_QUANTIZATION_RESCORE = {"true": True, "false": False}.get(os.getenv("SEARCH_QUANTIZATION_RESCORE", "").lower())
+SEARCH_QUANTIZATION_OVERSAMPLING = float(os.getenv("SEARCH_QUANTIZATION_OVERSAMPLING", "0")) or None
+
+# Backend do banco vetorial: "qdrant" (servidor) ou "local" (índice embutido no processo, ver local_index.py),
+# para benchmarks e CI sem o container do Qdrant
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant").lower()
+
+# Quantos candidatos cada ramo (denso e esparso) traz antes da fusão RRF, em múltiplos do top_k
+HYBRID_PREFETCH_MULTIPLIER = int(os.getenv("HYBRID_PREFETCH_MULTIPLIER", "4"))
+
+def build_search_params(hnsw_ef: int = None, exact: bool = False, rescore: bool = None, oversampling: float = None) -> Optional[SearchParams]:
+    """Parâmetros de busca do Qdrant (None quando todos são os padrões do Qdrant)."""
+    quantization = None
+    if rescore is not None or oversampling is not None:
+        quantization = QuantizationSearchParams(rescore=rescore, oversampling=oversampling)
+    if hnsw_ef is None and not exact and quantization is None:
+        return None
+    return SearchParams(hnsw_ef=hnsw_ef, exact=exact, quantization=quantization)
+
+DEFAULT_SEARCH_PARAMS = build_search_params(SEARCH_HNSW_EF, SEARCH_EXACT, SEARCH_QUANTIZATION_RESCORE, SEARCH_QUANTIZATION_OVERSAMPLING)
+
+def quantization_config(kind: str = VECTOR_QUANTIZATION):
+    """Configuração de quantização da coleção ("none", "scalar" ou "binary")."""
+    if kind == "scalar":
+        return ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True))
+    if kind == "binary":
+        return BinaryQuantization(binary=BinaryQuantizationConfig(always_ram=True))
+    return None
+
+def document_collection_name(collection_name: str) -> str:
+    """Nome da coleção auxiliar com um vetor por documento (source), usada na busca em dois estágios."""
+    return f"{collection_name}_docs"
+
+def build_document_point(source: str, embeddings, payload: Dict[str, Any]) -> PointStruct:
+    """
+    Monta o ponto de nível de documento: a média (normalizada) dos vetores dos chunks do documento.
+    O ID é derivado da própria 'source' (UUID5), então reprocessar um documento sobrescreve seu vetor.
+    """
+    mean_vector = np.asarray(embeddings, dtype=np.float32).mean(axis=0)
+    norm = np.linalg.norm(mean_vector)
+    if norm > 0:
+        mean_vector = mean_vector / norm
+
+    return PointStruct(
+        id=str(uuid.uuid5(uuid.NAMESPACE_URL, source)),
+        vector=mean_vector.tolist(),
+        payload={**payload, "source": source, "chunk_count": len(embeddings)},
+    )
+
+def restrict_to_sources(query_filter: Filter, sources: List[str]) -> Filter:
+    """Acrescenta a um filtro existente a restrição aos documentos (sources) informados."""
+    must = list(query_filter.must or []) if query_filter else []
+    must.append(FieldCondition(key="source", match=MatchAny(any=sources)))
+    return Filter(
+        must=must,
+        should=query_filter.should if query_filter else None,
+        must_not=query_filter.must_not if query_filter else None,
+    )
+
+def with_date_range(query_filter: Filter, updated_after: datetime = None, updated_before: datetime = None) -> Filter:
+    """
+    Acrescenta a um filtro existente o intervalo de datas sobre 'last_updated'. Como o campo
+    tem índice DATETIME, o Qdrant aplica o intervalo antes da busca vetorial, reduzindo o
+    conjunto de candidatos (em vez de filtrar os resultados depois).
+    """
+    if updated_after is None and updated_before is None:
+        return query_filter
+    must = list(query_filter.must or []) if query_filter else []
+    must.append(FieldCondition(key="last_updated", range=DatetimeRange(gte=updated_after, lte=updated_before)))
+    return Filter(
+        must=must,
+        should=query_filter.should if query_filter else None,
+        must_not=query_filter.must_not if query_filter else None,
+    )
+
+def collection_has_sparse(client: QdrantClient, collection_name: str) -> bool:
+    """
+    Indica se a coleção foi criada com o vetor esparso nomeado (SPARSE_VECTOR_NAME).
+    Coleções antigas, criadas só com o vetor denso, continuam funcionando apenas com busca densa.
+    """
+    try:
+        info = client.get_collection(collection_name=collection_name)
+    except Exception:
+        return False
+    return SPARSE_VECTOR_NAME in (info.config.params.sparse_vectors or {})
+
+def build_point_vector(embedding, sparse_embedding: SparseVector = None):
+    """
+    Monta o campo 'vector' de um ponto: só o vetor denso (padrão, sem nome) ou,
+    quando há vetor esparso, os dois vetores nomeados ("" é o nome do vetor padrão).
+    """
+    if sparse_embedding is None:
+        return embedding
+    return {"": embedding, SPARSE_VECTOR_NAME: sparse_embedding}
+
+def neighbours_filter(keys: List[tuple], user_role: str) -> Filter:
+    """
+    Filtro dos chunks com os pares (source, chunk_index) em 'keys', visíveis para user_role. Inclui os
+    chunks gravados por outro documento com o par em duplicate_sources: um chunk quase duplicado não é
+    gravado de novo (ver dedup.py), e sem isso o vizinho dele se perderia na expansão de contexto.
+    """
+    should = []
+    for source, chunk_index in keys:
+        key_conditions = [
+            FieldCondition(key="source", match=MatchValue(value=source)),
+            FieldCondition(key="chunk_index", match=MatchValue(value=chunk_index)),
+        ]
+        should.append(Filter(must=key_conditions))
+        should.append(NestedCondition(nested=Nested(key="duplicate_sources", filter=Filter(must=key_conditions))))
+    return Filter(must=[FieldCondition(key="allowed_roles", match=MatchValue(value=user_role))], should=should)
+
+def _results_by_key(records, keys: List[tuple]) -> List[Dict[str, Any]]:
+    """
+    Um único chunk por par (source, chunk_index) pedido, como na busca individual (limit=1). Um par
+    encontrado em duplicate_sources é devolvido com a origem e a posição da cópia; o próprio ponto
+    do documento, se existir, tem prioridade.
+    """
+    wanted = set(keys)
+    by_key = {}
+    results = [(r, _hit_to_result(r)) for r in records]
+    for _, result in results:
+        key = (result["source"], result["chunk_index"])
+        if key in wanted:
+            by_key.setdefault(key, result)
+    for record, result in results:
+        for duplicate in record.payload.get("duplicate_sources") or []:
+            key = (duplicate.get("source"), duplicate.get("chunk_index"))
+            if key in wanted and key not in by_key:
+                by_key[key] = {**result, **{field: duplicate.get(field) for field in ("source", "chunk_index", "display_name", "file_in_storage", "last_updated")}}
+    return list(by_key.values())
+
+def _hit_to_result(h) -> Dict[str, Any]:
+    """Converte um ponto retornado pelo Qdrant no dicionário de resultado usado pela API."""
+    # Detecta automaticamente o campo de texto do payload
+    if "chunk" in h.payload:
+        chunk_text = h.payload["chunk"]
+    elif "text" in h.payload:
+        chunk_text = h.payload["text"]
+    else:
+        # Pega qualquer campo de string disponível
+        chunk_text = next((v for v in h.payload.values() if isinstance(v, str)), "")
+
+    return {
+        "id": h.id,
+        "score": getattr(h, "score", None) or 0.0, # pontos lidos por scroll não têm score
+        "chunk": chunk_text,
+        "source": h.payload.get("source", ""),
+        "chunk_index": h.payload.get("chunk_index"),
+        "last_updated": h.payload.get("last_updated"),
+        "file_in_storage": h.payload.get("file_in_storage"), 
+        "display_name": h.payload.get("display_name"),
+        # Outras origens com o mesmo conteúdo (chunks quase duplicados não são gravados de novo)
+        "duplicate_sources": [
+            {key: d.get(key) for key in ("source", "display_name", "file_in_storage")}
+            for d in h.payload.get("duplicate_sources") or []
+        ],
+    }
+
+def default_vector_size() -> int:
+    """Dimensão dos vetores das novas coleções: EMBEDDING_DIM ou a do modelo de embeddings (EMBEDDING_MODEL)."""
+    if DEFAULT_VECTOR_SIZE:
+        return DEFAULT_VECTOR_SIZE
+    from .embedder import get_shared_embedder
+    return get_shared_embedder().dimension
+
+def create_vectordb(**kwargs) -> "VectorDB":
+    """Cria o VectorDB do backend configurado em VECTOR_BACKEND."""
+    if VECTOR_BACKEND == "local":
+        from .local_index import LocalVectorDB
+        return LocalVectorDB(**kwargs)
+    return VectorDB(**kwargs)
 
 class VectorDB:
     def __init__(self, 
                  host=None, 
                  port=None, 
                  collection_name="documents", 
-                 vector_size=384):
+                 vector_size=DEFAULT_VECTOR_SIZE,
+                 prefer_grpc=QDRANT_PREFER_GRPC):
         """
         Inicializa o cliente Qdrant e garante que a coleção esteja criada.
         O host e a porta podem ser configurados por variáveis de ambiente:
@@ -26,9 +248,10 @@ class VectorDB:
         host = host or os.getenv("QDRANT_HOST", "localhost")
         port = port or int(os.getenv("QDRANT_PORT", "6333"))
 
-        self.client = QdrantClient(host=host, port=port)
+        self.client = QdrantClient(host=host, port=port, grpc_port=QDRANT_GRPC_PORT, prefer_grpc=prefer_grpc)
         self.collection_name = collection_name
-        self.vector_size = vector_size
+        self.documents_collection_name = document_collection_name(collection_name)
+        self.vector_size = vector_size or default_vector_size()
 
         # Verifica se a coleção existe; caso contrário, recria
         try:
@@ -36,23 +259,79 @@ class VectorDB:
         except:
             self.client.recreate_collection(
                 collection_name=self.collection_name,
-                vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE)
+                vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE, datatype=VECTOR_DATATYPE),
+                quantization_config=quantization_config(),
+                # Vetor esparso lexical para a busca híbrida; o IDF é calculado pelo Qdrant
+                sparse_vectors_config={SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)},
             )
-            print(f"Coleção '{self.collection_name}' criada.")
+            logger.info("Coleção '%s' criada.", self.collection_name)
+
+        # Em coleções existentes valem a dimensão e o tipo com que foram criadas
+        dense_params = self.client.get_collection(collection_name=self.collection_name).config.params.vectors
+        dense_params = dense_params[""] if isinstance(dense_params, dict) else dense_params
+        if dense_params.size != self.vector_size:
+            logger.warning("Aviso: coleção '%s' tem vetores de %s dimensões (esperado: %s); reindexe a coleção após mudar o modelo ou a projeção.", self.collection_name, dense_params.size, self.vector_size)
+            self.vector_size = dense_params.size
+
+        self.sparse_enabled = collection_has_sparse(self.client, self.collection_name)
+        if not self.sparse_enabled:
+            logger.warning("Aviso: coleção '%s' sem vetor esparso; a busca híbrida usará apenas o vetor denso.", self.collection_name)
         
-        # Cria índice para o campo de data (Payload Index), para garantir consultas eficientes por data
+        # Coleção de nível de documento (um vetor por source), para a busca em dois estágios
+        try:
+            self.client.get_collection(collection_name=self.documents_collection_name)
+        except:
+            self.client.recreate_collection(
+                collection_name=self.documents_collection_name,
+                vectors_config=VectorParams(size=self.vector_size, distance=Distance.COSINE, datatype=VECTOR_DATATYPE),
+            )
+            logger.info("Coleção '%s' criada.", self.documents_collection_name)
+
+        # Cria os índices de payload (Payload Index), para garantir consultas filtradas eficientes:
+        # - last_updated: DATETIME, permite filtros por intervalo de datas (o valor ISO string é aceito como está)
+        # - allowed_roles: filtro de segurança aplicado em toda busca
+        # - source: restrição aos documentos escolhidos no primeiro estágio e busca de vizinhos
+        # - simhash_bands: busca de chunks quase duplicados na ingestão (ver ingestion/dedup.py)
+        indexes = [
+            (self.collection_name, "last_updated", PayloadSchemaType.DATETIME),
+            (self.collection_name, "allowed_roles", PayloadSchemaType.KEYWORD),
+            (self.collection_name, "source", PayloadSchemaType.KEYWORD),
+            (self.collection_name, "simhash_bands", PayloadSchemaType.KEYWORD),
+            (self.documents_collection_name, "last_updated", PayloadSchemaType.DATETIME),
+            (self.documents_collection_name, "allowed_roles", PayloadSchemaType.KEYWORD),
+        ]
+        for collection, field_name, field_schema in indexes:
+            self._ensure_payload_index(collection, field_name, field_schema)
+
+    def _ensure_payload_index(self, collection: str, field_name: str, field_schema: PayloadSchemaType):
+        """
+        Cria o índice de payload, recriando-o se existir com outro tipo
+        (ex: o índice KEYWORD antigo de 'last_updated', que não suporta consultas por intervalo).
+        """
         try:
+            current = self.client.get_collection(collection_name=collection).payload_schema.get(field_name)
+            if current is not None and current.data_type == field_schema:
+                return
+            if current is not None:
+                self.client.delete_payload_index(collection_name=collection, field_name=field_name, wait=True)
+                logger.info("Índice '%s' (%s) removido da coleção '%s' para ser recriado.", field_name, current.data_type, collection)
+
             self.client.create_payload_index(
-                collection_name=self.collection_name,
-                field_name="last_updated",
-                field_schema=PayloadSchemaType.KEYWORD  # KEYWORD é ideal para o formato ISO string
+                collection_name=collection,
+                field_name=field_name,
+                field_schema=field_schema,
+                wait=True,
             )
-            print("Índice 'last_updated' criado com sucesso.")
-        except Exception:
-            # Índice já existe ou falha na criação (ignora se já existe)
-            pass 
+            logger.info("Índice '%s' criado com sucesso na coleção '%s'.", field_name, collection)
+        except Exception as e:
+            # Falha na criação do índice não impede a busca (apenas a torna menos eficiente)
+            logger.warning("Aviso: não foi possível criar o índice '%s' na coleção '%s': %s", field_name, collection, e)
 
 
+    def count(self) -> int:
+        """Número de chunks gravados na coleção."""
+        return self.client.count(collection_name=self.collection_name).count
+
     def add_documents(self, docs):
         """
         Adiciona documentos no Qdrant.
@@ -62,12 +341,16 @@ class VectorDB:
             - 'source': URL ou origem
             - 'last_updated': momento da última atualização do chunk
             - 'embedding': vetor gerado pelo modelo de embeddings
+            - 'sparse_embedding': (Opcional) vetor esparso lexical gerado pelo SparseEncoder
         """
         points = []        
         for doc in docs:
-            # Extrai o ID único (point_id) e o vetor de embedding
+            # Extrai o ID único (point_id) e os vetores (denso e, se houver, esparso)
             point_id = doc.pop("point_id")
-            vector = doc.pop("embedding")
+            sparse_embedding = doc.pop("sparse_embedding", None)
+            if not self.sparse_enabled:
+                sparse_embedding = None
+            vector = build_point_vector(doc.pop("embedding"), sparse_embedding)
             
             # O resto do dicionário 'doc' vira o payload (metadados)
             payload = doc 
@@ -86,46 +369,137 @@ class VectorDB:
             points=points,
             wait=True # Garante que a operação é concluída antes de prosseguir
         )
-        print(f"{len(points)} documentos adicionados à coleção '{self.collection_name}'.")
+        logger.info("%s documentos adicionados à coleção '%s'.", len(points), self.collection_name)
+
+        # Atualiza o vetor de nível de documento de cada source recebida
+        vectors_by_source = {}
+        payload_by_source = {}
+        for point in points:
+            source = point.payload.get("source")
+            if not source:
+                continue
+            dense = point.vector[""] if isinstance(point.vector, dict) else point.vector
+            vectors_by_source.setdefault(source, []).append(dense)
+            payload_by_source.setdefault(source, {
+                key: point.payload[key]
+                for key in ("display_name", "file_in_storage", "last_updated", "allowed_roles")
+                if key in point.payload
+            })
+        self.add_document_vectors(vectors_by_source, payload_by_source)
+
+    def add_document_vectors(self, vectors_by_source: Dict[str, list], payload_by_source: Dict[str, Dict[str, Any]] = None):
+        """
+        Grava, na coleção de documentos, um vetor por source: a média dos vetores de seus chunks.
+        """
+        if not vectors_by_source:
+            return
+        payload_by_source = payload_by_source or {}
+        document_points = [
+            build_document_point(source, vectors, payload_by_source.get(source, {}))
+            for source, vectors in vectors_by_source.items()
+        ]
+        self.client.upsert(collection_name=self.documents_collection_name, points=document_points, wait=True)
 
-    def search(self, query_vector, top_k=5, query_filter: Filter = None):
+    def search(self, query_vector, top_k=5, query_filter: Filter = None, sparse_vector: SparseVector = None, updated_after: datetime = None, updated_before: datetime = None, timeout: int = None, search_params: SearchParams = None):
         """
         Executa uma busca vetorial no Qdrant, aplicando um filtro de acordo com permissão de acesso.
         
         query_vector: embedding de consulta (lista ou array)
         top_k: número de resultados a retornar
         query_filter: (Opcional) Objeto de Filtro do Qdrant para segurança/metadados.
+        sparse_vector: (Opcional) vetor esparso da consulta. Quando informado (e a coleção tem
+            vetor esparso), executa a busca híbrida: os ramos denso e esparso rodam numa única
+            requisição (prefetch) e são combinados por Reciprocal Rank Fusion (RRF) no próprio Qdrant.
+        updated_after / updated_before: (Opcional) intervalo de datas sobre 'last_updated'.
+        timeout: (Opcional) timeout da busca em segundos (ex: o tempo restante do prazo da requisição).
+        search_params: (Opcional) parâmetros do HNSW/quantização (hnsw_ef, exact, rescore), ver build_search_params;
+            por padrão, DEFAULT_SEARCH_PARAMS.
         """
+        query_filter = with_date_range(query_filter, updated_after, updated_before)
+        search_params = search_params or DEFAULT_SEARCH_PARAMS
+
+        if sparse_vector is not None and self.sparse_enabled:
+            prefetch_limit = top_k * HYBRID_PREFETCH_MULTIPLIER
+            response = self.client.query_points(
+                collection_name=self.collection_name,
+                prefetch=[
+                    Prefetch(query=query_vector, filter=query_filter, params=search_params, limit=prefetch_limit),
+                    Prefetch(query=sparse_vector, using=SPARSE_VECTOR_NAME, filter=query_filter, limit=prefetch_limit),
+                ],
+                query=FusionQuery(fusion=Fusion.RRF),
+                limit=top_k,
+                with_payload=True,
+                timeout=timeout,
+            )
+            return [_hit_to_result(h) for h in response.points]
+
         # Busca pontos mais similares
         hits = self.client.search(
             collection_name=self.collection_name,
             query_vector=query_vector,
             query_filter=query_filter,
+            search_params=search_params,
             limit=top_k,
             with_payload=True,
+            timeout=timeout,
         )
-        results = []
-        for h in hits:
-            # Detecta automaticamente o campo de texto do payload
-            if "chunk" in h.payload:
-                chunk_text = h.payload["chunk"]
-            elif "text" in h.payload:
-                chunk_text = h.payload["text"]
-            else:
-                # Pega qualquer campo de string disponível
-                chunk_text = next((v for v in h.payload.values() if isinstance(v, str)), "")
-            
-            results.append({
-                "id": h.id,
-                "score": h.score,
-                "chunk": chunk_text,
-                "source": h.payload.get("source", ""),
-                "chunk_index": h.payload.get("chunk_index"),
-                "last_updated": h.payload.get("last_updated"),
-                "file_in_storage": h.payload.get("file_in_storage"), 
-                "display_name": h.payload.get("display_name"),
-            })
-        return results
+        return [_hit_to_result(h) for h in hits]
+
+    def search_batch(self, query_vectors, top_k=5, query_filters: List[Filter] = None, sparse_vectors: List[SparseVector] = None, timeout: int = None, search_params: SearchParams = None) -> List[List[Dict[str, Any]]]:
+        """
+        Executa várias buscas vetoriais numa única requisição ao Qdrant (search_batch).
+        
+        query_vectors: lista de embeddings de consulta
+        top_k: número de resultados a retornar por consulta
+        query_filters: (Opcional) um filtro por consulta (ex: filtro de segurança do cargo)
+        sparse_vectors: (Opcional) um vetor esparso por consulta, para a busca híbrida (RRF)
+        search_params: (Opcional) parâmetros do HNSW/quantização, como em search
+        Retorna uma lista de resultados para cada consulta, na mesma ordem de query_vectors.
+        """
+        query_filters = query_filters or [None] * len(query_vectors)
+        search_params = search_params or DEFAULT_SEARCH_PARAMS
+
+        if sparse_vectors is not None and self.sparse_enabled:
+            prefetch_limit = top_k * HYBRID_PREFETCH_MULTIPLIER
+            requests = [
+                QueryRequest(
+                    prefetch=[
+                        Prefetch(query=vector, filter=query_filter, params=search_params, limit=prefetch_limit),
+                        Prefetch(query=sparse_vector, using=SPARSE_VECTOR_NAME, filter=query_filter, limit=prefetch_limit),
+                    ],
+                    query=FusionQuery(fusion=Fusion.RRF),
+                    limit=top_k,
+                    with_payload=True,
+                )
+                for vector, sparse_vector, query_filter in zip(query_vectors, sparse_vectors, query_filters)
+            ]
+            responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests, timeout=timeout)
+            return [[_hit_to_result(h) for h in response.points] for response in responses]
+
+        requests = [
+            SearchRequest(vector=vector, filter=query_filter, params=search_params, limit=top_k, with_payload=True)
+            for vector, query_filter in zip(query_vectors, query_filters)
+        ]
+        batch_hits = self.client.search_batch(collection_name=self.collection_name, requests=requests, timeout=timeout)
+        return [[_hit_to_result(h) for h in hits] for hits in batch_hits]
+
+    def search_documents(self, query_vector, top_k=10, query_filter: Filter = None, timeout: int = None, search_params: SearchParams = None) -> List[str]:
+        """
+        Primeiro estágio da busca em dois estágios: retorna as sources dos documentos
+        mais similares à consulta (na coleção de documentos), respeitando o filtro de segurança.
+        """
+        return self.search_documents_batch([query_vector], top_k=top_k, query_filters=[query_filter], timeout=timeout, search_params=search_params)[0]
+
+    def search_documents_batch(self, query_vectors, top_k=10, query_filters: List[Filter] = None, timeout: int = None, search_params: SearchParams = None) -> List[List[str]]:
+        """Versão em lote de search_documents (uma única requisição search_batch)."""
+        query_filters = query_filters or [None] * len(query_vectors)
+        search_params = search_params or DEFAULT_SEARCH_PARAMS
+        requests = [
+            SearchRequest(vector=vector, filter=query_filter, params=search_params, limit=top_k, with_payload=["source"])
+            for vector, query_filter in zip(query_vectors, query_filters)
+        ]
+        batch_hits = self.client.search_batch(collection_name=self.documents_collection_name, requests=requests, timeout=timeout)
+        return [[h.payload["source"] for h in hits if h.payload.get("source")] for hits in batch_hits]
 
     def get_chunks_by_metadata(self, source: str, chunk_index: int, user_role: str) -> List[Dict[str, Any]]:
                 """
@@ -173,4 +547,33 @@ class VectorDB:
                         "display_name": h.payload.get("display_name"),
                     })
                     
-                return results
\ No newline at end of file
+                return results
+
+    def get_chunks_by_metadata_batch(self, keys: List[tuple], user_role: str, timeout: int = None) -> List[Dict[str, Any]]:
+        """
+        Versão em lote de get_chunks_by_metadata: busca, numa única requisição (scroll),
+        todos os chunks cujos pares (source, chunk_index) estão em 'keys', aplicando o
+        filtro de segurança (user_role). Usado na expansão de contexto com chunks vizinhos.
+        """
+        if not keys:
+            return []
+
+        metadata_filter = neighbours_filter(keys, user_role)
+
+        # O scroll dispensa o vetor de busca: a seleção é guiada apenas pelo filtro. Pode haver mais de um
+        # ponto por chave (ex: documento ingerido duas vezes), então pagina até o fim em vez de usar limit=len(keys)
+        records, offset = [], None
+        while True:
+            page, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=metadata_filter,
+                limit=len(keys),
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+                timeout=timeout,
+            )
+            records.extend(page)
+            if offset is None:
+                break
+        return _results_by_key(records, keys)
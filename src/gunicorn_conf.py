@@ -0,0 +1,100 @@
+import os
+import gc
+import multiprocessing
+
+# Configuração do gunicorn para servir a API com vários workers (um por núcleo):
+#   gunicorn src.api.main:app -c src/gunicorn_conf.py
+#
+# Com preload_app, o processo mestre importa a aplicação e carrega o modelo de embeddings
+# uma única vez, antes do fork. Os workers herdam os pesos do modelo por copy-on-write
+# (as páginas só são copiadas se forem escritas, o que não acontece na inferência), então
+# a memória total não cresce com o número de workers.
+
+bind = os.getenv("API_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("API_WORKERS", str(multiprocessing.cpu_count())))
+# O índice local (VECTOR_BACKEND=local) fica na memória de um processo: as gravações de um worker
+# não seriam vistas pelos outros, então esse backend usa um único worker
+if os.getenv("VECTOR_BACKEND", "qdrant").lower() == "local":
+    workers = 1
+# Limites por processo (fila do LLM, PDFs em paralelo) são divididos entre os workers em post_fork.
+# A coalescência de perguntas idênticas (single-flight) acontece apenas dentro de cada worker.
+# As métricas de cada worker são gravadas neste diretório e somadas no /metrics (ver metrics.py);
+# a variável precisa existir antes do preload da aplicação, que lê a configuração na importação
+if workers > 1:
+    os.environ.setdefault("METRICS_MULTIPROC_DIR", "/tmp/rag_metrics")
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+
+# Respostas do LLM (inclusive streaming) podem demorar; o prazo de cada consulta é controlado pela API
+timeout = int(os.getenv("API_WORKER_TIMEOUT", "600"))
+graceful_timeout = int(os.getenv("API_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("API_KEEPALIVE", "5"))
+
+# Threads do torch por worker: por padrão, os núcleos divididos entre os workers,
+# para que os workers não disputem os mesmos núcleos ao calcular embeddings
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", str(max(1, multiprocessing.cpu_count() // max(workers, 1)))))
+
+def on_starting(server):
+    """Executado no mestre ao iniciar: descarta as métricas gravadas por workers de uma execução anterior."""
+    directory = os.getenv("METRICS_MULTIPROC_DIR")
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for file_name in os.listdir(directory):
+        if file_name.endswith((".json", ".tmp")):
+            os.remove(os.path.join(directory, file_name))
+
+def when_ready(server):
+    """Executado no mestre, depois do preload da aplicação e antes do fork dos workers."""
+    from src.core.embedder import get_shared_embedder
+
+    # Só carrega o modelo: o encode de aquecimento (que inicializa o pool de threads do torch)
+    # acontece em cada worker, no startup da API, pois pools de threads não sobrevivem ao fork
+    get_shared_embedder()
+    _ensure_collections(server)
+
+    # Move os objetos já criados para uma geração permanente, ignorada pelo coletor de lixo:
+    # sem isso, cada coleta nos workers tocaria nesses objetos e forçaria a cópia das páginas
+    gc.freeze()
+    server.log.info("Modelo de embeddings carregado no mestre; compartilhado com %s workers.", workers)
+
+def _ensure_collections(server):
+    # Cria as coleções uma única vez, no mestre: se cada worker criasse as coleções ao iniciar,
+    # vários workers poderiam recriá-las ao mesmo tempo no primeiro boot. O cliente é fechado
+    # antes do fork, para que nenhuma conexão aberta seja compartilhada entre processos.
+    # Usa REST: um canal gRPC criado no mestre deixa threads do gRPC que não sobrevivem ao fork.
+    from src.core.vectordb import VectorDB, VECTOR_BACKEND
+    from src.ingestion.qdrant_config import COLLECTION_NAME
+
+    if VECTOR_BACKEND == "local":
+        return
+    try:
+        vectordb = VectorDB(collection_name=COLLECTION_NAME, prefer_grpc=False)
+        vectordb.client.close()
+    except Exception as e:
+        server.log.warning("Não foi possível verificar as coleções do Qdrant no mestre (os workers tentarão novamente): %s", e)
+
+def post_fork(server, worker):
+    import torch
+    from src.api.main import configure_worker_limits
+    from src.core.metrics import registry, METRICS_MULTIPROC_DIR
+
+    torch.set_num_threads(TORCH_THREADS_PER_WORKER)
+    configure_worker_limits(workers)
+    # A thread de gravação é iniciada em cada worker: threads do mestre não sobrevivem ao fork
+    if METRICS_MULTIPROC_DIR:
+        registry.start_snapshot_writer()
+
+def worker_exit(server, worker):
+    """Executado no worker ao encerrar: grava os valores finais das métricas."""
+    from src.core.metrics import registry, METRICS_MULTIPROC_DIR
+
+    if METRICS_MULTIPROC_DIR:
+        registry.write_snapshot()
+
+def child_exit(server, worker):
+    """Executado no mestre quando um worker termina: os gauges dele deixam de ser somados no /metrics."""
+    from src.core.metrics import registry, METRICS_MULTIPROC_DIR
+
+    if METRICS_MULTIPROC_DIR:
+        registry.mark_process_dead(worker.pid)
@@ -0,0 +1,179 @@
+import os
+import hashlib
+import numpy as np
+from typing import Any, Dict, List, Optional
+from qdrant_client import QdrantClient
+from qdrant_client.models import Filter, FieldCondition, MatchAny, MatchValue
+from ..core.metrics import DUPLICATE_CHUNKS
+from ..core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Detecção de chunks quase duplicados na ingestão (cabeçalhos, rodapés, avisos legais,
+# anexos repetidos e o mesmo documento publicado em URLs diferentes)
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "true").lower() == "true"
+# Distância de Hamming máxima entre as assinaturas SimHash (64 bits) para considerar dois chunks quase iguais
+DEDUP_MAX_HAMMING = int(os.getenv("DEDUP_MAX_HAMMING", "3"))
+# Máximo de candidatos lidos do Qdrant por ingestão
+DEDUP_MAX_CANDIDATES = int(os.getenv("DEDUP_MAX_CANDIDATES", "5000"))
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3 # palavras por shingle
+# A assinatura é dividida em faixas de 16 bits, indexadas no Qdrant (campo simhash_bands). Com distância
+# de Hamming <= 3, ao menos uma das 4 faixas é idêntica, então os candidatos são os pontos que
+# compartilham alguma faixa (LSH) e a distância exata é verificada apenas neles
+SIMHASH_BAND_BITS = 16
+
+def simhash(text: str) -> int:
+    """Assinatura SimHash (64 bits) do texto, calculada sobre shingles de SHINGLE_SIZE palavras."""
+    words = text.split()
+    if not words:
+        return 0
+    shingles = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 1))]
+    hashes = np.array(
+        [int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest(), "little") for s in shingles],
+        dtype=np.uint64,
+    )
+    # bits[i, j] = bit j do hash do shingle i
+    bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+    return int(np.packbits(votes > 0, bitorder="little").view(np.uint64)[0])
+
+def simhash_bands(fingerprint: int) -> List[str]:
+    return [
+        f"{band}:{(fingerprint >> (band * SIMHASH_BAND_BITS)) & ((1 << SIMHASH_BAND_BITS) - 1):04x}"
+        for band in range(SIMHASH_BITS // SIMHASH_BAND_BITS)
+    ]
+
+def fingerprint_payload(fingerprint: int) -> Dict[str, Any]:
+    """Campos de payload com a assinatura do chunk (o campo simhash_bands é indexado no Qdrant)."""
+    return {"simhash": f"{fingerprint:016x}", "simhash_bands": simhash_bands(fingerprint)}
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+class NearDuplicateDetector:
+    """
+    Detecta, durante uma ingestão, chunks quase idênticos a chunks já indexados no Qdrant
+    ou a chunks anteriores da mesma ingestão. O índice persistente são as próprias faixas
+    SimHash gravadas no payload dos pontos (removidas junto com eles).
+
+    Um chunk duplicado não é embedado nem gravado: a origem dele é acrescentada ao campo
+    duplicate_sources do chunk original (ver apply). Só é considerado duplicado de um chunk
+    que já é visível para todos os cargos do novo documento, para não ocultar conteúdo de ninguém.
+    Os chunks de ignore_source (a versão anterior de um documento em substituição, que será
+    apagada) não contam como originais.
+    """
+
+    def __init__(self, client: QdrantClient, collection_name: str, max_distance: int = DEDUP_MAX_HAMMING, ignore_source: Optional[str] = None):
+        self.client = client
+        self.collection_name = collection_name
+        self.max_distance = max_distance
+        self.ignore_source = ignore_source
+        # Chunks aceitos nesta ingestão (ainda não gravados): faixa -> [(id, assinatura, cargos)]
+        self._pending: Dict[str, List[tuple]] = {}
+        self._pending_ids = set()
+        # Origens a acrescentar em duplicate_sources, por id do chunk original
+        self._extra_sources: Dict[Any, List[Dict[str, Any]]] = {}
+        # Origem (source) de cada chunk conhecido, para não registrar um documento como duplicata de si mesmo
+        self._sources: Dict[Any, Optional[str]] = {}
+        self.skipped = 0
+
+    def find(self, point_ids: List[Any], fingerprints: List[int], allowed_roles: List[str], source_info: Dict[str, Any]) -> List[Optional[Any]]:
+        """
+        Para cada chunk (na ordem do documento), retorna o id do chunk original do qual ele é
+        quase duplicado (ou None). Os chunks não duplicados passam a valer como originais para os seguintes.
+        """
+        if not DEDUP_ENABLED or not point_ids:
+            return [None] * len(point_ids)
+
+        candidates = self._existing_candidates(fingerprints)
+        roles = set(allowed_roles)
+        result = []
+        for position, (point_id, fingerprint) in enumerate(zip(point_ids, fingerprints)):
+            bands = simhash_bands(fingerprint)
+            original = self._match(fingerprint, bands, roles, candidates)
+            result.append(original)
+            if original is None:
+                for band in bands:
+                    self._pending.setdefault(band, []).append((point_id, fingerprint, roles))
+                self._pending_ids.add(point_id)
+                self._sources[point_id] = source_info.get("source")
+                continue
+
+            self.skipped += 1
+            DUPLICATE_CHUNKS.inc()
+            if source_info.get("source") != self._sources.get(original):
+                # Posição e cargos da cópia, para que ela possa assumir o chunk se o documento original for removido
+                duplicate = {**source_info, "chunk_index": position + 1, "allowed_roles": list(allowed_roles)}
+                sources = self._extra_sources.setdefault(original, [])
+                if duplicate not in sources:
+                    sources.append(duplicate)
+        return result
+
+    def _match(self, fingerprint: int, bands: List[str], roles: set, candidates: Dict[str, List[tuple]]) -> Optional[Any]:
+        for index in (self._pending, candidates):
+            for band in bands:
+                for point_id, other, other_roles in index.get(band, ()):
+                    if roles <= other_roles and hamming(fingerprint, other) <= self.max_distance:
+                        return point_id
+        return None
+
+    def _existing_candidates(self, fingerprints: List[int]) -> Dict[str, List[tuple]]:
+        """Lê do Qdrant os pontos que compartilham alguma faixa SimHash com os chunks (uma consulta por ingestão)."""
+        bands = sorted({band for f in fingerprints for band in simhash_bands(f)})
+        candidates: Dict[str, List[tuple]] = {}
+        candidates_filter = Filter(
+            must=[FieldCondition(key="simhash_bands", match=MatchAny(any=bands))],
+            must_not=[FieldCondition(key="source", match=MatchValue(value=self.ignore_source))] if self.ignore_source is not None else None,
+        )
+        offset = None
+        read = 0
+        try:
+            while read < DEDUP_MAX_CANDIDATES:
+                records, offset = self.client.scroll(
+                    collection_name=self.collection_name,
+                    scroll_filter=candidates_filter,
+                    limit=min(1000, DEDUP_MAX_CANDIDATES - read),
+                    offset=offset,
+                    with_payload=["simhash", "simhash_bands", "allowed_roles", "source"],
+                    with_vectors=False,
+                )
+                for r in records:
+                    entry = (r.id, int(r.payload["simhash"], 16), set(r.payload.get("allowed_roles") or []))
+                    self._sources[r.id] = r.payload.get("source")
+                    for band in r.payload.get("simhash_bands", []):
+                        candidates.setdefault(band, []).append(entry)
+                read += len(records)
+                if offset is None:
+                    break
+            else:
+                # Candidatos além do limite não são comparados: quase duplicados entre eles passam despercebidos
+                logger.warning("[DEDUP] Limite de %s candidatos (DEDUP_MAX_CANDIDATES) atingido; parte dos chunks existentes não foi comparada.", DEDUP_MAX_CANDIDATES)
+        except Exception as e:
+            # Sem a consulta, a ingestão segue apenas com a deduplicação dentro do próprio lote
+            logger.warning("[DEDUP] Falha ao consultar chunks existentes: %s", e)
+        return candidates
+
+    def apply(self, points: list):
+        """
+        Registra as origens dos chunks duplicados: nos pontos desta ingestão (antes do upsert)
+        e, via set_payload, nos pontos que já estavam no Qdrant.
+        """
+        if not self._extra_sources:
+            return
+        by_id = {p.id: p for p in points}
+        existing = []
+        for point_id, sources in self._extra_sources.items():
+            if point_id in by_id:
+                by_id[point_id].payload.setdefault("duplicate_sources", []).extend(sources)
+            elif point_id not in self._pending_ids:
+                existing.append(point_id)
+
+        if existing:
+            records = self.client.retrieve(collection_name=self.collection_name, ids=existing, with_payload=["duplicate_sources"])
+            for r in records:
+                merged = list(r.payload.get("duplicate_sources") or [])
+                merged.extend(s for s in self._extra_sources[r.id] if s not in merged)
+                self.client.set_payload(collection_name=self.collection_name, payload={"duplicate_sources": merged}, points=[r.id])
+        logger.info("[DEDUP] %s chunks quase duplicados ignorados; origens registradas em %s chunks.", self.skipped, len(self._extra_sources))
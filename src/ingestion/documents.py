@@ -0,0 +1,211 @@
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    Filter,
+    FieldCondition,
+    MatchValue,
+    HasIdCondition,
+    IsEmptyCondition,
+    PayloadField,
+    FilterSelector,
+    PointIdsList,
+    PointStruct,
+)
+from .qdrant_config import COLLECTION_NAME
+from .storage import get_content_store
+from ..core.vectordb import build_document_point, document_collection_name
+from ..core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Campos do payload que identificam o documento de um chunk (assumidos por uma cópia na reatribuição)
+_DOCUMENT_FIELDS = ("source", "display_name", "file_in_storage", "last_updated", "chunk_index", "allowed_roles")
+
+def _source_filter(source: str) -> Filter:
+    return Filter(must=[FieldCondition(key="source", match=MatchValue(value=source))])
+
+def _scroll_all(client: QdrantClient, collection: str, scroll_filter: Filter, with_payload=True, with_vectors=False):
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection,
+            scroll_filter=scroll_filter,
+            limit=1000,
+            offset=offset,
+            with_payload=with_payload,
+            with_vectors=with_vectors,
+        )
+        yield from records
+        if offset is None:
+            break
+
+def _dense_vector(vector):
+    # Pontos com vetor esparso guardam o denso sob o nome "" (ver build_point_vector)
+    return vector[""] if isinstance(vector, dict) else vector
+
+def _group_duplicates(duplicates: List[Dict[str, Any]]) -> List[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """
+    Distribui as cópias de um chunk entre as que passam a ter o chunk gravado (cada uma com os próprios
+    cargos) e as que continuam registradas em duplicate_sources de uma delas. Uma cópia só fica
+    registrada numa origem cujos cargos cobrem os dela (como na deduplicação); as demais recebem o
+    próprio ponto. A primeira cópia sempre recebe o chunk.
+    """
+    groups = []
+    for duplicate in duplicates:
+        roles = set(duplicate.get("allowed_roles") or [])
+        for owner, covered in groups:
+            if roles <= set(owner.get("allowed_roles") or []):
+                covered.append(duplicate)
+                break
+        else:
+            groups.append((duplicate, []))
+    return groups
+
+def _owner_payload(owner: Dict[str, Any], covered: List[Dict[str, Any]]) -> Dict[str, Any]:
+    payload = {field: owner.get(field) for field in _DOCUMENT_FIELDS}
+    payload.update({"allowed_roles": list(owner.get("allowed_roles") or []), "duplicate_sources": covered})
+    return payload
+
+def _reassign_duplicated_chunks(client: QdrantClient, points_filter: Filter) -> Tuple[int, List[str]]:
+    """
+    Chunks removidos que também pertencem a outros documentos (duplicate_sources, ver dedup.py)
+    não são apagados: passam para a primeira cópia, com os cargos dela (nunca a união dos cargos
+    das cópias, que exporia o chunk e o arquivo dessa origem a quem não podia vê-los). Cópias cujos
+    cargos ela não cobre recebem um ponto próprio com o mesmo vetor. Retorna o número de chunks
+    reatribuídos e as origens que os receberam.
+    """
+    duplicated_filter = Filter(
+        must=[points_filter],
+        must_not=[IsEmptyCondition(is_empty=PayloadField(key="duplicate_sources"))],
+    )
+    reassigned = 0
+    promoted_sources = set()
+    for record in _scroll_all(client, COLLECTION_NAME, duplicated_filter, with_vectors=True):
+        (heir, heir_covered), *others = _group_duplicates(record.payload["duplicate_sources"])
+        client.set_payload(collection_name=COLLECTION_NAME, payload=_owner_payload(heir, heir_covered), points=[record.id])
+        copies = [
+            PointStruct(id=str(uuid.uuid4()), vector=record.vector, payload={**record.payload, **_owner_payload(owner, covered)})
+            for owner, covered in others
+        ]
+        if copies:
+            client.upsert(collection_name=COLLECTION_NAME, points=copies)
+        promoted_sources.update([heir["source"]] + [owner["source"] for owner, _ in others])
+        reassigned += 1
+    return reassigned, sorted(promoted_sources)
+
+def _remove_duplicate_references(client: QdrantClient, source: str, version: Optional[str] = None, keep_version: Optional[str] = None) -> int:
+    """
+    Remove a origem das listas duplicate_sources dos chunks de outros documentos. Na substituição de um
+    documento, version/keep_version restringem a remoção às referências de uma versão (pelo last_updated).
+    """
+    def matches(d: Dict[str, Any]) -> bool:
+        if d.get("source") != source:
+            return False
+        if version is not None and d.get("last_updated") != version:
+            return False
+        return keep_version is None or d.get("last_updated") != keep_version
+
+    reference_filter = Filter(must=[FieldCondition(key="duplicate_sources[].source", match=MatchValue(value=source))])
+    updated = 0
+    for record in _scroll_all(client, COLLECTION_NAME, reference_filter, with_payload=["duplicate_sources"]):
+        duplicates = record.payload.get("duplicate_sources") or []
+        remaining = [d for d in duplicates if not matches(d)]
+        if len(remaining) == len(duplicates):
+            continue
+        client.set_payload(collection_name=COLLECTION_NAME, payload={"duplicate_sources": remaining}, points=[record.id])
+        updated += 1
+    return updated
+
+def document_point_ids(client: QdrantClient, source: str) -> List[Any]:
+    """IDs dos chunks gravados de um documento (a versão atual, antes de uma substituição)."""
+    return [r.id for r in _scroll_all(client, COLLECTION_NAME, _source_filter(source), with_payload=False)]
+
+def rebuild_document_vector(client: QdrantClient, source: str):
+    """Recalcula o vetor de nível de documento (busca em dois estágios) a partir dos chunks gravados."""
+    records = list(_scroll_all(client, COLLECTION_NAME, _source_filter(source), with_vectors=True))
+    documents_collection = document_collection_name(COLLECTION_NAME)
+    if not records:
+        client.delete(collection_name=documents_collection, points_selector=PointIdsList(points=[str(uuid.uuid5(uuid.NAMESPACE_URL, source))]))
+        return
+    first = records[0].payload
+    client.upsert(
+        collection_name=documents_collection,
+        points=[build_document_point(source, [_dense_vector(r.vector) for r in records], {
+            "display_name": first.get("display_name"),
+            "file_in_storage": first.get("file_in_storage"),
+            "last_updated": max(r.payload.get("last_updated") or "" for r in records),
+            "allowed_roles": sorted({role for r in records for role in r.payload.get("allowed_roles") or []}),
+        })],
+    )
+
+def delete_document(client: QdrantClient, source: str, remove_file: bool = True) -> Dict[str, Any]:
+    """
+    Remove um documento (source) do índice, sem recriar a coleção: os chunks são apagados
+    por um filtro sobre o campo indexado 'source' e o vetor do documento pelo seu ID (UUID5 da source).
+
+    Chunks compartilhados com outros documentos (quase duplicados) são reatribuídos a eles, e as
+    referências ao documento em duplicate_sources são removidas. Com remove_file, o PDF também é
+    removido do armazenamento (se nenhuma outra origem o referenciar).
+    """
+    total = client.count(collection_name=COLLECTION_NAME, count_filter=_source_filter(source), exact=True).count
+
+    reassigned, promoted_sources = _reassign_duplicated_chunks(client, _source_filter(source))
+    if total > reassigned:
+        client.delete(collection_name=COLLECTION_NAME, points_selector=FilterSelector(filter=_source_filter(source)), wait=True)
+    client.delete(
+        collection_name=document_collection_name(COLLECTION_NAME),
+        points_selector=PointIdsList(points=[str(uuid.uuid5(uuid.NAMESPACE_URL, source))]),
+        wait=True,
+    )
+    references = _remove_duplicate_references(client, source)
+    for promoted in promoted_sources:
+        rebuild_document_vector(client, promoted)
+
+    removed_file = get_content_store().unlink(source) if remove_file else None
+
+    logger.info("[DOCUMENTS] Documento %s removido: %s chunks apagados, %s reatribuídos a %s.", source, total - reassigned, reassigned, promoted_sources)
+    return {
+        "chunks_removidos": total - reassigned,
+        "chunks_reatribuidos": reassigned,
+        "referencias_removidas": references,
+        "arquivo_removido": removed_file,
+    }
+
+def remove_previous_version(client: QdrantClient, source: str, previous_ids: List[Any], version: str) -> Dict[str, Any]:
+    """
+    Conclui a substituição de um documento, depois que a nova versão (gravada com last_updated=version
+    e IDs novos) foi processada: apaga os chunks da versão anterior (previous_ids), reatribuindo os
+    compartilhados com outros documentos, e as referências da versão anterior em duplicate_sources.
+    O vetor do documento já é o da nova versão.
+    """
+    previous_filter = Filter(must=[FieldCondition(key="source", match=MatchValue(value=source)), HasIdCondition(has_id=previous_ids)])
+    reassigned, promoted_sources = _reassign_duplicated_chunks(client, previous_filter) if previous_ids else (0, [])
+    if len(previous_ids) > reassigned:
+        # Os chunks reatribuídos já pertencem a outra source e não são apagados pelo filtro
+        client.delete(collection_name=COLLECTION_NAME, points_selector=FilterSelector(filter=previous_filter), wait=True)
+    references = _remove_duplicate_references(client, source, keep_version=version)
+    for promoted in promoted_sources:
+        rebuild_document_vector(client, promoted)
+
+    logger.info("[DOCUMENTS] Versão anterior de %s removida: %s chunks apagados, %s reatribuídos a %s.", source, len(previous_ids) - reassigned, reassigned, promoted_sources)
+    return {
+        "chunks_removidos": len(previous_ids) - reassigned,
+        "chunks_reatribuidos": reassigned,
+        "referencias_removidas": references,
+    }
+
+def discard_new_version(client: QdrantClient, source: str, previous_ids: List[Any], version: str):
+    """
+    Desfaz uma substituição que falhou: apaga os chunks gravados pela nova versão (os que não estão em
+    previous_ids) e as referências dela em duplicate_sources, e recalcula o vetor do documento a partir
+    dos chunks da versão anterior, que continua valendo.
+    """
+    previous = set(previous_ids)
+    new_ids = [point_id for point_id in document_point_ids(client, source) if point_id not in previous]
+    if new_ids:
+        client.delete(collection_name=COLLECTION_NAME, points_selector=PointIdsList(points=new_ids), wait=True)
+    _remove_duplicate_references(client, source, version=version)
+    rebuild_document_vector(client, source)
+    logger.info("[DOCUMENTS] Nova versão de %s descartada (%s chunks); a versão anterior foi mantida.", source, len(new_ids))
+
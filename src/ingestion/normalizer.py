@@ -1,6 +1,53 @@
+import os
 import re
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
 from unidecode import unidecode
 
+# Processos usados por normalize_texts (normalização de vários documentos em paralelo)
+NORMALIZER_WORKERS = int(os.getenv("NORMALIZER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Abaixo deste total de caracteres, o lote é normalizado no próprio processo (enviar os textos
+# para outros processos custaria mais do que normalizá-los)
+NORMALIZER_POOL_MIN_CHARS = int(os.getenv("NORMALIZER_POOL_MIN_CHARS", "1000000"))
+
+# Caracteres considerados em "sequências longas de pontuação" (regra 1 abaixo)
+_RUN_CHARS = r"[.\s\-_]"
+# Marcação "(nr) art." (regra 2). Entre "(nr)" e "art." pode haver até 4 espaços ou uma sequência
+# longa (que a regra 1 reduziria a um espaço); o ponto de "art." não pode iniciar uma sequência longa
+_NR_ART_TAIL = rf"(?:\s{{0,4}}|{_RUN_CHARS}{{5,}})art\.(?!{_RUN_CHARS}{{4}})"
+_NR_ART = rf"\(nr\){_NR_ART_TAIL}"
+
+# Todas as regras numa única expressão, aplicada em uma passada sobre o texto:
+#   1. sequências de 5 ou mais pontos, espaços, hífens ou underscores -> espaço
+#   2. marcação "(nr) art." -> espaço
+#   3. marcação '"(nr)' -> espaço (exceto quando o "(nr)" faz parte de uma marcação da regra 2,
+#      que tem precedência, como na aplicação sequencial das regras)
+#   4. qualquer outro espaço em branco (exceto um espaço simples, que já está normalizado) -> espaço
+# Espaços adjacentes resultantes das substituições são unidos num só ao final.
+_RULES = re.compile(
+    rf"{_RUN_CHARS}{{5,}}"
+    rf"|{_NR_ART}"
+    rf"|\"\(nr\)(?!{_NR_ART_TAIL})"
+    rf"| \s+|[^\S ]\s*"
+)
+_MULTIPLE_SPACES = re.compile(r" {2,}")
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+# Transliteração (unidecode) por caractere, preenchida sob demanda e usada com str.translate.
+# Os caracteres ASCII mapeiam para si mesmos: sem eles, cada caractere ASCII seria uma busca sem sucesso (lenta)
+_TRANSLITERATION = {i: i for i in range(128)}
+
+def _transliterate(text: str) -> str:
+    # O unidecode converte caractere a caractere: o resultado é o mesmo de unidecode(text),
+    # mas a tabela é consultada em C em vez de um laço Python sobre todo o texto
+    for char in set(_NON_ASCII.findall(text)):
+        if ord(char) not in _TRANSLITERATION:
+            _TRANSLITERATION[ord(char)] = unidecode(char)
+    return text.translate(_TRANSLITERATION)
+
 def normalize_text(text):
     """
     Normaliza todos os campos de um dicionário (item):
@@ -8,21 +55,54 @@ def normalize_text(text):
     - remove acentos
     - remove caracteres especiais indesejados
     - remove múltiplos espaços consecutivos
+
+    As regras de limpeza são aplicadas numa única passada (expressão pré-compilada), com
+    resultado idêntico ao da aplicação sequencial (ver normalize_text_reference).
     """
     if not isinstance(text, str):
         # Proteção extra para garantir que só processa strings
         return ""
-    
+
     text = text.lower().strip() # lowercase e strip
-    text = unidecode(text) # remove acentos
+    if not text.isascii():
+        text = _transliterate(text) # remove acentos
+
+    text = _RULES.sub(" ", text)
+    if "  " in text:
+        text = _MULTIPLE_SPACES.sub(" ", text)
+    return text.strip()
 
-    # Remove longas sequências de pontuação ou caracteres repetidos
+def normalize_text_reference(text):
+    """Implementação original (uma passada por regra), mantida como referência para testes e benchmark."""
+    if not isinstance(text, str):
+        return ""
+
+    text = text.lower().strip()
+    text = unidecode(text)
     text = re.sub(r'(\.|\s|\-|_){5,}', ' ', text)
-    # Remove marcações típicas de final de documento/seção que não são texto
     text = re.sub(r'\(nr\)\s*art\.', ' ', text)
     text = re.sub(r'\"\(nr\)', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
 
-    # Remove múltiplos espaços e novas linhas
-    text = re.sub(r'\s+', ' ', text).strip()   
-    
-    return text
\ No newline at end of file
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # "spawn": os processos não herdam o estado do processo da API (modelo, threads do torch, conexões)
+            _pool = ProcessPoolExecutor(max_workers=NORMALIZER_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+def normalize_texts(texts: List[str]) -> List[str]:
+    """
+    Normaliza vários documentos, distribuindo-os entre processos (NORMALIZER_WORKERS) quando
+    o lote é grande o suficiente para compensar a transferência dos textos. Mantém a ordem.
+    """
+    total_chars = sum(len(t) for t in texts if isinstance(t, str))
+    if NORMALIZER_WORKERS <= 1 or len(texts) <= 1 or total_chars < NORMALIZER_POOL_MIN_CHARS:
+        return [normalize_text(t) for t in texts]
+    return list(_get_pool().map(normalize_text, texts))
@@ -1,30 +1,35 @@
 from pypdf import PdfReader
 import os
 from io import BytesIO
+from ..core.log import get_logger
+
+logger = get_logger(__name__)
 
 def extract_text_from_local_pdf(file_path):
     """
     Realiza a raspagem do texto de um arquivo PDF já salvo localmente.
     """
     if not os.path.exists(file_path):
-        print(f"[PARSER][ERRO] Arquivo PDF não encontrado no caminho: {file_path}")
+        logger.error("[PARSER][ERRO] Arquivo PDF não encontrado no caminho: %s", file_path)
         return None
         
     try:
-        print(f"[PARSER] Extraindo texto do arquivo local: {os.path.basename(file_path)}")
+        logger.info("[PARSER] Extraindo texto do arquivo local: %s", os.path.basename(file_path))
         reader = PdfReader(file_path)
         
-        text = ""
+        # O texto das páginas é acumulado numa lista e unido uma única vez no final
+        # (concatenar a cada página copiaria o texto inteiro repetidamente)
+        pages = []
         for page in reader.pages:
-            # Garante que o texto de diferentes páginas seja separado
             page_text = page.extract_text()
             if page_text:
-                text += page_text + "\n\n" 
+                pages.append(page_text)
         
-        extracted_text = text.strip()
-        print(f"[PARSER] Extração concluída. Total de caracteres: {len(extracted_text)}")
+        # Garante que o texto de diferentes páginas seja separado
+        extracted_text = "\n\n".join(pages).strip()
+        logger.info("[PARSER] Extração concluída. Total de caracteres: %s", len(extracted_text))
         return extracted_text
         
     except Exception as e:
-        print(f"[PARSER][ERRO EXTRAÇÃO] Falha ao ler PDF local {file_path}: {e}")
+        logger.error("[PARSER][ERRO EXTRAÇÃO] Falha ao ler PDF local %s: %s", file_path, e)
         return None
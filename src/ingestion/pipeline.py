@@ -3,10 +3,12 @@ import json
 import hashlib
 import uuid
 from .scraper import url_to_local_pdf
+from .storage import get_content_store
 from .parser import extract_text_from_local_pdf
 from .normalizer import normalize_text
 from ..core.embedder import Embedder
-from ..core.vectordb import VectorDB
+from ..core.vectordb import create_vectordb
+from ..core.sparse import sparse_encoder
 from datetime import datetime
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 RAW_DATA_DIR = os.path.join(BASE_DIR, 'data', 'raw')
@@ -44,11 +46,11 @@ def run_ingestion_pipeline():
     os.makedirs(LOCAL_PDFS_DIR, exist_ok=True) 
 
     embedder = Embedder()
-    vectordb = VectorDB()
+    vectordb = create_vectordb(vector_size=embedder.dimension)
     all_chunks_for_db  = []
     
     # Verifica a dimensão do embedding
-    embedding_dim = embedder.model.get_sentence_embedding_dimension()
+    embedding_dim = embedder.dimension
     
     # Obtem o timestamp exato de quando o documento está sendo processado, para garantir que todos os chunks do mesmo documento tenham a mesma data de processamento.
     current_timestamp_full = datetime.now().isoformat(timespec='milliseconds')
@@ -74,9 +76,10 @@ def run_ingestion_pipeline():
             extracted_text = extract_text_from_local_pdf(local_pdf_path)
             
             # COMENTAR ESSA PARTE PARA VISUALIZAR OS PDFs TEMPORÁRIOS
-            # Limpeza do arquivo temporário 
+            # Limpeza do arquivo temporário (pelo índice do armazenamento: o mesmo conteúdo
+            # pode estar referenciado por outra URL do lote e, nesse caso, é mantido)
             try:
-                os.remove(local_pdf_path)
+                get_content_store(LOCAL_PDFS_DIR).unlink(url)
             except Exception as e:
                 print(f"[PIPELINE] Aviso: Não foi possível remover arquivo temp {local_pdf_path}. {e}")
         
@@ -88,13 +91,16 @@ def run_ingestion_pipeline():
                     continue
                 
                 # Chunking (usa o texto já limpo/normalizado e o divide)
-                chunk_texts = list(embedder.chunk_text(normalized_text))
+                chunked = embedder.chunk_text_with_counts(normalized_text)
+                chunk_texts = [c.text for c in chunked]
+                token_counts = [c.token_count for c in chunked]
                 if not chunk_texts:
                     print(f"[PIPELINE] Documento extraído, mas nenhum chunk gerado para {url}. Pulando.")
                     continue
                 
                 # Geração de Embedding (usando o texto normalizado e em chunks)
-                embeddings = embedder.embed(chunk_texts)
+                embeddings = embedder.embed(chunk_texts, token_counts=token_counts)
+                sparse_embeddings = sparse_encoder.encode_documents(chunk_texts)
                 
                 print(f"[PIPELINE] Texto normalizado com {len(chunk_texts)} chunks. Embeddings gerados ({embedding_dim} dimensões).")
             
@@ -108,8 +114,10 @@ def run_ingestion_pipeline():
                         "chunk": chunk,
                         "source": url,
                         "chunk_index": i + 1, # importante para contexto: retornar os chunks em volta
+                        "token_count": token_counts[i],
                         "last_updated": current_timestamp_for_payload,
-                        "embedding": embeddings[i].tolist() 
+                        "embedding": embeddings[i].tolist(),
+                        "sparse_embedding": sparse_embeddings[i],
                     })
             else:
                 print(f"[PIPELINE][ERRO] Nenhum texto retornado de {url}")
@@ -124,7 +132,7 @@ def run_ingestion_pipeline():
     
     # Geração do arquivo 'scraped_data.json' (Com embeddings)
     with open(SCRAPED_OUTPUT_FILE, 'w', encoding='utf-8') as f:
-        json.dump(all_chunks_for_db , f, ensure_ascii=False, indent=4)
+        json.dump(all_chunks_for_db , f, ensure_ascii=False, indent=4, default=lambda v: v.model_dump())
     print(f"\nDados processados (com embedding) salvos em: {SCRAPED_OUTPUT_FILE} ({len(all_chunks_for_db )} chunks)")
 
     # Geração do arquivo 'normalized_data.json' (Apenas texto e fonte)
@@ -141,7 +149,7 @@ def run_ingestion_pipeline():
     # Armazenamento no Qdrant - banco vetorial
     print("[PIPELINE] Salvando os dados no Qdrant...")
     vectordb.add_documents(all_chunks_for_db)
-    count = vectordb.client.count(collection_name="documents").count
+    count = vectordb.count()
     print(f"[PIPELINE] Total de documentos salvos no Qdrant: {count}")
 
     # print("\nExemplo de documento processado:")
@@ -7,68 +7,151 @@ from qdrant_client.http.models import PointStruct
 from .qdrant_config import get_qdrant_client, COLLECTION_NAME
 from .parser import extract_text_from_local_pdf 
 from ..core.embedder import Embedder 
-from .normalizer import normalize_text
+from ..core.sparse import sparse_encoder
+from ..core.vectordb import build_point_vector, build_document_point, collection_has_sparse, document_collection_name, VECTOR_BACKEND
+from ..core.metrics import ingestion_stage, ERRORS
+from ..core.log import get_logger
+from .normalizer import normalize_text, normalize_texts
 from .scraper import url_to_local_pdf
+from .storage import STORAGE_DIR
+from .dedup import NearDuplicateDetector, simhash, fingerprint_payload
 
-# Inicialização de instância
-qdrant_client = get_qdrant_client()
+logger = get_logger(__name__)
 
-# Diretório base para salvar os arquivos
-STORAGE_DIR = "/app/storage"
-os.makedirs(STORAGE_DIR, exist_ok=True)
+# Cliente do Qdrant da ingestão, criado no primeiro uso (ou pré-criado na inicialização da API)
+_qdrant_client = None
 
-def process_pdf(file_path: str, source_url: str, file_name_in_storage: str, display_name: str, embedder: Embedder, allowed_roles: list[str]):
+def get_ingestion_client():
+    """Retorna o cliente do Qdrant usado na ingestão, conectando-se na primeira chamada."""
+    global _qdrant_client
+    if _qdrant_client is None:
+        if VECTOR_BACKEND == "local":
+            raise RuntimeError("A ingestão pela API exige o Qdrant; com VECTOR_BACKEND=local, indexe pelo pipeline (VectorDB.add_documents).")
+        _qdrant_client = get_qdrant_client()
+    return _qdrant_client
+
+
+def _encode_sparse(chunks: list[str], collection_name: str = COLLECTION_NAME) -> list:
+    """
+    Gera os vetores esparsos dos chunks, se a coleção suportar vetores esparsos.
+    Caso contrário, retorna uma lista de None (apenas o vetor denso é gravado).
+    """
+    if not collection_has_sparse(get_ingestion_client(), collection_name):
+        return [None] * len(chunks)
+    return sparse_encoder.encode_documents(chunks)
+
+def _unique_chunks(detector: NearDuplicateDetector, chunks: list[str], allowed_roles: list[str], source_info: dict):
+    """
+    Gera os ids e as assinaturas SimHash dos chunks e descarta os quase duplicados
+    (de chunks já indexados ou de chunks anteriores da mesma ingestão).
+    Retorna os índices dos chunks mantidos, os ids e as assinaturas de todos os chunks.
+    """
+    point_ids = [str(uuid.uuid4()) for _ in chunks]
+    fingerprints = [simhash(chunk) for chunk in chunks]
+    originals = detector.find(point_ids, fingerprints, allowed_roles, source_info)
+    kept = [i for i, original in enumerate(originals) if original is None]
+    if len(kept) < len(chunks):
+        logger.info("[DEDUP] %s de %s chunks de %s são quase duplicados e não serão gravados.", len(chunks) - len(kept), len(chunks), source_info["source"])
+    return kept, point_ids, fingerprints
+
+def process_pdf(file_path: str, source_url: str, file_name_in_storage: str, display_name: str, embedder: Embedder, allowed_roles: list[str],
+                collection_name: str = COLLECTION_NAME, last_updated: str | None = None, replacing: bool = False):
     """ 
     Orquestra a ingestão de um único arquivo PDF, reusando os componentes
     do pipeline principal (extração, normalização, chunking, embedding).
+    collection_name e last_updated permitem gravar em outra coleção preservando a data
+    original do documento (reindexação, ver reindex.py). Com replacing, os chunks já gravados
+    da mesma source (versão anterior, apagada depois) são ignorados na deduplicação.
+    Retorna o número de chunks gravados.
     """
     # 1. EXTRAÇÃO (Parser)
-    raw_text = extract_text_from_local_pdf(file_path)
+    with ingestion_stage("parse"):
+        raw_text = extract_text_from_local_pdf(file_path)
     if not raw_text:
-        print(f"[PROCESS PDF] Nenhum texto extraído de {file_path}. Abortando.")
-        return
+        logger.info("[PROCESS PDF] Nenhum texto extraído de %s. Abortando.", file_path)
+        return 0
     
     # 2. NORMALIZAÇÃO (Normalizer)
-    clean_text = normalize_text(raw_text)
+    with ingestion_stage("normalize"):
+        clean_text = normalize_text(raw_text)
     if not clean_text:
-        print(f"[PROCESS PDF] Texto normalizado vazio. Abortando.")
-        return
+        logger.info("[PROCESS PDF] Texto normalizado vazio. Abortando.")
+        return 0
     
     # 3. CHUNKING (Embedder)
-    # Usa o método chunk_text da instância Embedder
-    chunks = list(embedder.chunk_text(clean_text))
+    # Chunks limitados à janela do modelo, com o número de tokens de cada um
+    with ingestion_stage("chunk"):
+        chunked = embedder.chunk_text_with_counts(clean_text)
+    chunks = [c.text for c in chunked]
+    token_counts = [c.token_count for c in chunked]
     if not chunks:
-        print(f"[PROCESS PDF] Nenhum chunk gerado. Abortando.")
-        return
+        logger.info("[PROCESS PDF] Nenhum chunk gerado. Abortando.")
+        return 0
+
+    # 4. DEDUPLICAÇÃO: chunks quase idênticos a chunks já indexados não são embedados nem gravados
+    current_timestamp = last_updated or datetime.now().isoformat(timespec='milliseconds')
+    detector = NearDuplicateDetector(get_ingestion_client(), collection_name, ignore_source=source_url if replacing else None)
+    with ingestion_stage("dedup"):
+        kept, point_ids, fingerprints = _unique_chunks(detector, chunks, allowed_roles, {
+            "source": source_url,
+            "display_name": display_name,
+            "file_in_storage": file_name_in_storage,
+            "last_updated": current_timestamp,
+        })
+    kept_chunks = [chunks[i] for i in kept]
     
-    # 4. EMBEDDING (Embedder)
+    # 5. EMBEDDING (Embedder)
     # Usa o método embed da instância Embedder. Converte para list para o Qdrant.
-    embeddings = embedder.embed(chunks).tolist()
-    
-    # 5. MONTAGEM E PERSISTÊNCIA NO QDRANT
-    current_timestamp = datetime.now().isoformat(timespec='milliseconds')
+    embeddings = []
+    sparse_embeddings = []
+    if kept_chunks:
+        with ingestion_stage("embed"):
+            embeddings = embedder.embed(kept_chunks, token_counts=[token_counts[i] for i in kept]).tolist()
+
+            # Vetores esparsos lexicais (busca híbrida), gerados sobre o mesmo texto normalizado
+            sparse_embeddings = _encode_sparse(kept_chunks, collection_name)
     
+    # 6. MONTAGEM E PERSISTÊNCIA NO QDRANT
     points = []
 
-    for i in range(len(chunks)):
-        unique_point_id = str(uuid.uuid4())        
+    # chunk_index continua sendo a posição do chunk no documento (há lacunas onde havia duplicatas)
+    for i, embedding, sparse_embedding in zip(kept, embeddings, sparse_embeddings):
         points.append(
             PointStruct(
-                id=unique_point_id,
-                vector=embeddings[i],
+                id=point_ids[i],
+                vector=build_point_vector(embedding, sparse_embedding),
                 payload={
                     "chunk": chunks[i],
                     "source": source_url,
                     "file_in_storage": file_name_in_storage, 
                     "display_name": display_name,
                     "chunk_index": i + 1, 
+                    "token_count": token_counts[i],
                     "last_updated": current_timestamp, 
                     "allowed_roles": allowed_roles,
+                    **fingerprint_payload(fingerprints[i]),
                 }
             )
         )
-    qdrant_client.upsert(collection_name=COLLECTION_NAME, points=points)
-    print(f"[PROCESS_PDF_URL] {len(points)} chunks (Roles: {allowed_roles}) do arquivo {source_url} processados e adicionados")
+    with ingestion_stage("upsert"):
+        detector.apply(points)
+        if not points:
+            logger.info("[PROCESS_PDF_URL] Todos os chunks de %s já estavam indexados (quase duplicados).", source_url)
+            return 0
+        get_ingestion_client().upsert(collection_name=collection_name, points=points)
+
+        # Vetor de nível de documento (média dos chunks), usado na busca em dois estágios
+        get_ingestion_client().upsert(
+            collection_name=document_collection_name(collection_name),
+            points=[build_document_point(source_url, embeddings, {
+                "display_name": display_name,
+                "file_in_storage": file_name_in_storage,
+                "last_updated": current_timestamp,
+                "allowed_roles": allowed_roles,
+            })],
+        )
+    logger.info("[PROCESS_PDF_URL] %s chunks (Roles: %s) do arquivo %s processados e adicionados", len(points), allowed_roles, source_url)
+    return len(points)
 
 def process_url(url: str, embedder: Embedder, allowed_roles: list[str]) -> str | None:
     """
@@ -81,7 +164,7 @@ def process_url(url: str, embedder: Embedder, allowed_roles: list[str]) -> str |
     
     try:
         # 1. AQUISIÇÃO/SCRAPING: Baixa o PDF para o disco local
-        print(f"[PROCESS URL] Tentando baixar {url}...")
+        logger.info("[PROCESS URL] Tentando baixar %s...", url)
         local_pdf_path = url_to_local_pdf(url, STORAGE_DIR)
         
         if local_pdf_path:
@@ -97,11 +180,12 @@ def process_url(url: str, embedder: Embedder, allowed_roles: list[str]) -> str |
             )
             return file_name
         else:
-            print(f"[PROCESS URL] Falha na aquisição da URL: {url}")
+            logger.warning("[PROCESS URL] Falha na aquisição da URL: %s", url)
             return None
             
     except Exception as e:
-        print(f"[PROCESS URL] Erro ao processar URL {url}: {e}")
+        ERRORS.inc(stage="ingestion")
+        logger.error("[PROCESS URL] Erro ao processar URL %s: %s", url, e)
         return None
     
             
@@ -113,76 +197,120 @@ def process_batch_urls(urls_list: list[str], embedder: Embedder, allowed_roles:
     Retorna o número de chunks processados.
     """
     if not urls_list:
-        print("[BATCH] Nenhuma URL para processar.")
+        logger.info("[BATCH] Nenhuma URL para processar.")
         return 0
 
-    print(f"[BATCH] Iniciando processamento em lote de {len(urls_list)} URLs...")
+    logger.info("[BATCH] Iniciando processamento em lote de %s URLs...", len(urls_list))
     
     all_chunks_for_db = []
+    document_points = []
     
     # O timestamp é o mesmo para todo o lote, para rastreamento
     current_timestamp_full = datetime.now().isoformat(timespec='milliseconds')
             
+    # AQUISIÇÃO e EXTRAÇÃO de todas as URLs; a normalização é feita depois, em lote
+    documents = []
     for idx, url in enumerate(urls_list, start=1):
         local_pdf_path = None
-        print(f"  ({idx}/{len(urls_list)}) Processando URL: {url}")
+        logger.info("(%s/%s) Processando URL: %s", idx, len(urls_list), url)
         
         try:
             # AQUISIÇÃO/SCRAPING: Baixa o PDF
             local_pdf_path = url_to_local_pdf(url, STORAGE_DIR)
             
             if not local_pdf_path:
-                print(f"  [ERRO] Falha na aquisição (URL não retornou PDF) para: {url}")
+                logger.error("[ERRO] Falha na aquisição (URL não retornou PDF) para: %s", url)
                 continue
-            
-            # DADOS para o frontend
-            file_name = os.path.basename(local_pdf_path)
-            display_name = url # Nome de exibição será a URL original
 
             # EXTRAÇÃO: extrai o conteúdo de cada URL
-            extracted_text = extract_text_from_local_pdf(local_pdf_path)
-            
-            # NORMALIZAÇÃO
-            normalized_text = normalize_text(extracted_text)
+            with ingestion_stage("parse"):
+                extracted_text = extract_text_from_local_pdf(local_pdf_path)
+            documents.append((url, os.path.basename(local_pdf_path), extracted_text))
+
+        except Exception as e:
+            ERRORS.inc(stage="ingestion")
+            logger.error("[ERRO GRAVE] Falha interna no processamento de %s: %s", url, e)
+
+    # Deduplicação entre os documentos do lote e contra os chunks já indexados
+    detector = NearDuplicateDetector(get_ingestion_client(), COLLECTION_NAME)
+
+    # NORMALIZAÇÃO de todos os documentos do lote, em paralelo (pool de processos)
+    with ingestion_stage("normalize"):
+        normalized_texts = normalize_texts([text for _, _, text in documents])
+
+    for (url, file_name, _), normalized_text in zip(documents, normalized_texts):
+        try:
+            # DADOS para o frontend
+            display_name = url # Nome de exibição será a URL original
             
             # CHUNKING (usa o método do Embedder global)
-            chunk_texts = list(embedder.chunk_text(normalized_text))
+            with ingestion_stage("chunk"):
+                chunked = embedder.chunk_text_with_counts(normalized_text)
+            chunk_texts = [c.text for c in chunked]
+            token_counts = [c.token_count for c in chunked]
             
             if not chunk_texts:
-                print(f"  [AVISO] Nenhum chunk gerado para {url}. Pulando.")
+                logger.warning("[AVISO] Nenhum chunk gerado para %s. Pulando.", url)
                 continue
+
+            # DEDUPLICAÇÃO: chunks quase duplicados não são embedados nem gravados
+            with ingestion_stage("dedup"):
+                kept, point_ids, fingerprints = _unique_chunks(detector, chunk_texts, allowed_roles, {
+                    "source": url,
+                    "display_name": display_name,
+                    "file_in_storage": file_name,
+                    "last_updated": current_timestamp_full,
+                })
+            if not kept:
+                logger.info("[BATCH] Todos os chunks de %s já estavam indexados (quase duplicados).", url)
+                continue
+            kept_texts = [chunk_texts[i] for i in kept]
             
             # EMBEDDING
-            embeddings = embedder.embed(chunk_texts).tolist()
+            with ingestion_stage("embed"):
+                embeddings = embedder.embed(kept_texts, token_counts=[token_counts[i] for i in kept]).tolist()
+                sparse_embeddings = _encode_sparse(kept_texts)
             
-            # MONTAGEM: Adiciona todos os chunks à lista de lote
-            for i, chunk in enumerate(chunk_texts):
-                unique_point_id = str(uuid.uuid4())
-                
+            # MONTAGEM: Adiciona os chunks mantidos à lista de lote
+            for i, embedding, sparse_embedding in zip(kept, embeddings, sparse_embeddings):
                 all_chunks_for_db.append(
                     PointStruct(
-                        id=unique_point_id,
-                        vector=embeddings[i],
+                        id=point_ids[i],
+                        vector=build_point_vector(embedding, sparse_embedding),
                         payload={
-                            "chunk": chunk,
+                            "chunk": chunk_texts[i],
                             "source": url,                  
                             "file_in_storage": file_name,
                             "display_name": display_name,
                             "chunk_index": i + 1,
+                            "token_count": token_counts[i],
                             "last_updated": current_timestamp_full,
                             "allowed_roles": allowed_roles,
+                            **fingerprint_payload(fingerprints[i]),
                         }
                     )
                 )
+
+            # Vetor de nível de documento (média dos chunks), usado na busca em dois estágios
+            document_points.append(build_document_point(url, embeddings, {
+                "display_name": display_name,
+                "file_in_storage": file_name,
+                "last_updated": current_timestamp_full,
+                "allowed_roles": allowed_roles,
+            }))
             
         except Exception as e:
-            print(f"  [ERRO GRAVE] Falha interna no processamento de {url}: {e}")
+            ERRORS.inc(stage="ingestion")
+            logger.error("[ERRO GRAVE] Falha interna no processamento de %s: %s", url, e)
                             
     # PERSISTÊNCIA: Upsert único (bulk) no Qdrant
+    detector.apply(all_chunks_for_db)
     if all_chunks_for_db:
-        print(f"[BATCH] Iniciando upsert de {len(all_chunks_for_db)} chunks no Qdrant...")
-        qdrant_client.upsert(collection_name=COLLECTION_NAME, points=all_chunks_for_db)
-        print(f"[BATCH] Upsert concluído com sucesso.")
+        logger.info("[BATCH] Iniciando upsert de %s chunks no Qdrant...", len(all_chunks_for_db))
+        with ingestion_stage("upsert"):
+            get_ingestion_client().upsert(collection_name=COLLECTION_NAME, points=all_chunks_for_db)
+            get_ingestion_client().upsert(collection_name=document_collection_name(COLLECTION_NAME), points=document_points)
+        logger.info("[BATCH] Upsert concluído com sucesso.")
         return len(all_chunks_for_db)
         
     return 0
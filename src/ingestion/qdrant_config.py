@@ -2,8 +2,14 @@ from qdrant_client import QdrantClient
 from qdrant_client.models import VectorParams, Distance, PayloadSchemaType
 import os
 import time
+from ..core.log import get_logger
+from ..core.vectordb import QDRANT_PREFER_GRPC, QDRANT_GRPC_PORT
 
-COLLECTION_NAME = "bofa_documents"
+logger = get_logger(__name__)
+
+# Nome pelo qual a API acessa a coleção. Após a primeira reindexação (ver reindex.py), é um alias do
+# Qdrant que aponta para a versão atual da coleção (ex: bofa_documents_v2)
+COLLECTION_NAME = os.getenv("COLLECTION_NAME", "bofa_documents")
 VECTOR_SIZE = 384
 
 def get_qdrant_client():
@@ -12,20 +18,20 @@ def get_qdrant_client():
 
     for attempt in range(20):
         try:
-            client = QdrantClient(url=url)
+            client = QdrantClient(url=url, grpc_port=QDRANT_GRPC_PORT, prefer_grpc=QDRANT_PREFER_GRPC)
             client.get_collections()  # teste simples
             return client
         except Exception:
-            print(f"Qdrant não está pronto. Tentativa {attempt+1}/20...")
+            logger.warning("Qdrant não está pronto. Tentativa %s/20...", attempt+1)
             time.sleep(2)
 
     raise RuntimeError("Qdrant não respondeu após múltiplas tentativas.")
     try:
         client.get_collection(collection_name=COLLECTION_NAME)
-        print(f"Coleção '{COLLECTION_NAME}' já existe.")
+        logger.info("Coleção '%s' já existe.", COLLECTION_NAME)
     
     except Exception:
-        print(f"Coleção '{COLLECTION_NAME}' não encontrada. Criando...")
+        logger.info("Coleção '%s' não encontrada. Criando...", COLLECTION_NAME)
         client.recreate_collection(
             collection_name=COLLECTION_NAME,
             vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE)
@@ -41,6 +47,6 @@ def get_qdrant_client():
             field_name="allowed_roles",
             field_schema=PayloadSchemaType.KEYWORD 
         )
-        print(f"Coleção '{COLLECTION_NAME}' criada e indexada.")
+        logger.info("Coleção '%s' criada e indexada.", COLLECTION_NAME)
 
     return client
@@ -0,0 +1,497 @@
+import os
+import re
+import sys
+import time
+import random
+import argparse
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set
+from qdrant_client import QdrantClient
+from qdrant_client.models import (
+    PointStruct,
+    Filter,
+    FieldCondition,
+    MatchValue,
+    MatchAny,
+    DatetimeRange,
+    FilterSelector,
+    CollectionStatus,
+    OptimizersConfigDiff,
+    CreateAlias,
+    CreateAliasOperation,
+    DeleteAlias,
+    DeleteAliasOperation,
+)
+from .qdrant_config import COLLECTION_NAME
+from .process_pdf_url import process_pdf, get_ingestion_client
+from .storage import get_content_store
+from ..core.embedder import Embedder, EMBEDDING_MODEL
+from ..core.vectordb import VectorDB, document_collection_name
+from ..core.log import get_logger
+
+logger = get_logger(__name__)
+
+# Reindexação sem indisponibilidade (blue/green): a nova versão da coleção (<alias>_v<N>) é construída
+# em paralelo à atual, validada e só então o alias COLLECTION_NAME passa a apontar para ela.
+#
+# Uso (a partir da raiz do repositório, com as mesmas variáveis de ambiente da API):
+#   python -m src.ingestion.reindex build --mode documents   # reprocessa os PDFs armazenados (modelo/chunking novos)
+#   python -m src.ingestion.reindex build --mode copy        # copia os vetores (novos parâmetros da coleção)
+#   python -m src.ingestion.reindex rollback                 # volta o alias para a versão anterior
+#   python -m src.ingestion.reindex status | switch <N> | prune --keep 1
+
+# Pontos gravados por segundo na nova coleção (0 = sem limite): a reindexação não deve
+# disputar CPU/IO do Qdrant (e do modelo) com as buscas em produção
+REINDEX_MAX_POINTS_PER_SECOND = float(os.getenv("REINDEX_MAX_POINTS_PER_SECOND", "500"))
+REINDEX_BATCH_SIZE = int(os.getenv("REINDEX_BATCH_SIZE", "256"))
+# Threads do torch no processo de reindexação (modo documents)
+REINDEX_TORCH_THREADS = int(os.getenv("REINDEX_TORCH_THREADS", "1"))
+# Validação: chunks sorteados da coleção atual, usados como consultas na nova (recall por documento)
+REINDEX_RECALL_SAMPLE = int(os.getenv("REINDEX_RECALL_SAMPLE", "200"))
+REINDEX_RECALL_TOP_K = int(os.getenv("REINDEX_RECALL_TOP_K", "10"))
+REINDEX_MIN_RECALL = float(os.getenv("REINDEX_MIN_RECALL", "0.9"))
+# Diferença relativa máxima no número de chunks (no modo documents, o chunking pode mudar)
+REINDEX_MAX_COUNT_DRIFT = float(os.getenv("REINDEX_MAX_COUNT_DRIFT", "0.25"))
+# Tempo máximo de espera pela construção do índice HNSW da nova coleção (segundos)
+REINDEX_INDEX_TIMEOUT = float(os.getenv("REINDEX_INDEX_TIMEOUT", "3600"))
+# Passadas de sincronização antes da troca do alias: repete enquanto houver mudanças na versão atual
+REINDEX_CATCH_UP_PASSES = int(os.getenv("REINDEX_CATCH_UP_PASSES", "5"))
+
+class ReindexError(Exception):
+    """Falha na reindexação (validação, versões inexistentes); o alias não é alterado."""
+
+class Throttle:
+    """Limita a taxa de gravação (pontos por segundo) da reindexação."""
+
+    def __init__(self, points_per_second: float = REINDEX_MAX_POINTS_PER_SECOND):
+        self.points_per_second = points_per_second
+        self._next = time.monotonic()
+
+    def wait(self, points: int):
+        if self.points_per_second <= 0 or points <= 0:
+            return
+        now = time.monotonic()
+        self._next = max(self._next, now) + points / self.points_per_second
+        if self._next > now:
+            time.sleep(self._next - now)
+
+# -- Versões e aliases ---------------------------------------------------------------------------
+
+def version_name(alias: str, version: int) -> str:
+    return f"{alias}_v{version}"
+
+def list_versions(client: QdrantClient, alias: str = COLLECTION_NAME) -> List[int]:
+    """Versões existentes da coleção (<alias>_v<N>), em ordem crescente."""
+    pattern = re.compile(rf"^{re.escape(alias)}_v(\d+)$")
+    return sorted(int(m.group(1)) for c in client.get_collections().collections if (m := pattern.match(c.name)))
+
+def current_collection(client: QdrantClient, alias: str = COLLECTION_NAME) -> Optional[str]:
+    """Coleção para a qual o alias aponta (None se o alias não existir)."""
+    for description in client.get_aliases().aliases:
+        if description.alias_name == alias:
+            return description.collection_name
+    return None
+
+def _is_legacy_collection(client: QdrantClient, alias: str) -> bool:
+    """Indica se COLLECTION_NAME ainda é uma coleção comum (anterior ao uso de aliases)."""
+    return any(c.name == alias for c in client.get_collections().collections)
+
+def switch_alias(client: QdrantClient, target: str, alias: str = COLLECTION_NAME):
+    """
+    Aponta o alias (e o alias da coleção de documentos) para a coleção 'target', numa única
+    operação atômica do Qdrant: as requisições passam da versão antiga para a nova sem intervalo.
+    """
+    operations = []
+    for alias_name, collection in ((alias, target), (document_collection_name(alias), document_collection_name(target))):
+        if current_collection(client, alias_name) is not None:
+            operations.append(DeleteAliasOperation(delete_alias=DeleteAlias(alias_name=alias_name)))
+        operations.append(CreateAliasOperation(create_alias=CreateAlias(collection_name=collection, alias_name=alias_name)))
+    client.update_collection_aliases(change_aliases_operations=operations)
+    logger.info("[REINDEX] Alias '%s' aponta agora para '%s'.", alias, target)
+
+# -- Construção da nova versão -------------------------------------------------------------------
+
+def _scroll_all(client: QdrantClient, collection: str, scroll_filter: Filter = None, with_payload=True, with_vectors=False):
+    offset = None
+    while True:
+        records, offset = client.scroll(
+            collection_name=collection,
+            scroll_filter=scroll_filter,
+            limit=REINDEX_BATCH_SIZE,
+            offset=offset,
+            with_payload=with_payload,
+            with_vectors=with_vectors,
+        )
+        yield records
+        if offset is None:
+            break
+
+def _vector_size(client: QdrantClient, collection: str) -> int:
+    vectors = client.get_collection(collection_name=collection).config.params.vectors
+    return vectors[""].size if isinstance(vectors, dict) else vectors.size
+
+def _create_version(client: QdrantClient, target: str, vector_size: int, indexing_threshold: Optional[int]):
+    """Cria a coleção (e a de documentos) com os parâmetros atuais do VectorDB, sem o índice HNSW durante a carga."""
+    VectorDB(collection_name=target, vector_size=vector_size)
+    if indexing_threshold is None:
+        return
+    # Com indexing_threshold=0, o Qdrant não constrói o HNSW a cada lote gravado; o índice é
+    # construído uma única vez ao final (_finish_version), reduzindo a carga durante a cópia
+    try:
+        client.update_collection(collection_name=target, optimizers_config=OptimizersConfigDiff(indexing_threshold=0))
+    except Exception as e:
+        logger.warning("[REINDEX] Não foi possível adiar a indexação de '%s': %s", target, e)
+
+def _finish_version(client: QdrantClient, target: str, indexing_threshold: Optional[int]):
+    """Reativa a indexação e aguarda a coleção ficar pronta (status verde) antes da validação."""
+    if indexing_threshold is not None:
+        try:
+            client.update_collection(collection_name=target, optimizers_config=OptimizersConfigDiff(indexing_threshold=indexing_threshold))
+        except Exception as e:
+            logger.warning("[REINDEX] Não foi possível reativar a indexação de '%s': %s", target, e)
+    deadline = time.monotonic() + REINDEX_INDEX_TIMEOUT
+    while client.get_collection(collection_name=target).status != CollectionStatus.GREEN:
+        if time.monotonic() > deadline:
+            raise ReindexError(f"A coleção '{target}' não terminou de indexar em {REINDEX_INDEX_TIMEOUT:.0f}s.")
+        time.sleep(2)
+
+def _copy_points(client: QdrantClient, source: str, target: str, throttle: Throttle, scroll_filter: Filter = None) -> int:
+    """Copia pontos (vetores e payload) de uma coleção para outra, em lotes e com limite de taxa."""
+    copied = 0
+    for records in _scroll_all(client, source, scroll_filter, with_vectors=True):
+        if not records:
+            continue
+        client.upsert(collection_name=target, points=[PointStruct(id=r.id, vector=r.vector, payload=r.payload) for r in records])
+        copied += len(records)
+        throttle.wait(len(records))
+    return copied
+
+def _copy_collection(client: QdrantClient, source: str, target: str, throttle: Throttle, scroll_filter: Filter = None) -> int:
+    copied = _copy_points(client, source, target, throttle, scroll_filter)
+    _copy_points(client, document_collection_name(source), document_collection_name(target), throttle, scroll_filter)
+    return copied
+
+def _collect_documents(client: QdrantClient, collection: str, scroll_filter: Filter = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Documentos (sources) da coleção, com os metadados necessários para reprocessá-los. Inclui as
+    origens registradas apenas em duplicate_sources (documentos cujos chunks eram todos duplicados).
+    """
+    fields = ["source", "display_name", "file_in_storage", "last_updated", "allowed_roles", "duplicate_sources"]
+    documents: Dict[str, Dict[str, Any]] = {}
+
+    def add(info: Dict[str, Any]):
+        document = documents.setdefault(info["source"], {"allowed_roles": set()})
+        for field in ("display_name", "file_in_storage", "last_updated"):
+            document.setdefault(field, info.get(field))
+        document["allowed_roles"].update(info.get("allowed_roles") or [])
+
+    for records in _scroll_all(client, collection, scroll_filter, with_payload=fields):
+        for r in records:
+            if r.payload.get("source"):
+                add(r.payload)
+            for duplicate in r.payload.get("duplicate_sources") or []:
+                add(duplicate)
+    return documents
+
+def _reingest_documents(client: QdrantClient, documents: Dict[str, Dict[str, Any]], target: str, embedder: Embedder, throttle: Throttle) -> List[str]:
+    """Reprocessa (extração, chunking, embedding) os PDFs armazenados na nova coleção. Retorna as sources sem arquivo."""
+    store = get_content_store()
+    missing = []
+    for position, (source, document) in enumerate(sorted(documents.items()), start=1):
+        path = store.path(document["file_in_storage"] or "")
+        if not document["file_in_storage"] or not os.path.isfile(path):
+            logger.warning("[REINDEX] Arquivo de %s não encontrado no armazenamento; documento não reindexado.", source)
+            missing.append(source)
+            continue
+        inserted = process_pdf(
+            file_path=path,
+            source_url=source,
+            file_name_in_storage=document["file_in_storage"],
+            display_name=document["display_name"] or source,
+            embedder=embedder,
+            allowed_roles=sorted(document["allowed_roles"]),
+            collection_name=target,
+            last_updated=document["last_updated"],
+        )
+        throttle.wait(inserted or 0)
+        logger.info("[REINDEX] (%s/%s) %s: %s chunks.", position, len(documents), source, inserted)
+    return missing
+
+def _sources(client: QdrantClient, collection: str) -> Set[str]:
+    return {r.payload.get("source") for records in _scroll_all(client, collection, with_payload=["source"]) for r in records}
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="milliseconds")
+
+def _sources_filter(names: Set[str]) -> Filter:
+    """Pontos de algum dos documentos: como dono do chunk ou registrado em duplicate_sources."""
+    return Filter(should=[
+        FieldCondition(key="source", match=MatchAny(any=sorted(names))),
+        FieldCondition(key="duplicate_sources[].source", match=MatchAny(any=sorted(names))),
+    ])
+
+def _linked_sources(client: QdrantClient, collection: str, names: Set[str]) -> Set[str]:
+    """Documentos que compartilham chunks (duplicate_sources) com algum dos documentos 'names' na coleção."""
+    linked = set()
+    for records in _scroll_all(client, collection, _sources_filter(names), with_payload=["source", "duplicate_sources"]):
+        for r in records:
+            linked.add(r.payload.get("source"))
+            linked.update(d.get("source") for d in r.payload.get("duplicate_sources") or [])
+    return linked - {None}
+
+def _catch_up(client: QdrantClient, source: str, target: str, since: str, mode: str, embedder: Optional[Embedder], throttle: Throttle) -> int:
+    """
+    Replica na nova versão o que mudou na atual desde 'since': documentos gravados depois
+    de 'since' são refeitos e documentos removidos são apagados. Retorna quantos documentos mudaram.
+
+    Uma remoção ou substituição passa chunks compartilhados para outro documento (ver
+    _reassign_duplicated_chunks) sem mudar o last_updated dele; por isso os documentos que compartilham
+    chunks com os alterados (nas duas versões) também são refeitos por inteiro.
+    """
+    changed_filter = Filter(must=[FieldCondition(key="last_updated", range=DatetimeRange(gte=since))])
+    changed = set(_collect_documents(client, source, changed_filter))
+    removed = _sources(client, target) - _sources(client, source)
+    if not changed and not removed:
+        logger.info("[REINDEX] Sincronização desde %s: nenhuma mudança.", since)
+        return 0
+
+    touched = changed | removed
+    resync = (changed | _linked_sources(client, source, touched) | _linked_sources(client, target, touched)) - removed
+    names_filter = Filter(must=[FieldCondition(key="source", match=MatchAny(any=sorted(resync | removed)))])
+    client.delete(collection_name=target, points_selector=FilterSelector(filter=names_filter), wait=True)
+    client.delete(collection_name=document_collection_name(target), points_selector=FilterSelector(filter=names_filter), wait=True)
+    if resync:
+        if mode == "copy":
+            _copy_collection(client, source, target, throttle, Filter(must=[FieldCondition(key="source", match=MatchAny(any=sorted(resync)))]))
+        else:
+            documents = _collect_documents(client, source, _sources_filter(resync))
+            _reingest_documents(client, {name: documents[name] for name in resync if name in documents}, target, embedder, throttle)
+    logger.info("[REINDEX] Sincronização desde %s: %s documentos atualizados (%s por chunks compartilhados), %s removidos.", since, len(resync), len(resync - changed), len(removed))
+    return len(resync) + len(removed)
+
+def _sync_before_switch(client: QdrantClient, source: str, target: str, since: str, mode: str, embedder: Optional[Embedder], throttle: Throttle):
+    """
+    Sincronização imediatamente antes da troca do alias: uploads, substituições e remoções feitos
+    durante a indexação e a validação (que podem levar até REINDEX_INDEX_TIMEOUT) existem só na versão
+    atual. Repete _catch_up, cada passada a partir do início da anterior, até uma passada sem mudanças.
+    """
+    for _ in range(REINDEX_CATCH_UP_PASSES):
+        started = _now()
+        if _catch_up(client, source, target, since, mode, embedder, throttle) == 0:
+            return
+        since = started
+    logger.warning("[REINDEX] A versão atual continuou mudando após %s passadas de sincronização; gravações feitas durante a última passada podem não estar em '%s'.", REINDEX_CATCH_UP_PASSES, target)
+
+# -- Validação -----------------------------------------------------------------------------------
+
+def _sample_chunks(client: QdrantClient, collection: str, size: int) -> List[Dict[str, Any]]:
+    """Amostra aleatória de chunks (texto e source) da coleção."""
+    candidates = []
+    for records in _scroll_all(client, collection, with_payload=["chunk", "source", "duplicate_sources"]):
+        candidates.extend(r.payload for r in records if r.payload.get("chunk"))
+        if len(candidates) >= size * 20:
+            break
+    return random.Random(0).sample(candidates, min(size, len(candidates)))
+
+def validate(client: QdrantClient, source: str, target: str, mode: str, embedder: Embedder, missing: List[str] = ()) -> Dict[str, Any]:
+    """
+    Compara a nova versão com a atual: número de chunks e de documentos, e recall por documento
+    (fração dos chunks sorteados da versão atual cuja busca na nova versão traz o mesmo documento
+    entre os REINDEX_RECALL_TOP_K primeiros). Lança ReindexError se algum critério falhar.
+    """
+    source_count = client.count(collection_name=source, exact=True).count
+    target_count = client.count(collection_name=target, exact=True).count
+    missing_sources = (_sources(client, source) - _sources(client, target)) - set(missing)
+
+    sample = _sample_chunks(client, source, REINDEX_RECALL_SAMPLE)
+    hits = 0
+    if sample:
+        vectordb = VectorDB(collection_name=target, vector_size=_vector_size(client, target))
+        query_vectors = embedder.embed([s["chunk"] for s in sample]).tolist()
+        results = vectordb.search_batch(query_vectors, top_k=REINDEX_RECALL_TOP_K)
+        for expected, found in zip(sample, results):
+            wanted = {expected["source"]} | {d.get("source") for d in expected.get("duplicate_sources") or []}
+            found_sources = {r["source"] for r in found} | {d["source"] for r in found for d in r["duplicate_sources"]}
+            hits += bool(wanted & found_sources)
+    recall = hits / len(sample) if sample else 1.0
+
+    report = {
+        "chunks_atual": source_count,
+        "chunks_nova": target_count,
+        "documentos_ausentes": sorted(missing_sources),
+        "documentos_sem_arquivo": sorted(missing),
+        "recall": round(recall, 4),
+        "amostra": len(sample),
+    }
+    logger.info("[REINDEX] Validação de '%s': %s", target, report)
+
+    drift = abs(target_count - source_count) / max(source_count, 1)
+    if mode == "copy" and target_count != source_count:
+        raise ReindexError(f"Contagem divergente na cópia: {target_count} chunks na nova versão, {source_count} na atual.")
+    if drift > REINDEX_MAX_COUNT_DRIFT:
+        raise ReindexError(f"Número de chunks mudou {drift:.0%} (máximo: {REINDEX_MAX_COUNT_DRIFT:.0%}).")
+    if missing_sources:
+        raise ReindexError(f"{len(missing_sources)} documentos ausentes na nova versão (ex: {report['documentos_ausentes'][:3]}).")
+    if recall < REINDEX_MIN_RECALL:
+        raise ReindexError(f"Recall {recall:.2%} abaixo do mínimo ({REINDEX_MIN_RECALL:.0%}).")
+    return report
+
+# -- Comandos ------------------------------------------------------------------------------------
+
+def _optimizer_threshold(client: QdrantClient, collection: str) -> Optional[int]:
+    try:
+        return client.get_collection(collection_name=collection).config.optimizer_config.indexing_threshold
+    except Exception:
+        return None
+
+def migrate_legacy_collection(client: QdrantClient, alias: str = COLLECTION_NAME, throttle: Throttle = None) -> str:
+    """
+    Converte uma coleção comum chamada COLLECTION_NAME (instalações anteriores aos aliases) na versão 1:
+    copia os pontos para <alias>_v1, remove a coleção original e cria o alias no lugar dela.
+    Entre a remoção e a criação do alias (milissegundos), as requisições ao Qdrant falham: rode uma única vez,
+    de preferência fora do horário de uso.
+    """
+    throttle = throttle or Throttle()
+    target = version_name(alias, 1)
+    started = _now()
+    threshold = _optimizer_threshold(client, alias)
+    _create_version(client, target, _vector_size(client, alias), threshold)
+    _copy_collection(client, alias, target, throttle)
+    synced = _now()
+    _catch_up(client, alias, target, started, "copy", None, throttle)
+    _finish_version(client, target, threshold)
+    _sync_before_switch(client, alias, target, synced, "copy", None, throttle)
+    if client.count(collection_name=target, exact=True).count != client.count(collection_name=alias, exact=True).count:
+        raise ReindexError(f"Contagem divergente ao migrar '{alias}' para '{target}'; a coleção original foi mantida.")
+
+    client.delete_collection(collection_name=alias)
+    client.delete_collection(collection_name=document_collection_name(alias))
+    switch_alias(client, target, alias)
+    return target
+
+def build(mode: str, switch: bool = True, model_name: str = EMBEDDING_MODEL, alias: str = COLLECTION_NAME) -> Dict[str, Any]:
+    """Constrói, valida e (com switch) ativa uma nova versão da coleção. Retorna o relatório da validação."""
+    client = get_ingestion_client()
+    throttle = Throttle()
+    if _is_legacy_collection(client, alias):
+        logger.info("[REINDEX] '%s' é uma coleção comum; migrando para aliases (versão 1)...", alias)
+        migrate_legacy_collection(client, alias, throttle)
+
+    source = current_collection(client, alias)
+    if source is None:
+        raise ReindexError(f"O alias '{alias}' não existe: não há coleção para reindexar.")
+    target = version_name(alias, max(list_versions(client, alias), default=0) + 1)
+    logger.info("[REINDEX] Construindo '%s' a partir de '%s' (modo %s)...", target, source, mode)
+
+    try:
+        import torch
+        torch.set_num_threads(REINDEX_TORCH_THREADS)
+    except ImportError:
+        pass
+    embedder = Embedder(model_name=model_name)
+
+    started = _now()
+    threshold = _optimizer_threshold(client, source)
+    missing: List[str] = []
+    if mode == "copy":
+        _create_version(client, target, _vector_size(client, source), threshold)
+        _copy_collection(client, source, target, throttle)
+    else:
+        _create_version(client, target, embedder.dimension, threshold)
+        missing = _reingest_documents(client, _collect_documents(client, source), target, embedder, throttle)
+    synced = _now()
+    _catch_up(client, source, target, started, mode, embedder, throttle)
+    _finish_version(client, target, threshold)
+
+    report = validate(client, source, target, mode, embedder, missing)
+    report["colecao"] = target
+    if switch:
+        _sync_before_switch(client, source, target, synced, mode, embedder, throttle)
+        switch_alias(client, target, alias)
+    else:
+        logger.info("[REINDEX] '%s' validada; para ativá-la: python -m src.ingestion.reindex switch %s "
+                    "(gravações feitas depois deste build não são replicadas nela; prefira um novo build)", target, target.rsplit("_v", 1)[1])
+    return report
+
+def rollback(alias: str = COLLECTION_NAME, version: Optional[int] = None) -> str:
+    """
+    Volta o alias para a versão anterior à atual (ou para 'version'). Documentos gravados
+    depois da troca existem apenas na versão atual e precisam ser reenviados.
+    """
+    client = get_ingestion_client()
+    current = current_collection(client, alias)
+    versions = list_versions(client, alias)
+    if version is None:
+        current_version = int(current.rsplit("_v", 1)[1]) if current else None
+        older = [v for v in versions if current_version is None or v < current_version]
+        if not older:
+            raise ReindexError("Não há versão anterior para restaurar.")
+        version = older[-1]
+    if version not in versions:
+        raise ReindexError(f"A versão {version} não existe (versões: {versions}).")
+    target = version_name(alias, version)
+    switch_alias(client, target, alias)
+    return target
+
+def prune(keep: int = 1, alias: str = COLLECTION_NAME) -> List[str]:
+    """Remove as versões antigas, mantendo a atual e as 'keep' anteriores a ela (para rollback)."""
+    client = get_ingestion_client()
+    current = current_collection(client, alias)
+    current_version = int(current.rsplit("_v", 1)[1]) if current else None
+    older = [v for v in list_versions(client, alias) if current_version is not None and v < current_version]
+    removed = []
+    for version in older[:max(len(older) - keep, 0)]:
+        name = version_name(alias, version)
+        client.delete_collection(collection_name=name)
+        client.delete_collection(collection_name=document_collection_name(name))
+        removed.append(name)
+        logger.info("[REINDEX] Versão '%s' removida.", name)
+    return removed
+
+def status(alias: str = COLLECTION_NAME) -> Dict[str, Any]:
+    client = get_ingestion_client()
+    return {
+        "alias": alias,
+        "colecao_atual": current_collection(client, alias),
+        "colecao_comum": _is_legacy_collection(client, alias),
+        "versoes": {
+            version_name(alias, v): client.count(collection_name=version_name(alias, v), exact=True).count
+            for v in list_versions(client, alias)
+        },
+    }
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.ingestion.reindex", description="Reindexação da coleção com troca atômica de alias (blue/green).")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build_parser = commands.add_parser("build", help="Constrói, valida e ativa uma nova versão da coleção.")
+    build_parser.add_argument("--mode", choices=["documents", "copy"], default="documents",
+                              help="documents: reprocessa os PDFs armazenados; copy: copia os vetores atuais.")
+    build_parser.add_argument("--model", default=EMBEDDING_MODEL, help="Modelo de embeddings da nova versão.")
+    build_parser.add_argument("--no-switch", action="store_true", help="Apenas constrói e valida, sem trocar o alias.")
+    switch_parser = commands.add_parser("switch", help="Aponta o alias para uma versão existente.")
+    switch_parser.add_argument("version", type=int)
+    rollback_parser = commands.add_parser("rollback", help="Volta o alias para a versão anterior.")
+    rollback_parser.add_argument("--to", type=int, dest="version")
+    prune_parser = commands.add_parser("prune", help="Remove versões antigas.")
+    prune_parser.add_argument("--keep", type=int, default=1)
+    commands.add_parser("status", help="Mostra a versão atual e as versões existentes.")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "build":
+            print(build(args.mode, switch=not args.no_switch, model_name=args.model))
+        elif args.command == "switch":
+            print(rollback(version=args.version))
+        elif args.command == "rollback":
+            print(rollback(version=args.version))
+        elif args.command == "prune":
+            print(prune(args.keep))
+        else:
+            print(status())
+    except ReindexError as e:
+        logger.error("[REINDEX] %s", e)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,6 +9,11 @@ from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
+from ..core.metrics import ingestion_stage
+from ..core.log import get_logger
+from .storage import get_content_store
+
+logger = get_logger(__name__)
 
 USER_AGENT_HEADER = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -30,7 +35,7 @@ def _render_html_to_pdf(driver, timeout = 45):
             # Tenta encontrar o botão "Aceitar cookies" (ou similar) e clica.
             cookie_button_xpath = "//button[contains(text(), 'Aceitar cookies')] | //a[contains(text(), 'Aceitar cookies')]"
             
-            print("[SCRAPER][CDP] Tentando encontrar e fechar o banner de cookies...")
+            logger.info("[SCRAPER][CDP] Tentando encontrar e fechar o banner de cookies...")
             
             # Espera rápida para o botão de cookies, mas não quebra se ele não existir
             cookie_button = WebDriverWait(driver, 5).until(
@@ -38,22 +43,22 @@ def _render_html_to_pdf(driver, timeout = 45):
             )
             
             cookie_button.click()
-            print("[SCRAPER][CDP] Banner de cookies fechado com sucesso.")
+            logger.info("[SCRAPER][CDP] Banner de cookies fechado com sucesso.")
             
             # Pequeno tempo de espera para o banner desaparecer completamente
             time.sleep(1) 
             
         except Exception:
             # A maioria das URLs não terá esse banner ou o clique falhará, o que é OK.
-            print("[SCRAPER][CDP] Banner de cookies não encontrado ou já fechado.")
+            logger.info("[SCRAPER][CDP] Banner de cookies não encontrado ou já fechado.")
             pass
         
         # Buffer de 5 segundos extras para o navegador finalizar a formatação final de impressão (após o clique).
-        print("[SCRAPER][CDP] Estabilizando a renderização final (5s)...")
+        logger.info("[SCRAPER][CDP] Estabilizando a renderização final (5s)...")
         time.sleep(5)
     
     except Exception as e:
-        print(f"[SCRAPER][CDP][AVISO] Falha ou timeout na espera inicial: {e}")
+        logger.warning("[SCRAPER][CDP][AVISO] Falha ou timeout na espera inicial: %s", e)
         # Continua mesmo com timeout na espera, pois o conteúdo pode ter carregado parcialmente
         pass 
     
@@ -63,7 +68,7 @@ def _render_html_to_pdf(driver, timeout = 45):
         'displayHeaderFooter': False # Importante para evitar cabeçalhos
     }
     
-    print("[SCRAPER][CDP] Executando Page.printToPDF...")
+    logger.info("[SCRAPER][CDP] Executando Page.printToPDF...")
     
     try:
         # O CDP retorna o PDF codificado em Base64
@@ -71,43 +76,40 @@ def _render_html_to_pdf(driver, timeout = 45):
     
         if 'data' in result:
             pdf_bytes = base64.b64decode(result['data'])
-            print(f"[SCRAPER][CDP] Conversão para PDF concluída. Bytes recebidos: {len(pdf_bytes)}")
+            logger.info("[SCRAPER][CDP] Conversão para PDF concluída. Bytes recebidos: %s", len(pdf_bytes))
             return pdf_bytes
         
-        print("[SCRAPER][CDP][ERRO] O comando Page.printToPDF não retornou dados.")
+        logger.error("[SCRAPER][CDP][ERRO] O comando Page.printToPDF não retornou dados.")
         return None
         
     except Exception as e:
-        print(f"[SCRAPER][CDP][ERRO] Falha durante a execução do CDP: {e}")
+        logger.error("[SCRAPER][CDP][ERRO] Falha durante a execução do CDP: %s", e)
         return None
 
-def url_to_local_pdf(url, output_dir):
+def url_to_local_pdf(url, output_dir, link_source=True):
     """
     Orquestra o download (se for PDF direto) ou a renderização (se for HTML)
     de uma URL para um arquivo PDF local.
+    Com link_source=False, o arquivo é gravado sem ser associado à URL no armazenamento
+    (substituição de documento: a associação só é feita se a nova versão for processada).
     Retorna o caminho do arquivo PDF salvo.
     """
-    # Cria um nome de arquivo previsível para ser procurado depois (usando hash da URL)
-    filename_hash = str(hash(url))[:8] 
-    output_path = os.path.join(output_dir, f"{filename_hash}.pdf")
-
-    os.makedirs(output_dir, exist_ok=True)
-    
     # Tenta download direto (para URLs que retornam PDF bruto)
     pdf_content = None
     try:
-        print(f"[SCRAPER][DOWNLOAD] Tentando download direto de: {url}")
-        response = requests.get(url, headers=USER_AGENT_HEADER, timeout=30)
+        logger.info("[SCRAPER][DOWNLOAD] Tentando download direto de: %s", url)
+        with ingestion_stage("fetch"):
+            response = requests.get(url, headers=USER_AGENT_HEADER, timeout=30)
         response.raise_for_status()
         
         if response.content.startswith(b'%PDF-'):
             pdf_content = response.content
-            print("[SCRAPER][DOWNLOAD] PDF baixado com sucesso.")
+            logger.info("[SCRAPER][DOWNLOAD] PDF baixado com sucesso.")
         else:
-            print("[SCRAPER][DOWNLOAD] Conteúdo não é PDF. Iniciando renderização HTML (CDP)...")
+            logger.info("[SCRAPER][DOWNLOAD] Conteúdo não é PDF. Iniciando renderização HTML (CDP)...")
             
     except Exception as e:
-        print(f"[SCRAPER][DOWNLOAD][AVISO] Falha no download direto: {e}. Tentando renderização.")
+        logger.warning("[SCRAPER][DOWNLOAD][AVISO] Falha no download direto: %s. Tentando renderização.", e)
         pass # Continua para a renderização
         
     # Lógica de renderização HTML/Visualizador para PDF
@@ -116,8 +118,8 @@ def url_to_local_pdf(url, output_dir):
         chrome_bin = os.getenv("CHROME_BIN", "/usr/bin/chromium")
         chromedriver_path = os.getenv("CHROME_DRIVER_PATH", "/usr/bin/chromedriver")
         
-        print(f"[SCRAPER][CONFIG] Usando Chromium Bin: {chrome_bin}")
-        print(f"[SCRAPER][CONFIG] Usando ChromeDriver Path: {chromedriver_path}")
+        logger.info("[SCRAPER][CONFIG] Usando Chromium Bin: %s", chrome_bin)
+        logger.info("[SCRAPER][CONFIG] Usando ChromeDriver Path: %s", chromedriver_path)
              
         chrome_options = Options()
         chrome_options.add_argument("--headless=new")
@@ -128,29 +130,33 @@ def url_to_local_pdf(url, output_dir):
         
         driver = None
         try:
-            service = Service(executable_path=chromedriver_path)
-            print("[SCRAPER][RENDER] Iniciando ChromeDriver...")
-            driver = webdriver.Chrome(service=service, options=chrome_options)
-            print(f"[SCRAPER][RENDER] Navegando para: {url}")
-            driver.get(url)
-            
-            # Chama a função de renderização para obter os bytes do PDF
-            pdf_content = _render_html_to_pdf(driver)
+            # A etapa "render" inclui a inicialização do navegador e a navegação até a página
+            with ingestion_stage("render"):
+                service = Service(executable_path=chromedriver_path)
+                logger.info("[SCRAPER][RENDER] Iniciando ChromeDriver...")
+                driver = webdriver.Chrome(service=service, options=chrome_options)
+                logger.info("[SCRAPER][RENDER] Navegando para: %s", url)
+                driver.get(url)
+                
+                # Chama a função de renderização para obter os bytes do PDF
+                pdf_content = _render_html_to_pdf(driver)
             
         except Exception as e:
-            print(f"[SCRAPER][RENDER][ERRO] Falha ao renderizar URL para PDF via CDP: {e}")
+            logger.error("[SCRAPER][RENDER][ERRO] Falha ao renderizar URL para PDF via CDP: %s", e)
             
         finally:
             if driver:
-                print("[SCRAPER][RENDER] Fechando ChromeDriver.")
+                logger.info("[SCRAPER][RENDER] Fechando ChromeDriver.")
                 driver.quit()
 
-    # Salvamento local
+    # Salvamento local, endereçado pelo conteúdo (<sha256>.pdf): o nome é o mesmo entre reinícios
+    # e a mesma página raspada de novo, sem alterações, não gera um novo arquivo
     if pdf_content:
-        with open(output_path, 'wb') as f:
-            f.write(pdf_content)
-        print(f"[SCRAPER] Aquisição CONCLUÍDA. PDF salvo localmente: {output_path}")
+        store = get_content_store(output_dir)
+        blob_name, _ = store.put_bytes(pdf_content, source=url if link_source else None)
+        output_path = store.path(blob_name)
+        logger.info("[SCRAPER] Aquisição CONCLUÍDA. PDF salvo localmente: %s", output_path)
         return output_path
     
-    print("[SCRAPER] Falha na aquisição: Não foi possível obter conteúdo PDF por download nem por renderização.")
+    logger.warning("[SCRAPER] Falha na aquisição: Não foi possível obter conteúdo PDF por download nem por renderização.")
     return None
@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from starlette.datastructures import Headers
+from ..core.log import get_logger
+
+try:
+    import fcntl
+except ImportError: # Windows: o índice fica protegido apenas entre threads do mesmo processo
+    fcntl = None
+
+logger = get_logger(__name__)
+
+# Diretório onde os PDFs são armazenados (e servidos em /files)
+STORAGE_DIR = os.getenv("STORAGE_DIR", "/app/storage")
+os.makedirs(STORAGE_DIR, exist_ok=True)
+
+# Arquivos internos começam com "." e não são servidos em /files
+INDEX_FILE_NAME = ".index.json"
+LOCK_FILE_NAME = ".index.lock"
+
+# Nome de um blob: SHA-256 do conteúdo + extensão
+BLOB_NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.pdf$")
+
+class ContentStore:
+    """
+    Armazenamento de PDFs endereçado pelo conteúdo: cada arquivo é gravado como
+    <sha256>.pdf, de modo que o mesmo conteúdo (reenviado ou raspado de novo) ocupa
+    um único arquivo e mantém o mesmo nome entre reinícios.
+
+    Um índice (.index.json) associa cada origem (URL ou upload) ao blob correspondente;
+    um blob só é removido quando nenhuma origem o referencia mais. O índice é atualizado
+    sob um lock de arquivo, pois vários workers podem ingerir documentos ao mesmo tempo.
+    """
+
+    def __init__(self, root: str = STORAGE_DIR):
+        self.root = root
+        self.index_path = os.path.join(root, INDEX_FILE_NAME)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, blob_name: str) -> str:
+        return os.path.join(self.root, blob_name)
+
+    def temp_path(self) -> str:
+        """Caminho temporário (no mesmo diretório, para que o os.replace final seja atômico)."""
+        return os.path.join(self.root, f".upload-{uuid.uuid4().hex}.part")
+
+    def put_bytes(self, data: bytes, source: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Grava o conteúdo (se ainda não existir) e, opcionalmente, associa a origem ao blob.
+        Retorna o nome do blob e se ele foi criado (False quando o conteúdo já existia).
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        temp_path = self.temp_path()
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        return self.commit(temp_path, digest, source)
+
+    def commit(self, temp_path: str, digest: str, source: Optional[str] = None) -> Tuple[str, bool]:
+        """
+        Move um arquivo temporário já gravado (com o SHA-256 calculado durante a gravação)
+        para o nome definitivo, ou o descarta se o mesmo conteúdo já estiver armazenado.
+        """
+        blob_name = f"{digest}.pdf"
+        blob_path = self.path(blob_name)
+        # Sob o lock do índice, para não concorrer com a remoção de um blob que acabou de perder a última referência
+        with self._locked_index() as index:
+            if os.path.exists(blob_path):
+                os.remove(temp_path)
+                created = False
+            else:
+                os.replace(temp_path, blob_path)
+                created = True
+            previous = index.get(source) if source is not None else None
+            if source is not None:
+                index[source] = blob_name
+        if previous and previous != blob_name:
+            self._remove_if_unreferenced(previous)
+        logger.info("[STORAGE] %s %s.", "Blob gravado:" if created else "Conteúdo já armazenado (deduplicado):", blob_name)
+        return blob_name, created
+
+    def link(self, source: str, blob_name: str):
+        """Associa a origem ao blob; se a origem apontava para outro blob sem outras referências, ele é removido."""
+        with self._locked_index() as index:
+            previous = index.get(source)
+            index[source] = blob_name
+        if previous and previous != blob_name:
+            self._remove_if_unreferenced(previous)
+
+    def unlink(self, source: str) -> Optional[str]:
+        """Remove a origem do índice e apaga o blob se nenhuma outra origem o referencia. Retorna o blob removido."""
+        with self._locked_index() as index:
+            blob_name = index.pop(source, None)
+        if blob_name and self._remove_if_unreferenced(blob_name):
+            return blob_name
+        return None
+
+    def release(self, blob_name: str) -> bool:
+        """Apaga um blob gravado sem origem (ex: nova versão descartada) se nenhuma origem o referencia."""
+        return self._remove_if_unreferenced(blob_name)
+
+    def blob_for(self, source: str) -> Optional[str]:
+        return self._read_index().get(source)
+
+    def _remove_if_unreferenced(self, blob_name: str) -> bool:
+        with self._locked_index() as index:
+            if blob_name in index.values():
+                return False
+            try:
+                os.remove(self.path(blob_name))
+            except FileNotFoundError:
+                pass
+        logger.info("[STORAGE] Blob sem referências removido: %s", blob_name)
+        return True
+
+    def _read_index(self) -> Dict[str, str]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    @contextmanager
+    def _locked_index(self):
+        """Lê o índice sob lock exclusivo e o regrava (atomicamente) ao final do bloco."""
+        with self._lock, open(os.path.join(self.root, LOCK_FILE_NAME), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                index = self._read_index()
+                before = dict(index)
+                yield index
+                if index != before:
+                    temp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+                    with open(temp_path, "w", encoding="utf-8") as f:
+                        json.dump(index, f, ensure_ascii=False, indent=1)
+                    os.replace(temp_path, self.index_path)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+_stores: Dict[str, ContentStore] = {}
+_stores_lock = threading.Lock()
+
+def get_content_store(root: str = STORAGE_DIR) -> ContentStore:
+    """Instância única do ContentStore por diretório."""
+    root = os.path.abspath(root)
+    with _stores_lock:
+        if root not in _stores:
+            _stores[root] = ContentStore(root)
+        return _stores[root]
+
+class ContentStaticFiles(StaticFiles):
+    """
+    Serve os arquivos do armazenamento em /files. Blobs endereçados pelo conteúdo nunca mudam:
+    são servidos com Cache-Control immutable e ETag igual ao SHA-256, permitindo cache em
+    navegadores e proxies. Arquivos antigos (nomes aleatórios) são revalidados a cada acesso.
+    Requisições parciais (Range), usadas pelos visualizadores de PDF, são atendidas pelo FileResponse.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if isinstance(response, NotModifiedResponse):
+            return response
+        name = os.path.basename(full_path)
+        if BLOB_NAME_PATTERN.match(name):
+            response.headers["etag"] = f'"{name[:-len(".pdf")]}"'
+            response.headers["cache-control"] = "public, max-age=31536000, immutable"
+            if self.is_not_modified(response.headers, Headers(scope=scope)):
+                return NotModifiedResponse(response.headers)
+        else:
+            response.headers["cache-control"] = "no-cache"
+        return response
+
+    def lookup_path(self, path: str):
+        # Arquivos e diretórios internos (índice, lock, uploads em andamento, perfis) não são servidos
+        if any(part.startswith(".") for part in path.replace(os.sep, "/").split("/")):
+            return "", None
+        return super().lookup_path(path)